@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Gunshot Benchmark - Per-block cost of the real-time path, checked against the block period.
+
+Drives the logger's own code with synthetic 48 kHz stereo blocks: the
+capture ring, the envelope level/trigger front end, the audio callback in
+both analysis modes, audio validation and saving an event to the spool.
+Callbacks get the replay module's stand-ins for sounddevice's time and
+status arguments, and every file goes to a temp directory, so no audio
+hardware or USB drive is needed. Each path is timed per block, then run
+again under tracemalloc for the bytes it allocates per block. Both are
+checked against budgets derived from the block period (BUFFER_SIZE /
+SAMPLE_RATE, 21.3 ms for 1024 frames at 48 kHz); the exit status is 1 if
+any path is over budget.
+
+--pi3 approximates a Raspberry Pi 3: the run is pinned to one core and the
+measured times are scaled by PI3_SLOWDOWN before they are compared with the
+budgets. It is a projection, not a measurement; run on the Pi itself for
+real numbers.
+
+Usage:
+    python3 gunshot_benchmark.py
+    python3 gunshot_benchmark.py --pi3 --blocks 2000
+    python3 gunshot_benchmark.py --format int16 --json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import CONFIG, CircularBuffer, DetectionEvent, EnvelopeFrontEnd, GunshotLogger
+from gunshot_devices import synthetic_session
+from gunshot_replay import ReplayCallbackFlags, ReplayTimeInfo
+
+# A Cortex-A53 at 1.2 GHz runs this numpy-heavy path roughly this many times slower than a desktop core
+PI3_SLOWDOWN = 8.0
+
+# Per-block budgets: (share of the block period the p99 time may take, bytes allocated per block).
+# Callback paths run once per block and must leave the period to everything else on the device;
+# validation and saving run on the writer thread and are costed per block of event audio.
+BUDGETS = {
+    'ring_write': (0.01, 1024),
+    'envelope': (0.05, 4096),
+    'callback': (0.10, 4096),
+    'callback_queued': (0.02, 1024),
+    'validate': (0.02, 64 * 1024),
+    'save_event': (0.25, 256 * 1024),
+}
+
+DESCRIPTIONS = {
+    'ring_write': "CircularBuffer.write of one block",
+    'envelope': "EnvelopeFrontEnd.process (block level and trigger window)",
+    'callback': "audio_callback with detection in the callback",
+    'callback_queued': "audio_callback handing blocks to the analysis thread",
+    'validate': "validate_audio_data on a saved event, per block of audio",
+    'save_event': "save_gunshot to the spool with sidecar and onsets, per block of audio",
+}
+
+EVENT_SECONDS = 2.0
+
+
+def session_blocks(seconds, shot_every, seed=0):
+    """Synthetic session in the logger's sample format, split into BUFFER_SIZE blocks"""
+    rate, block_size = CONFIG['SAMPLE_RATE'], CONFIG['BUFFER_SIZE']
+    audio = synthetic_session(seconds, np.arange(shot_every / 2, seconds, shot_every), rate, CONFIG['CHANNELS'], seed)
+    if np.dtype(CONFIG['SAMPLE_FORMAT']) == np.int16:
+        audio = (audio * 32768).astype(np.int16)
+    return [audio[start:start + block_size] for start in range(0, len(audio) - block_size + 1, block_size)]
+
+
+def measure_time(call, count, between=None):
+    """ns taken by each of count calls; between(i), if given, runs untimed before call i"""
+    perf_counter_ns = time.perf_counter_ns
+    elapsed = np.zeros(count, dtype=np.int64)
+    for i in range(count):
+        if between is not None:
+            between(i)
+        started = perf_counter_ns()
+        call(i)
+        elapsed[i] = perf_counter_ns() - started
+    return elapsed
+
+
+def measure_allocations(call, count, between=None):
+    """Mean bytes allocated per call (tracemalloc peak above the level before it), and bytes kept per call"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        allocated = 0
+        for i in range(count):
+            if between is not None:
+                between(i)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call(i)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return allocated / count, retained / count
+
+
+def make_logger(directory):
+    """A logger writing only into directory, quiet below warnings, including its setup messages"""
+    CONFIG['LOG_FILE'] = str(Path(directory) / 'gunshot_detection.log')
+    CONFIG['SPOOL_DIR'] = str(Path(directory) / 'spool')
+    CONFIG['BLACKBOX_DIR'] = str(Path(directory) / 'blackbox')
+    CONFIG['METRICS_FILE'] = None
+    CONFIG['CONFIG_FILE'] = None
+    logging.disable(logging.INFO)
+    try:
+        logger = GunshotLogger(directory, verify_mount=False)
+    finally:
+        logging.disable(logging.NOTSET)
+    logger.logger.setLevel(logging.WARNING)
+    return logger
+
+
+def callback_benchmark(directory, blocks, analysis_thread):
+    """(call, between, frames per call, cleanup) for audio_callback over the session, looped"""
+    CONFIG['ANALYSIS_THREAD'] = analysis_thread
+    logger = make_logger(directory)
+    time_info, flags = ReplayTimeInfo(0.0), ReplayCallbackFlags()
+    block_size = len(blocks[0])
+
+    def call(i):
+        time_info.inputBufferAdcTime = time_info.currentTime = i * block_size / CONFIG['SAMPLE_RATE']
+        logger.audio_callback(blocks[i % len(blocks)], block_size, time_info, flags)
+
+    def between(i):
+        # Events are only queued here; let go of them so the detection queue never fills
+        while not logger.detection_queue.empty():
+            logger.detection_queue.release(logger.detection_queue.get_nowait())
+        # and stand in for the analysis thread, taking each queued block off the block ring
+        while analysis_thread and logger.block_ring.pending():
+            logger.block_ring.release()
+
+    return call, between, block_size, logger.log_handler.stop_writer
+
+
+def event_benchmark(directory, blocks, name):
+    """(call, between, frames per call, cleanup) for validating or saving an event from a filled ring"""
+    CONFIG['ANALYSIS_THREAD'] = False
+    logger = make_logger(directory)
+    block_size = len(blocks[0])
+    frames = int(EVENT_SECONDS * CONFIG['SAMPLE_RATE']) // block_size * block_size
+    for block in blocks[:frames // block_size]:
+        logger.buffer.write(block.reshape(-1))
+    audio = logger.buffer.read_frames(0, frames)
+
+    if name == 'validate':
+        def call(i):
+            logger.validate_audio_data(audio)
+    else:
+        def call(i):
+            event = DetectionEvent(0, frames, frames // 4, time.time(), -10.0)
+            event.closed = True
+            logger.save_gunshot(event)
+
+    return call, None, frames, logger.log_handler.stop_writer
+
+
+def setup(name, directory, blocks):
+    """(call, between, frames per call, cleanup) for the named benchmark"""
+    block_size = len(blocks[0])
+    if name == 'ring_write':
+        ring = CircularBuffer(CONFIG['CAPTURE_RING_DURATION'], CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'],
+                              np.dtype(CONFIG['SAMPLE_FORMAT']))
+        return lambda i: ring.write(blocks[i % len(blocks)].reshape(-1)), None, block_size, None
+    if name == 'envelope':
+        envelope = EnvelopeFrontEnd(block_size, CONFIG['CHANNELS'], np.dtype(CONFIG['SAMPLE_FORMAT']),
+                                    hop=CONFIG['ENVELOPE_HOP'], window=CONFIG['TRIGGER_WINDOW_FRAMES'])
+        return lambda i: envelope.process(blocks[i % len(blocks)]), None, block_size, None
+    if name in ('callback', 'callback_queued'):
+        return callback_benchmark(directory, blocks, name == 'callback_queued')
+    return event_benchmark(directory, blocks, name)
+
+
+def run_benchmarks(blocks=1000, slowdown=1.0, names=None, budgets=None):
+    """Run the benchmarks and return one result dict each, checked against budgets (default BUDGETS)
+
+    Event benchmarks run one call per EVENT_SECONDS of audio, so they take
+    about blocks / 100 calls. Times are multiplied by slowdown before they
+    are checked. CONFIG is left as it was found.
+    """
+    budgets = budgets or BUDGETS
+    block_period_ns = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE'] * 1e9
+    # The benchmarks point CONFIG at temporary directories that are gone by the time they return
+    saved_config = dict(CONFIG)
+    session = session_blocks(10.0, 4.0)
+    results = []
+    try:
+        for name in names or budgets:
+            share, byte_budget = budgets[name]
+            with tempfile.TemporaryDirectory(prefix='gunshot-bench-') as tmp:
+                call, between, frames, cleanup = setup(name, tmp, session)
+                calls = blocks if frames == CONFIG['BUFFER_SIZE'] else max(5, blocks // 100)
+                try:
+                    call(0)  # Warm up caches and lazily built state
+                    elapsed = measure_time(call, calls, between)
+                    allocated, retained = measure_allocations(call, min(calls, 200), between)
+                finally:
+                    if cleanup is not None:
+                        cleanup()
+
+            per_block = CONFIG['BUFFER_SIZE'] / frames
+            p50_ns, p99_ns = np.percentile(elapsed, [50, 99]) * per_block * slowdown
+            alloc_bytes = allocated * per_block
+            results.append({
+                'name': name,
+                'description': DESCRIPTIONS.get(name, name),
+                'calls': calls,
+                'ns_per_block': float(p50_ns),
+                'p99_ns_per_block': float(p99_ns),
+                'budget_ns': block_period_ns * share,
+                'alloc_bytes_per_block': float(alloc_bytes),
+                'retained_bytes_per_block': float(retained * per_block),
+                'budget_bytes': byte_budget,
+                'ok': bool(p99_ns <= block_period_ns * share and alloc_bytes <= byte_budget),
+            })
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+    return results
+
+
+def print_report(results, slowdown=1.0):
+    block_period_ms = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE'] * 1000
+    scaled = f", times scaled x{slowdown:g}" if slowdown != 1.0 else ""
+    print(f"Block period: {CONFIG['BUFFER_SIZE']} frames at {CONFIG['SAMPLE_RATE']} Hz = {block_period_ms:.1f} ms "
+          f"({CONFIG['SAMPLE_FORMAT']}, {CONFIG['CHANNELS']} channels{scaled})")
+    print(f"{'path':16s} {'p50 ns':>10s} {'p99 ns':>10s} {'budget ns':>10s} {'alloc B':>9s} {'budget B':>9s} "
+          f"{'kept B':>7s}")
+    for result in results:
+        flag = "ok" if result['ok'] else "OVER BUDGET"
+        print(f"{result['name']:16s} {result['ns_per_block']:10.0f} {result['p99_ns_per_block']:10.0f} "
+              f"{result['budget_ns']:10.0f} {result['alloc_bytes_per_block']:9.0f} {result['budget_bytes']:9d} "
+              f"{result['retained_bytes_per_block']:7.0f}  {flag}  {result['description']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-block cost of the real-time path")
+    parser.add_argument('--blocks', type=int, default=1000, help="Blocks to time per callback path")
+    parser.add_argument('--format', choices=['float32', 'int16'], help="Override SAMPLE_FORMAT")
+    parser.add_argument('--block-size', type=int, help="Override BUFFER_SIZE (frames per callback)")
+    parser.add_argument('--only', action='append', choices=list(BUDGETS), help="Run only this benchmark (repeatable)")
+    parser.add_argument('--pi3', action='store_true',
+                        help=f"Approximate a Raspberry Pi 3: one core, times scaled x{PI3_SLOWDOWN:g}")
+    parser.add_argument('--slowdown', type=float, help="Scale measured times by this factor before checking budgets")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.format is not None:
+        CONFIG['SAMPLE_FORMAT'] = args.format
+    if args.block_size is not None:
+        CONFIG['BUFFER_SIZE'] = args.block_size
+    slowdown = args.slowdown or 1.0
+    if args.pi3:
+        slowdown = args.slowdown or PI3_SLOWDOWN
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+
+    results = run_benchmarks(args.blocks, slowdown, args.only)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, slowdown)
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
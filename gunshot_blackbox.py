@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Gunshot Black Box - List and extract audio from the continuous recording.
+
+With BLACKBOX on, the logger records the whole capture stream into a ring
+of int16 segment files on local storage, and catalogues each event's
+position in it. Minutes around an event are extracted by slicing the
+segments; nothing is re-recorded. Frames the ring no longer holds (or never
+recorded, across a restart) come out as silence so times stay true.
+
+Usage:
+    python3 gunshot_blackbox.py blackbox list
+    python3 gunshot_blackbox.py blackbox extract --event 12 --catalog /media/pi/gunshot-logger --before 120 --after 120 -o incident.wav
+    python3 gunshot_blackbox.py blackbox extract --at "2024-06-01 14:03:12" --before 60 --after 60 -o incident.wav
+"""
+
+import sys
+import argparse
+import datetime
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import WavStreamWriter, blackbox_segments
+from gunshot_catalog import CATALOG_FILE, EventCatalog, parse_time
+
+
+def read_blackbox(directory, start, end):
+    """Positions [start, end) as (frames, channels) int16 audio, sample rate and frames missing
+
+    Raises ValueError if the directory holds no segments.
+    """
+    segments = {header['sequence']: header for header in blackbox_segments(directory)}
+    if not segments:
+        raise ValueError(f"No black box segments in {directory}")
+    first = next(iter(segments.values()))
+    segment_frames, channels = first['segment_frames'], first['channels']
+
+    start = max(0, start)
+    audio = np.zeros((max(0, end - start), channels), dtype=np.int16)
+    missing = len(audio)
+    for sequence in range(start // segment_frames, (end - 1) // segment_frames + 1):
+        header = segments.get(sequence)
+        if header is None:
+            continue
+        base = sequence * segment_frames
+        low = max(start, base)
+        high = min(end, base + header['frames'])
+        if high <= low:
+            continue
+        offset = header['data_offset'] + (low - base) * channels * 2
+        samples = np.fromfile(header['path'], dtype='<i2', count=(high - low) * channels, offset=offset)
+        audio[low - start:high - start] = samples.reshape(-1, channels)
+        missing -= high - low
+    return audio, first['sample_rate'], missing
+
+
+def position_at(directory, timestamp):
+    """Black box position recorded at a unix time, or None if no segment covers it"""
+    for header in blackbox_segments(directory):
+        offset = round((timestamp - header['start_time']) * header['sample_rate'])
+        if 0 <= offset < header['frames']:
+            return header['sequence'] * header['segment_frames'] + offset
+    return None
+
+
+def list_segments(directory):
+    for header in blackbox_segments(directory):
+        stamp = datetime.datetime.fromtimestamp(header['start_time']).isoformat(sep=' ', timespec='seconds')
+        position = header['sequence'] * header['segment_frames']
+        print(f"{stamp}  segment {header['sequence']:6d}  {header['frames'] / header['sample_rate']:6.1f}s  "
+              f"frames {position}-{position + header['frames']}  {header['path'].name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or extract audio from the black box recording")
+    parser.add_argument('directory', help="Black box directory (BLACKBOX_DIR)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Segments held, oldest first")
+
+    extract = subparsers.add_parser('extract', help="Write the audio around a position to a WAV file")
+    where = extract.add_mutually_exclusive_group(required=True)
+    where.add_argument('--frame', type=int, help="Black box position")
+    where.add_argument('--at', type=parse_time, help="Time (ISO date/time or unix seconds)")
+    where.add_argument('--event', type=int, help="Event number, looked up in --catalog")
+    extract.add_argument('--catalog', help="USB drive root holding the event catalog (for --event)")
+    extract.add_argument('--device', help="Device id, in multi-device mode")
+    extract.add_argument('--before', type=float, default=60.0, help="Seconds before the position")
+    extract.add_argument('--after', type=float, default=60.0, help="Seconds after the position (after the event's end for --event)")
+    extract.add_argument('-o', '--output', required=True, help="WAV file to write")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_segments(args.directory)
+        return
+
+    segments = blackbox_segments(args.directory)
+    if not segments:
+        sys.exit(f"No black box segments in {args.directory}")
+    sample_rate = segments[0]['sample_rate']
+    length = 0
+    if args.event is not None:
+        if not args.catalog:
+            sys.exit("--event needs --catalog")
+        catalog = EventCatalog()
+        catalog.open(Path(args.catalog) / CATALOG_FILE)
+        rows = [row for row in catalog.query(number=args.event, device=args.device) if row['blackbox_frame'] is not None]
+        catalog.close()
+        if not rows:
+            sys.exit(f"No event {args.event} with a black box position in the catalog")
+        position = rows[0]['blackbox_frame']
+        length = round(rows[0]['duration'] * sample_rate)
+    elif args.at is not None:
+        position = position_at(args.directory, args.at)
+        if position is None:
+            sys.exit("The black box holds no audio from that time")
+    else:
+        position = args.frame
+
+    start = position - round(args.before * sample_rate)
+    end = position + length + round(args.after * sample_rate)
+    audio, sample_rate, missing = read_blackbox(args.directory, start, end)
+    with WavStreamWriter(args.output, sample_rate, audio.shape[1]) as writer:
+        writer.write(audio.reshape(-1))
+    print(f"Wrote {len(audio) / sample_rate:.1f}s to {args.output}"
+          f"{f' ({missing / sample_rate:.1f}s not in the black box, silent)' if missing else ''}")
+
+
+if __name__ == "__main__":
+    main()
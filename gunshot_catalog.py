@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Gunshot Catalog - Indexed SQLite record of every saved detection.
+
+The catalog lives on the USB drive next to the gunshots directory. Rows are
+appended in batches as events land on the drive, and can be rebuilt from the
+audio files if the database is lost.
+
+Usage:
+    python3 gunshot_catalog.py /media/pi/gunshot-logger query --since "2024-06-01 14:00" --until "2024-06-01 15:00" --min-db -10
+    python3 gunshot_catalog.py /media/pi/gunshot-logger count --min-db -10
+    python3 gunshot_catalog.py /media/pi/gunshot-logger rebuild
+"""
+
+import re
+import sys
+import json
+import wave
+import sqlite3
+import argparse
+import datetime
+import threading
+from pathlib import Path
+import numpy as np
+
+try:
+    import soundfile
+except (ImportError, OSError):
+    # Optional: only needed to rebuild rows for FLAC files
+    soundfile = None
+
+CATALOG_FILE = 'gunshot_events.sqlite'
+GUNSHOT_DIR = 'gunshots'
+
+# Column name -> SQL type. New columns are added to existing catalogs on open.
+COLUMNS = {
+    'number': 'INTEGER',            # N in gunshot_NNN
+    'trigger_time': 'REAL',         # Unix time of the trigger sample
+    'trigger_frame': 'INTEGER',     # Absolute frame of the trigger in the capture stream
+    'start_time': 'REAL',           # Unix time of the first saved sample
+    'duration': 'REAL',             # Seconds of audio saved
+    'peak_db': 'REAL',              # Loudest block level during the event
+    'buffer_db': 'REAL',            # RMS level of the whole saved event
+    'trigger_count': 'INTEGER',     # Triggers coalesced into the event
+    'shot_count': 'INTEGER',        # Reports found in the saved audio by onset detection
+    'onsets': 'TEXT',               # JSON list of report offsets in frames from the start of the file
+    'channel_db': 'TEXT',           # JSON list of per-channel RMS levels
+    'sample_rate': 'INTEGER',
+    'channels': 'INTEGER',
+    'device': 'TEXT',               # Input device id in multi-device mode
+    'tdoa': 'TEXT',                 # JSON list of inter-channel arrival delays (seconds, per channel pair)
+    'bearing': 'REAL',              # Degrees from broadside of the channel 0/1 mic pair
+    'lane': 'TEXT',                 # Lane the shot was attributed to
+    'device_delay': 'REAL',         # Multi-device mode: arrival after the first device that heard the shot
+    'blackbox_frame': 'INTEGER',    # Black box position of the first saved sample, if recording continuously
+    'gap_frames': 'INTEGER',        # Frames the stream missed inside the event while it was being reopened
+    'file_path': 'TEXT',            # Relative to the USB drive root
+    'file_size': 'INTEGER',
+}
+
+# When an event happened. Rebuilt rows have no trigger time, so fall back to
+# the start time; the expression index only serves queries that spell it exactly so.
+EVENT_TIME = 'coalesce(trigger_time, start_time)'
+
+FILE_NAME = re.compile(r'gunshot_(\d+)(?:_([A-Za-z0-9-]+))?(?:\.|$)')
+
+def file_number(path):
+    """The N in gunshot_NNN[_device].ext, or None"""
+    match = FILE_NAME.match(Path(path).name)
+    return int(match.group(1)) if match else None
+
+def file_device(path):
+    """The device id in gunshot_NNN_device.ext, or None"""
+    match = FILE_NAME.match(Path(path).name)
+    return match.group(2) if match else None
+
+def level_db(rms):
+    return float(20 * np.log10(rms + 1e-10))
+
+def read_audio_file(path):
+    """Read a saved WAV or FLAC event as (int16 (frames, channels) audio, sample_rate)"""
+    path = Path(path)
+    if path.suffix == '.flac':
+        if soundfile is None:
+            raise RuntimeError("soundfile is needed to read FLAC files")
+        audio, sample_rate = soundfile.read(str(path), dtype='int16', always_2d=True)
+        return audio, sample_rate
+    with wave.open(str(path), 'rb') as wav:
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').reshape(-1, channels)
+    return audio, sample_rate
+
+def describe_audio_file(path):
+    """Build a catalog row from an audio file alone (used for rebuilds and orphaned files)
+
+    Times come from the file's modification time, so they are only as
+    accurate as the filesystem clock; events saved by the logger carry
+    sample-accurate times instead.
+    """
+    path = Path(path)
+    audio, sample_rate = read_audio_file(path)
+
+    levels = audio.astype(np.float32) / 32768
+    channel_rms = np.sqrt(np.mean(np.square(levels), axis=0)) if len(levels) else np.zeros(audio.shape[1])
+    # Loudest 1024-frame block, like the detector's block level
+    blocks = levels[:len(levels) // 1024 * 1024].reshape(-1, 1024 * audio.shape[1])
+    peak_rms = np.sqrt(np.mean(np.square(blocks), axis=1)).max() if len(blocks) else np.sqrt(np.mean(np.square(levels)))
+    duration = len(audio) / sample_rate
+    end_time = path.stat().st_mtime
+
+    return {
+        'number': file_number(path),
+        'trigger_time': None,
+        'trigger_frame': None,
+        'start_time': end_time - duration,
+        'duration': duration,
+        'peak_db': level_db(peak_rms),
+        'buffer_db': level_db(np.sqrt(np.mean(np.square(channel_rms)))),
+        'trigger_count': None,
+        'channel_db': json.dumps([round(level_db(rms), 2) for rms in channel_rms]),
+        'sample_rate': sample_rate,
+        'channels': audio.shape[1],
+        'device': file_device(path),
+        'file_size': path.stat().st_size,
+    }
+
+class EventCatalog:
+    """SQLite catalog of saved events, indexed by time and level
+
+    The database is opened lazily at a path on the USB drive and closed when
+    the drive goes away. insert_many() writes a whole batch in one
+    transaction; rows only go away when retention deletes their events.
+    """
+    def __init__(self):
+        self.path = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        """Open (or create) the catalog at path, closing any other one"""
+        path = Path(path)
+        with self._lock:
+            if self._conn is not None and self.path == path:
+                return
+            self._close()
+            conn = sqlite3.connect(str(path), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # WAL keeps each batch commit to a couple of sequential writes on flash
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(conn)
+            self._conn = conn
+            self.path = path
+
+    def _create_schema(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY)')
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(events)')}
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE events ADD COLUMN {name} {sql_type}')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_events_file ON events(file_path)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_events_time ON events(trigger_time)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_time)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_events_event_time ON events({EVENT_TIME})')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_events_level ON events(peak_db)')
+        conn.commit()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self.path = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def insert_many(self, rows):
+        """Append a batch of rows (dicts keyed by COLUMNS) in one transaction"""
+        if not rows:
+            return
+        names = list(COLUMNS)
+        sql = (f"INSERT OR IGNORE INTO events ({', '.join(names)}) "
+               f"VALUES ({', '.join('?' for _ in names)})")
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, [[row.get(name) for name in names] for row in rows])
+
+    def update_many(self, rows):
+        """Set columns of existing rows, matched by file_path, in one transaction"""
+        with self._lock:
+            with self._conn:
+                for row in rows:
+                    names = [name for name in row if name != 'file_path']
+                    if not all(name in COLUMNS for name in names):
+                        raise ValueError(f"Unknown catalog column in {names}")
+                    self._conn.execute(
+                        f"UPDATE events SET {', '.join(f'{name} = ?' for name in names)} WHERE file_path = ?",
+                        [row[name] for name in names] + [row['file_path']]
+                    )
+
+    def delete_many(self, file_paths):
+        """Remove the rows of deleted files in one transaction"""
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('DELETE FROM events WHERE file_path = ?', [(path,) for path in file_paths])
+
+    def storage_rows(self):
+        """(file_path, file_size, time, shot_count) of every event, oldest first, for retention"""
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT file_path, file_size, {EVENT_TIME} AS t, shot_count '
+                f'FROM events ORDER BY {EVENT_TIME}'
+            ).fetchall()
+
+    def max_number(self):
+        with self._lock:
+            row = self._conn.execute('SELECT max(number) FROM events').fetchone()
+        return row[0]
+
+    def _where(self, since=None, until=None, min_db=None, max_db=None, **filters):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append(f'{EVENT_TIME} >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append(f'{EVENT_TIME} < ?')
+            params.append(until)
+        if min_db is not None:
+            clauses.append('peak_db >= ?')
+            params.append(min_db)
+        if max_db is not None:
+            clauses.append('peak_db < ?')
+            params.append(max_db)
+        for name, value in filters.items():
+            if value is not None:
+                if name not in COLUMNS:
+                    raise ValueError(f"Unknown catalog column: {name}")
+                clauses.append(f'{name} = ?')
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, since=None, until=None, min_db=None, max_db=None, limit=None, **filters):
+        """Return matching events as dicts, oldest first"""
+        where, params = self._where(since, until, min_db, max_db, **filters)
+        sql = f'SELECT * FROM events{where} ORDER BY {EVENT_TIME}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def count(self, since=None, until=None, min_db=None, max_db=None, **filters):
+        where, params = self._where(since, until, min_db, max_db, **filters)
+        with self._lock:
+            return self._conn.execute(f'SELECT count(*) FROM events{where}', params).fetchone()[0]
+
+    def rebuild(self, root, gunshot_dir=GUNSHOT_DIR):
+        """Add rows for every audio file under root/gunshot_dir not already catalogued
+
+        Returns the number of files added.
+        """
+        root = Path(root)
+        with self._lock:
+            known = {row[0] for row in self._conn.execute('SELECT file_path FROM events')}
+        rows = []
+        for path in sorted((root / gunshot_dir).rglob('gunshot_*')):
+            if path.suffix not in ('.wav', '.flac'):
+                continue
+            relative = str(path.relative_to(root))
+            if relative in known:
+                continue
+            try:
+                row = describe_audio_file(path)
+            except Exception as e:
+                print(f"Skipping {path}: {e}", file=sys.stderr)
+                continue
+            row['file_path'] = relative
+            rows.append(row)
+        self.insert_many(rows)
+        return len(rows)
+
+
+def parse_time(value):
+    """Accept unix seconds or an ISO-style local date/time"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def format_row(row):
+    event_time = row['trigger_time'] or row['start_time']
+    stamp = datetime.datetime.fromtimestamp(event_time).isoformat(sep=' ', timespec='milliseconds')
+    device = f"[{row['device']}]  " if row.get('device') else ""
+    lane = f"lane {row['lane']}  " if row.get('lane') else ""
+    return (f"{stamp}  {device}{lane}{row['peak_db']:6.1f} dB  {row['duration']:5.2f}s  "
+            f"{row['file_path']}  ({row['file_size']} bytes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the gunshot event catalog")
+    parser.add_argument('root', help="USB drive root (directory holding the catalog)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('query', 'count'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--since', type=parse_time, help="Start time (ISO date/time or unix seconds)")
+        sub.add_argument('--until', type=parse_time, help="End time (ISO date/time or unix seconds)")
+        sub.add_argument('--min-db', type=float, help="Minimum peak level")
+        sub.add_argument('--max-db', type=float, help="Maximum peak level")
+        sub.add_argument('--device', help="Only events from this input device")
+        sub.add_argument('--lane', help="Only events attributed to this lane")
+        if name == 'query':
+            sub.add_argument('--limit', type=int)
+            sub.add_argument('--json', action='store_true', help="Print rows as JSON lines")
+
+    subparsers.add_parser('rebuild', help="Add rows for audio files missing from the catalog")
+    args = parser.parse_args()
+
+    catalog = EventCatalog()
+    catalog.open(Path(args.root) / CATALOG_FILE)
+
+    if args.command == 'rebuild':
+        added = catalog.rebuild(args.root)
+        print(f"Added {added} events, catalog now holds {catalog.count()}")
+    elif args.command == 'count':
+        print(catalog.count(args.since, args.until, args.min_db, args.max_db, device=args.device, lane=args.lane))
+    else:
+        for row in catalog.query(args.since, args.until, args.min_db, args.max_db, args.limit,
+                                 device=args.device, lane=args.lane):
+            print(json.dumps(row) if args.json else format_row(row))
+
+if __name__ == "__main__":
+    main()
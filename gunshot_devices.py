@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Gunshot Devices - Multi-device capture with one worker process per input device.
+
+Each input device (I2S or USB microphone array) gets its own capture and
+detection process, pinned to its own core so the streams do not share a GIL.
+Workers write audio into shared-memory rings owned by a supervisor process
+and send it finished events as frame ranges; the supervisor saves them
+through the usual spool and catalog, tagged with the device id.
+
+Usage:
+    python3 gunshot_devices.py /media/pi/gunshot-logger --device lane1=hw:1,0 --device lane2=hw:2,0
+    python3 gunshot_devices.py /tmp/gunshot-test --synthetic 3 --duration 10   # synthetic devices, no hardware
+"""
+
+import os
+import re
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import (
+    ArrivalEstimator, CONFIG, CircularBuffer, ConfigError, DetectionEvent, GunshotLogger, check_event_settings,
+    read_config_file, sd,
+)
+from gunshot_replay import ReplayCallbackFlags, ReplayTimeInfo
+
+DEVICE_ID = re.compile(r'^[A-Za-z0-9-]+$')
+# Settings MultiDeviceLogger.worker_config() sets for every worker, whatever the config file says
+WORKER_KEYS = frozenset({'STREAM_EVENTS', 'ANALYSIS_THREAD', 'METRICS_FILE', 'ARRIVAL_ANALYSIS', 'SPOOL_DIR', 'BLACKBOX_DIR'})
+
+
+class SharedCircularBuffer(CircularBuffer):
+    """CircularBuffer whose samples and write counter live in shared memory
+
+    The supervisor creates one per device (name=None) and the device's
+    worker process attaches to it by name. Only the worker writes; the
+    claim counter is updated before the samples and the write counter
+    after them, and readers only copy ranges that are already behind it.
+    """
+    HEADER_BYTES = 64
+
+    def __init__(self, duration, sample_rate, channels, dtype=np.float32, name=None):
+        self.channels = channels
+        self.size = int(duration * sample_rate * channels)
+        dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.HEADER_BYTES + self.size * dtype.itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # Samples written, then samples claimed by the write in progress
+        self._counter = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((self.size,), dtype=dtype, buffer=self.shm.buf, offset=self.HEADER_BYTES)
+        written = self.total_samples_written
+        self.index = written % self.size
+        self.is_full = written >= self.size
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def total_samples_written(self):
+        return int(self._counter[0])
+
+    @total_samples_written.setter
+    def total_samples_written(self, value):
+        self._counter[0] = value
+
+    @property
+    def samples_claimed(self):
+        return int(self._counter[1])
+
+    @samples_claimed.setter
+    def samples_claimed(self, value):
+        self._counter[1] = value
+
+    def available(self):
+        # index/is_full are only kept by the writing process
+        return min(self.total_samples_written, self.size)
+
+    def close(self):
+        """Detach from the ring, and free it if this process created it"""
+        self.data = None
+        self._counter = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still alive somewhere; the mapping goes away with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def synthetic_session(duration, shot_times, sample_rate, channels, seed=0):
+    """Quiet noise with a loud burst at each shot time, as float32 frames"""
+    rng = np.random.default_rng(seed)
+    audio = (rng.standard_normal((int(duration * sample_rate), channels)) * 0.002).astype(np.float32)
+    for shot_time in shot_times:
+        start = int(shot_time * sample_rate)
+        burst = audio[start:start + 2000]
+        burst += (rng.standard_normal(burst.shape) * 0.6).astype(np.float32)
+    return np.clip(audio, -1.0, 32767 / 32768)
+
+
+class SyntheticInputStream:
+    """Stand-in for sd.InputStream that plays a synthetic session in real time
+
+    Blocks are delivered from a thread, paced by the wall clock (speed > 1
+    plays faster). The stream goes inactive once the session has played.
+    """
+    def __init__(self, samplerate, blocksize, channels, dtype, callback,
+                 duration=10.0, shot_times=(), speed=1.0, seed=0):
+        audio = synthetic_session(duration, shot_times, samplerate, channels, seed)
+        if np.dtype(dtype) == np.int16:
+            audio = (audio * 32768).astype(np.int16)
+        self.audio = audio
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.speed = speed
+        self._stop = threading.Event()
+        self.thread = None
+
+    @property
+    def active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        flags = ReplayCallbackFlags()
+        started = time.monotonic()
+        for start in range(0, len(self.audio), self.blocksize):
+            stream_time = start / self.samplerate
+            delay = started + stream_time / self.speed - time.monotonic()
+            if self._stop.wait(max(delay, 0)):
+                return
+            block = self.audio[start:start + self.blocksize]
+            self.callback(block, len(block), ReplayTimeInfo(stream_time), flags)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class DeviceWorker(GunshotLogger):
+    """Capture and detection for one input device, run in its own process
+
+    Blocks go into the shared-memory ring the supervisor created for this
+    device, and finished events are sent to the supervisor as frame ranges.
+    The worker never writes to the spool or the USB drive, so it builds none
+    of the storage side (see setup_storage()).
+    """
+    def __init__(self, device_id, ring_name, event_queue, scratch_dir):
+        self.device_id = device_id
+        self.ring_name = ring_name
+        self.event_queue = event_queue
+        super().__init__(scratch_dir, verify_mount=False)
+
+    def setup_storage(self, verify_mount=True):
+        # The supervisor owns the mount watcher, catalog, retention, spool and encoder pool
+        self.mount_watcher = None
+        self.catalog = None
+        self.storage = None
+        self.spool = None
+        self.encoder = None
+        self.encoded_events = 0
+
+    def setup_logging(self):
+        super().setup_logging()
+        if CONFIG['LOG_FORMAT'] != 'json':
+            formatter = logging.Formatter(f'%(asctime)s - %(levelname)s - [{self.device_id}] %(message)s',
+                                          datefmt='%Y-%m-%d %H:%M:%S')
+            for handler in self.log_handler.handlers:
+                handler.setFormatter(formatter)
+
+    def create_capture_ring(self, duration):
+        return SharedCircularBuffer(duration, CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'],
+                                    self.sample_dtype, name=self.ring_name)
+
+    def next_file_number(self):
+        # Files are numbered by the supervisor
+        return 0
+
+    def file_settings(self):
+        # The supervisor's values of these stand, so they never count as changed
+        return {key: value for key, value in super().file_settings().items() if key not in WORKER_KEYS}
+
+    def capture_event(self, event):
+        """Send a finished event to the supervisor; the audio stays in the shared ring"""
+        if self.blackbox is not None:
+            event.blackbox_frame = self.blackbox.position(event.start_frame)
+        try:
+            self.event_queue.put_nowait((
+                self.device_id, event.start_frame, event.end_frame, event.trigger_frame,
+                event.trigger_time, float(event.peak_db), event.trigger_count, event.blackbox_frame
+            ))
+            self.queued_events += 1
+        except queue.Full:
+            self.dropped_events += 1
+            self.rate_limited_log('warning', "Supervisor event queue full, skipping detection", 'queue_full')
+
+    def open_stream(self, device):
+        if isinstance(device, dict):
+            return SyntheticInputStream(CONFIG['SAMPLE_RATE'], CONFIG['BUFFER_SIZE'], CONFIG['CHANNELS'],
+                                        self.sample_dtype, self.audio_callback, **device)
+        if sd is None:
+            raise RuntimeError("sounddevice/PortAudio is not available")
+        return sd.InputStream(
+            device=device,
+            channels=CONFIG['CHANNELS'],
+            samplerate=CONFIG['SAMPLE_RATE'],
+            blocksize=CONFIG['BUFFER_SIZE'],
+            latency=CONFIG['LATENCY'],
+            callback=self.audio_callback,
+            dtype=CONFIG['SAMPLE_FORMAT']
+        )
+
+    def run(self, device, stop_event):
+        """Capture until stop_event is set or the stream ends"""
+        self.running = True
+        if self.blackbox is not None:
+            self.blackbox.start()
+        with self.open_stream(device) as stream:
+            self.logger.info(f"🎤 Capturing from {device if not isinstance(device, dict) else 'synthetic device'}")
+            while not stop_event.wait(0.2) and stream.active:
+                self.check_startup()
+                self.check_config_reload()
+
+        # Hand over an event whose post-roll ran past the end of the stream
+        frames_written = self.buffer.frames_written
+        if self.event_capture.current is not None:
+            self.event_capture.current.end_frame = min(self.event_capture.current.end_frame, frames_written)
+            self.capture_event(self.event_capture.poll(frames_written))
+        if self.blackbox is not None:
+            self.blackbox.stop()
+        self.running = False
+        self.logger.info(f"Capture stopped after {frames_written} frames, {self.queued_events} events")
+        self.log_handler.stop_writer()
+
+
+def device_worker_main(device_id, device, ring_name, event_queue, stop_event, config, cpu):
+    """Entry point of a device worker process"""
+    CONFIG.update(config)
+    # The supervisor handles Ctrl-C and tells workers to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            pass
+    worker = DeviceWorker(device_id, ring_name, event_queue, CONFIG['SPOOL_DIR'])
+    worker.run(device, stop_event)
+
+
+def default_cpus(count):
+    """One core per device, leaving the first available core to the supervisor"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return [None] * count
+    available = sorted(os.sched_getaffinity(0))
+    if len(available) < 2:
+        return [None] * count
+    workers = available[1:]
+    return [workers[i % len(workers)] for i in range(count)]
+
+
+class MultiDeviceLogger(GunshotLogger):
+    """Supervisor for several input devices, one worker process each
+
+    The supervisor owns a shared-memory capture ring per device and saves
+    the events workers send it, reading their audio straight from the
+    device's ring. Saved files are named gunshot_NNN_<device> and catalogued
+    with the device id. All devices share SAMPLE_RATE, CHANNELS and
+    SAMPLE_FORMAT.
+    """
+    def __init__(self, devices, usb_mount_path=None, verify_mount=True, cpus=None):
+        self.devices = list(devices)
+        ids = [device_id for device_id, _ in self.devices]
+        if not ids or len(set(ids)) != len(ids) or not all(DEVICE_ID.match(i) for i in ids):
+            raise ValueError(f"Device ids must be unique and use only letters, digits and '-': {ids}")
+        self.rings = {}
+        super().__init__(usb_mount_path, verify_mount)
+
+        self.mp_context = multiprocessing.get_context('forkserver')
+        self.event_queue = self.mp_context.Queue(CONFIG['DEVICE_EVENT_QUEUE'])
+        self.stop_event = self.mp_context.Event()
+        self.cpus = cpus or default_cpus(len(self.devices))
+        self.workers = {}
+        # Each device's channels are folded to one for delays between devices
+        window = CONFIG['ARRIVAL_WINDOW']
+        self.device_arrival = ArrivalEstimator(window, 2, window // 4, len(self.devices))
+
+    def create_capture_ring(self, duration):
+        for device_id, _ in self.devices:
+            self.rings[device_id] = SharedCircularBuffer(
+                duration, CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'], self.sample_dtype
+            )
+        # The first device's ring stands in wherever a single ring is expected
+        return self.rings[self.devices[0][0]]
+
+    def ring_for(self, event):
+        return self.rings[event.device]
+
+    def create_blackbox(self):
+        # Each device worker records its own black box
+        return None
+
+    def worker_config(self, device_id):
+        """CONFIG for a worker process: detection in the callback, finished events only, no metrics"""
+        config = dict(CONFIG)
+        config.update({
+            'STREAM_EVENTS': False,
+            'ANALYSIS_THREAD': False,
+            'METRICS_FILE': None,
+            'ARRIVAL_ANALYSIS': False,
+            'SPOOL_DIR': str(Path(CONFIG['SPOOL_DIR']) / f"device-{device_id}"),
+            'BLACKBOX_DIR': str(Path(CONFIG['BLACKBOX_DIR']) / f"device-{device_id}"),
+        })
+        return config
+
+    def check_config_reload(self):
+        """Reload like GunshotLogger, but apply at once: there is no block path to wait for here
+
+        Workers watch the config file themselves.
+        """
+        super().check_config_reload()
+        while self.config_updates:
+            self.apply_settings(self.config_updates.popleft())
+
+    def next_batch(self, event):
+        # Give the other devices' events for the same shot time to arrive
+        time.sleep(CONFIG['DEVICE_GROUP_WAIT'])
+        return super().next_batch(event)
+
+    def shot_groups(self, events):
+        """Group events from different devices whose triggers are close enough to be one shot"""
+        groups = []
+        for event in sorted(events, key=lambda event: event.trigger_time):
+            group = groups[-1] if groups else None
+            if (group is not None
+                    and event.trigger_time - group[0].trigger_time <= CONFIG['DEVICE_MAX_DELAY']
+                    and all(other.device != event.device for other in group)):
+                group.append(event)
+            else:
+                groups.append([event])
+        return groups
+
+    def analyze_arrivals(self, events):
+        """Channel delays per device, then delays between devices; the first device to hear a shot is its lane
+
+        Trigger times line the devices' windows up to within a block or so;
+        GCC-PHAT between the windows refines that, so delays between devices
+        are only as good as the devices' ADC timestamps.
+        """
+        super().analyze_arrivals(events)
+        window = self.device_arrival.window
+        sample_rate = CONFIG['SAMPLE_RATE']
+        for group in self.shot_groups(events):
+            reference = group[0]
+            arrivals = [0.0] * len(group)
+            reference_audio = self.read_trigger_window(reference, window)
+            if len(group) > 1 and reference_audio is not None:
+                windows = self.device_arrival.windows
+                pairs = []
+                for i, event in enumerate(group[1:], start=1):
+                    audio = self.read_trigger_window(event, window)
+                    arrivals[i] = event.trigger_time - reference.trigger_time
+                    if audio is not None:
+                        windows[len(pairs), :, 0] = reference_audio.mean(axis=1)
+                        windows[len(pairs), :, 1] = audio.mean(axis=1)
+                        pairs.append(i)
+                lags = self.device_arrival.estimate(windows[:len(pairs)])[:, 0] / sample_rate
+                for i, lag in zip(pairs, lags):
+                    arrivals[i] += float(lag)
+
+            first = min(arrivals)
+            lane = group[arrivals.index(first)].device
+            for event, arrival in zip(group, arrivals):
+                event.arrival = dict(event.arrival or {}, lane=lane, device_delay=arrival - first)
+
+    def start_workers(self):
+        for (device_id, device), cpu in zip(self.devices, self.cpus):
+            process = self.mp_context.Process(
+                target=device_worker_main,
+                args=(device_id, device, self.rings[device_id].name, self.event_queue,
+                      self.stop_event, self.worker_config(device_id), cpu),
+                name=f"capture-{device_id}",
+                daemon=True
+            )
+            process.start()
+            self.workers[device_id] = process
+            self.logger.info(f"🎤 Device {device_id} capturing in process {process.pid}"
+                             f"{f' on core {cpu}' if cpu is not None else ''}")
+
+    def forward_events(self):
+        """Supervisor thread: queue the events workers send for saving"""
+        while True:
+            try:
+                message = self.event_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if message is None:
+                return
+            (device_id, start_frame, end_frame, trigger_frame, trigger_time, peak_db, trigger_count,
+             blackbox_frame) = message
+            event = DetectionEvent(start_frame, end_frame, trigger_frame, trigger_time, peak_db)
+            event.trigger_count = trigger_count
+            event.blackbox_frame = blackbox_frame
+            event.closed = True
+            event.device = device_id
+            self.capture_event(event)
+
+    def start(self):
+        """Start the workers and save their events until they stop"""
+        try:
+            self.running = True
+            self.mount_watcher.start()
+            self.spool.start()
+            self.storage.start()
+            if self.metrics_file is not None:
+                self.metrics_file.start()
+
+            self.worker_thread = threading.Thread(target=self.detection_worker, daemon=True)
+            self.worker_thread.start()
+            self.forward_thread = threading.Thread(target=self.forward_events, daemon=True)
+            self.forward_thread.start()
+
+            self.start_workers()
+            self.logger.info(f"🎯 Multi-device logger started with {len(self.devices)} devices")
+
+            reported = set()
+            while self.running and any(process.is_alive() for process in self.workers.values()):
+                time.sleep(0.5)
+                self.check_config_reload()
+                for device_id, process in self.workers.items():
+                    if not process.is_alive() and device_id not in reported:
+                        reported.add(device_id)
+                        if process.exitcode == 0:
+                            self.logger.info(f"Device {device_id} stream ended")
+                        else:
+                            self.logger.warning(f"⚠️  Device {device_id} worker exited (code {process.exitcode})")
+        except Exception as e:
+            self.logger.error(f"❌ Failed to start multi-device logger: {e}")
+            self.running = False
+
+    def stop(self):
+        """Stop the workers, save everything they sent, then shut down like GunshotLogger"""
+        self.stop_event.set()
+        for process in self.workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+        # Workers have flushed their queues on exit, so this lands after their last event
+        if hasattr(self, 'forward_thread'):
+            self.event_queue.put(None)
+            self.forward_thread.join()
+        deadline = time.monotonic() + 10
+        while not self.detection_queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        super().stop()
+        for ring in self.rings.values():
+            ring.close()
+
+
+def parse_device(value):
+    """'lane1=hw:1,0' -> ('lane1', 'hw:1,0'); numeric devices become ints"""
+    device_id, _, device = value.partition('=')
+    if not device:
+        raise argparse.ArgumentTypeError(f"Expected ID=DEVICE, got {value!r}")
+    return device_id, int(device) if device.isdigit() else device
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture from several input devices, one process each")
+    parser.add_argument('usb_path', help="USB drive mount point (or any directory with --synthetic)")
+    parser.add_argument('--device', action='append', type=parse_device, default=[],
+                        help="ID=DEVICE, where DEVICE is a sounddevice index or name (repeatable)")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Add this many synthetic devices that play noise and shots")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds each synthetic device plays")
+    parser.add_argument('--speed', type=float, default=1.0, help="Synthetic playback speed")
+    args = parser.parse_args()
+
+    devices = list(args.device)
+    for i in range(args.synthetic):
+        # Spread a few shots over the session, different on every device
+        shots = [t for t in np.arange(1.0 + i * 0.7, args.duration - 1.5, 3.0)]
+        devices.append((f"synthetic{i + 1}", {
+            'duration': args.duration, 'shot_times': shots, 'speed': args.speed, 'seed': i
+        }))
+    if not devices:
+        parser.error("Give at least one --device or --synthetic")
+
+    # Before the workers start, so the settings they are handed include it
+    if CONFIG['CONFIG_FILE'] and Path(CONFIG['CONFIG_FILE']).exists():
+        try:
+            CONFIG.update(read_config_file(CONFIG['CONFIG_FILE']))
+            check_event_settings(CONFIG)
+        except ConfigError as e:
+            parser.error(str(e))
+
+    logger = MultiDeviceLogger(devices, args.usb_path, verify_mount=not args.synthetic)
+    signal.signal(signal.SIGHUP, logger.request_config_reload)
+    try:
+        logger.start()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        logger.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,83 +6,1918 @@ Designed to run on a Raspberry Pi 3 in a gun range environment.
 Requirements:
     - ALSA tools: sudo apt-get install alsa-utils
     - Python packages: pip install numpy sounddevice scipy psutil
+    - Optional, for FLAC output: pip install soundfile
 """
 
 import os
 import sys
 import time
 import logging
+import logging.handlers
 import datetime
 import subprocess
 import threading
 import queue
+import re
+import math
 import json
+import struct
+import select
+import signal
+import shutil
+import sqlite3
+import ctypes
+import mmap
+import bisect
+import itertools
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
-import sounddevice as sd
-from scipy.io import wavfile
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # PortAudio is missing (e.g. on a dev box); the buffer and DSP code still work
+    sd = None
+try:
+    import soundfile
+except (ImportError, OSError):
+    # Optional: only needed for FLAC output
+    soundfile = None
 import psutil
 
+from gunshot_review import SIDECAR_SUFFIX, build_sidecar, write_sidecar
+from gunshot_catalog import CATALOG_FILE, EventCatalog, describe_audio_file, file_number, level_db
+
 # Configuration
 CONFIG = {
     'SAMPLE_RATE': 48000,
     'CHANNELS': 2,
     'BUFFER_DURATION': 3,  # Increased to 3 seconds to capture more audio
     'DETECTION_THRESHOLD': -20,  # Raised threshold to avoid false positives (was -50)
+    'ENVELOPE_HOP': 128,  # Frames per step of the detection envelope (time resolution of the trigger)
+    'TRIGGER_WINDOW_FRAMES': None,  # Level window compared with the threshold; None for one callback block
+    'DETECTOR': 'fixed',  # 'fixed' compares blocks to DETECTION_THRESHOLD, 'adaptive' to a running noise floor
+    'NOISE_FLOOR_WINDOW': 10.0,  # Seconds of recent block levels the adaptive noise floor is taken from
+    'NOISE_FLOOR_PERCENTILE': 50,  # Percentile of recent block levels used as the noise floor
+    'NOISE_FLOOR_DECIMATION': 4,  # Blocks per noise floor sample (the quietest block of each group is kept)
+    'ADAPTIVE_MARGIN_DB': 15,  # Adaptive mode: trigger this far above the noise floor
+    'ADAPTIVE_MIN_DB': -50,  # Adaptive mode: never trigger below this level, however quiet the floor
+    'ADAPTIVE_MIN_CREST_DB': None,  # Adaptive mode: also require this block peak-to-RMS ratio (None to skip)
+    'ARRIVAL_ANALYSIS': True,  # Estimate inter-channel arrival delays of each saved event (GCC-PHAT)
+    'ARRIVAL_WINDOW': 2048,  # Frames around the trigger cross-correlated for arrival delays
+    'ARRIVAL_MAX_DELAY': 0.002,  # Largest inter-channel delay searched (seconds, at least mic spacing / speed of sound)
+    'ARRIVAL_BATCH': 16,  # Queued events analysed together in one batched FFT
+    'MIC_SPACING': None,  # Metres between the channel 0 and 1 microphones; enables bearings
+    'SPEED_OF_SOUND': 343.0,  # Metres per second
+    'LANE_BEARINGS': None,  # {lane: bearing in degrees}; events get the lane nearest their bearing
+    'ONSET_ANALYSIS': True,  # Count the reports in each saved event and record where they start
+    'ONSET_HOP': 128,  # Frames per level step in onset detection
+    'ONSET_RISE_DB': 12.0,  # Level rise over the quietest of the previous ONSET_LOOKBACK hops that marks a report
+    'ONSET_LOOKBACK': 4,  # Hops a rise is measured over
+    'ONSET_RANGE_DB': 30.0,  # Reports must reach within this of the event's loudest hop
+    'ONSET_MIN_GAP': 0.04,  # Seconds; rises closer than this to the previous report belong to it
+    'REVIEW_SIDECARS': True,  # Write a waveform/spectrogram .peaks sidecar with each event for gunshot_review.py
     'GUNSHOT_DIR': 'gunshots',
-    'STATE_FILE': 'gunshot_state.json',
     'LOG_FILE': 'gunshot_detection.log',
+    'LOG_FORMAT': 'text',  # 'text' or 'json' (one JSON object per line)
+    'LOG_QUEUE_SIZE': 1024,  # Log records buffered for the writer thread; extra records are dropped
+    'RATE_LIMIT_SLOTS': 64,  # Distinct rate-limited message keys tracked
     'BUFFER_SIZE': 1024,  # Smaller buffer for faster, more responsive detection
     'LATENCY': 'low',    # Low latency for faster response
-    'MAX_QUEUE_SIZE': 100,  # Maximum number of detections to queue
+    'SAMPLE_FORMAT': 'float32',  # 'float32' or 'int16'; int16 halves ring memory and saves are a straight copy
+    'CAPTURE_RING_DURATION': 30,  # Seconds of audio kept in the shared capture ring
+    'BLACKBOX': False,  # Also record the whole stream continuously to a disk ring of int16 segment files
+    'BLACKBOX_DIR': 'blackbox',  # Local storage (SD card, not tmpfs) for the black box segments
+    'BLACKBOX_HOURS': 1.0,  # Audio the black box keeps (about 690 MB per hour at 48kHz stereo)
+    'BLACKBOX_SEGMENT_SECONDS': 60,  # Length of each preallocated segment file
+    'BLACKBOX_FLUSH_INTERVAL': 1.0,  # Seconds between bulk copies from the capture ring to the segments
+    'MAX_QUEUE_SECONDS': 20,  # Audio the detection queue may reference before new events are dropped
+    'MAX_QUEUE_BYTES': None,  # Byte limit for queued audio, overrides MAX_QUEUE_SECONDS when set
+    'DEVICE_EVENT_QUEUE': 256,  # Multi-device mode: events a device worker may have in flight to the supervisor
+    'DEVICE_MAX_DELAY': 0.1,  # Multi-device mode: triggers this close on different devices are the same shot
+    'DEVICE_GROUP_WAIT': 0.25,  # Multi-device mode: seconds to wait for other devices' events of a shot
+    'STREAM_EVENTS': True,  # Start writing an event as soon as it opens instead of after its post-roll
+    'WRITE_CHUNK_FRAMES': 4096,  # Frames converted to int16 and written per chunk when saving
+    'SPOOL_DIR': '/dev/shm/gunshot-spool',  # Local (tmpfs or SD) spool events are written to before the USB drive
+    'SPOOL_MAX_BYTES': 64 * 1024 * 1024,  # Byte cap for the spool
+    'SPOOL_DROP_POLICY': 'oldest',  # When the spool is full: 'oldest' evicts spooled events, 'newest' drops the new one
+    'SPOOL_FSYNC_BATCH': 8,  # Events moved to USB per batch, with one filesystem sync per batch
+    'SPOOL_FSYNC_INTERVAL': 5.0,  # Longest a spooled event waits for its batch to fill (seconds)
+    'SHARD_LAYOUT': '%Y-%m-%d/%H',  # Subdirectories of GUNSHOT_DIR events are filed in by trigger time (strftime; None for flat)
+    'RETENTION_MAX_BYTES': None,  # Byte budget for events on the USB drive (None: only free space limits them)
+    'RETENTION_MAX_AGE_DAYS': None,  # Delete events older than this many days (None to keep them)
+    'RETENTION_MIN_FREE_BYTES': 256 * 1024 * 1024,  # Evict events rather than let the drive's free space drop below this
+    'RETENTION_INTERVAL': 60.0,  # Seconds between background retention passes
+    'RETENTION_RESYNC_INTERVAL': 3600.0,  # Seconds between re-reading free space, which is tracked incrementally in between
+    'OUTPUT_FORMAT': 'wav',  # 'wav' or 'flac' (lossless, needs the soundfile package; falls back to wav)
+    'ENCODER_WORKERS': 1,  # Processes encoding FLAC in the background
+    'MAX_PENDING_ENCODES': 4,  # Events waiting for or in encoding before the writer thread waits
     'ERROR_COOLDOWN': 60,  # Seconds to wait between repeated error messages
     'BLOCKS_PER_BUFFER': 4,  # Number of blocks to buffer
-    'CAPTURE_DELAY': 0.5,  # Delay after trigger to capture gunshot (seconds)
+    'PRE_TRIGGER': 0.5,  # Audio kept before the trigger sample (seconds)
+    'POST_TRIGGER': 1.0,  # Audio kept after the last trigger of an event (seconds)
+    'MAX_EVENT_DURATION': 2.5,  # Longest single event before it is closed (seconds, must fit in the capture ring)
     'DEBUG_INTERVAL': 5,  # How often to log audio levels (seconds)
+    'FAST_START': True,  # Open the stream straight away instead of recording a preliminary test first
+    'HEALTH_CHECK_SECONDS': 3.0,  # Fast start: live audio the microphone check is run on once the stream is open
+    'STREAM_STALL_SECONDS': 2.0,  # Reopen the stream if it delivers no usable block for this long
+    'STREAM_RETRY_INTERVAL': 0.5,  # Wait before reopening a failed stream, doubled after each failed attempt
+    'STREAM_RETRY_MAX': 10.0,  # Longest wait between attempts to reopen the stream
+    'MOUNTINFO_FILE': '/proc/self/mountinfo',  # Mount table watched for USB plug/unplug
+    'MOUNT_POLL_INTERVAL': 1.0,  # Seconds between re-reads if change notification is unavailable
+    'ANALYSIS_THREAD': False,  # Run detection on a separate thread; the callback only copies audio
+    'ANALYSIS_RING_BLOCKS': 64,  # Blocks the callback can get ahead of the analysis thread
+    'ANALYSIS_BATCH_BLOCKS': 16,  # Maximum blocks the analysis thread drains per pass
+    'AUDIO_LEVEL_HISTORY': 100,  # Number of recent block levels kept for debug stats
+    'METRICS_FILE': 'gunshot_metrics.prom',  # Prometheus text file rewritten with pipeline metrics (None to disable)
+    'METRICS_INTERVAL': 10.0,  # Seconds between metrics file rewrites
+    'CONFIG_FILE': 'gunshot_config.json',  # JSON overrides of these settings; reloaded on SIGHUP or when it changes
 }
 
-class CircularBuffer:
-    """Circular buffer to store audio data"""
-    def __init__(self, duration, sample_rate, channels):
-        self.size = int(duration * sample_rate * channels)
-        self.data = np.zeros(self.size, dtype=np.float32)
-        self.index = 0
-        self.is_full = False
-        self.total_samples_written = 0
+# Settings a running logger picks up from a reloaded config file, between two blocks
+HOT_RELOAD_KEYS = frozenset({
+    'DETECTION_THRESHOLD', 'ADAPTIVE_MARGIN_DB', 'ADAPTIVE_MIN_DB', 'ADAPTIVE_MIN_CREST_DB',
+    'PRE_TRIGGER', 'POST_TRIGGER', 'MAX_EVENT_DURATION', 'DEBUG_INTERVAL', 'ERROR_COOLDOWN',
+    'ONSET_ANALYSIS', 'ONSET_HOP', 'ONSET_RISE_DB', 'ONSET_LOOKBACK', 'ONSET_RANGE_DB', 'ONSET_MIN_GAP',
+    'REVIEW_SIDECARS', 'MIC_SPACING', 'SPEED_OF_SOUND', 'LANE_BEARINGS',
+    'RETENTION_MAX_BYTES', 'RETENTION_MAX_AGE_DAYS', 'RETENTION_MIN_FREE_BYTES',
+    'STREAM_STALL_SECONDS', 'STREAM_RETRY_INTERVAL', 'STREAM_RETRY_MAX',
+})
+# Settings the audio stream is opened with, or that size what it writes into
+STREAM_KEYS = frozenset({
+    'SAMPLE_RATE', 'CHANNELS', 'BUFFER_SIZE', 'LATENCY', 'SAMPLE_FORMAT', 'BUFFER_DURATION',
+    'CAPTURE_RING_DURATION', 'ANALYSIS_THREAD', 'ANALYSIS_RING_BLOCKS', 'ENVELOPE_HOP',
+    'TRIGGER_WINDOW_FRAMES', 'DETECTOR', 'NOISE_FLOOR_WINDOW', 'NOISE_FLOOR_PERCENTILE', 'NOISE_FLOOR_DECIMATION',
+})
+
+class ConfigError(ValueError):
+    """A config file that cannot be applied"""
+
+def read_config_file(path):
+    """Settings from a JSON file of CONFIG overrides, type-checked against CONFIG; raises ConfigError"""
+    try:
+        overrides = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read {path}: {e}")
+    if not isinstance(overrides, dict):
+        raise ConfigError(f"{path} must hold a JSON object of settings")
+    unknown = sorted(key for key in overrides if key not in CONFIG)
+    if unknown:
+        raise ConfigError(f"Unknown settings in {path}: {', '.join(unknown)}")
+    for key, value in overrides.items():
+        current = CONFIG[key]
+        if current is None or value is None:
+            continue
+        numeric = (int, float)
+        if isinstance(current, numeric) and not isinstance(current, bool):
+            ok = isinstance(value, numeric) and not isinstance(value, bool)
+            expected = 'number'
+        else:
+            ok = isinstance(value, type(current))
+            expected = type(current).__name__
+        if not ok:
+            raise ConfigError(f"{key} in {path} should be a {expected}, not {value!r}")
+    return overrides
+
+def reload_changes(overrides):
+    """The settings a reload would change, or ConfigError if any of them cannot change while running"""
+    changes = {key: value for key, value in overrides.items() if CONFIG[key] != value}
+    stream = sorted(key for key in changes if key in STREAM_KEYS)
+    startup = sorted(key for key in changes if key not in STREAM_KEYS and key not in HOT_RELOAD_KEYS)
+    reasons = []
+    if stream:
+        reasons.append(f"{', '.join(stream)} need the audio stream reopened")
+    if startup:
+        reasons.append(f"{', '.join(startup)} are only read at startup")
+    if reasons:
+        raise ConfigError(f"{'; '.join(reasons)}. Restart the service to change them; nothing was applied")
+    check_event_settings(dict(CONFIG, **changes))
+    return changes
+
+def check_event_settings(settings):
+    """ConfigError unless events built with these settings fit the capture ring and contain their trigger"""
+    ring_duration = max(settings['BUFFER_DURATION'], settings['CAPTURE_RING_DURATION'])
+    pre, post = settings['PRE_TRIGGER'], settings['POST_TRIGGER']
+    if min(pre, post) < 0:
+        raise ConfigError("PRE_TRIGGER and POST_TRIGGER must be non-negative")
+    if post >= ring_duration or pre + post > ring_duration:
+        raise ConfigError(f"PRE_TRIGGER and POST_TRIGGER must fit in the {ring_duration}s capture ring together")
+    if pre >= min(settings['MAX_EVENT_DURATION'], ring_duration):
+        # The event would be cut off at MAX_EVENT_DURATION before it reached the trigger
+        raise ConfigError(f"PRE_TRIGGER must be shorter than MAX_EVENT_DURATION ({settings['MAX_EVENT_DURATION']}s)")
+
+def load_deferred_modules():
+    """Import what only the writer thread needs, after the stream is open rather than before"""
+    import scipy.fft  # noqa: F401
+
+def full_scale(dtype):
+    """Amplitude that corresponds to 0 dBFS for a sample dtype"""
+    if np.dtype(dtype) == np.int16:
+        return 32768.0
+    return 1.0
+
+class RangeOverwrittenError(Exception):
+    """Requested frames were overwritten before they could be read"""
+
+class CircularBuffer:
+    """Circular buffer to store audio data
+
+    Samples are stored interleaved. Writes use at most two contiguous slice
+    assignments and reads return the most recent data without rolling the
+    whole buffer. samples_claimed is advanced before a write copies and
+    total_samples_written after, so readers on other threads can tell which
+    frames a write in progress is overwriting.
+    """
+    def __init__(self, duration, sample_rate, channels, dtype=np.float32):
+        self.channels = channels
+        self.size = int(duration * sample_rate * channels)
+        self.data = np.zeros(self.size, dtype=dtype)
+        self.index = 0
+        self.is_full = False
+        self.total_samples_written = 0
+        self.samples_claimed = 0
+
+    def write(self, data):
+        try:
+            data_len = len(data)
+            if data_len == 0:
+                return
+            self.samples_claimed = self.total_samples_written + data_len
+
+            # Only the newest `size` samples can survive this write
+            start = self.index
+            if data_len > self.size:
+                start = (self.index + data_len - self.size) % self.size
+                data = data[data_len - self.size:]
+
+            # Copy up to the end of the buffer, then wrap the remainder
+            count = len(data)
+            first = min(count, self.size - start)
+            self.data[start:start + first] = data[:first]
+            if first < count:
+                self.data[:count - first] = data[first:]
+
+            if self.index + data_len >= self.size:
+                self.is_full = True
+            self.index = (self.index + data_len) % self.size
+
+            self.total_samples_written += data_len
+
+        except Exception as e:
+            logging.error(f"Error writing to circular buffer: {e}")
+
+    @property
+    def frames_written(self):
+        """Absolute index of the next frame to be written"""
+        return self.total_samples_written // self.channels
+
+    def range_views(self, start_frame, end_frame):
+        """Return absolute frames [start_frame, end_frame) as up to two views
+
+        Positions are derived from the absolute frame numbers alone, so this
+        is safe to call while the audio thread writes. The caller must make
+        sure the range is still held (see check_range).
+        """
+        start = (start_frame * self.channels) % self.size
+        count = (end_frame - start_frame) * self.channels
+        first = min(count, self.size - start)
+        return self.data[start:start + first], self.data[:count - first]
+
+    def oldest_held(self):
+        """First absolute frame that is neither overwritten nor being overwritten"""
+        return (self.samples_claimed - self.size) // self.channels
+
+    def check_range(self, start_frame):
+        """Raise RangeOverwrittenError if frames from start_frame are gone or being overwritten"""
+        if self.oldest_held() > start_frame:
+            raise RangeOverwrittenError(f"Frames from {start_frame} were overwritten")
+
+    def read_frames(self, start_frame, end_frame):
+        """Return a copy of absolute frames [start_frame, end_frame)
+
+        Frames that have already been overwritten are clipped from the start
+        of the range, and frames not yet written from the end.
+        """
+        newest = self.frames_written
+        oldest = newest - self.available() // self.channels
+        start_frame = max(start_frame, oldest)
+        end_frame = min(end_frame, newest)
+        if end_frame <= start_frame:
+            return np.zeros(0, dtype=self.data.dtype)
+
+        first, second = self.range_views(start_frame, end_frame)
+        if len(second) == 0:
+            return first.copy()
+        return np.concatenate((first, second))
+
+    def read_range(self, start_frame, end_frame):
+        """Return a copy of absolute frames [start_frame, end_frame) or raise
+
+        Unlike read_frames this never clips: RangeOverwrittenError is raised
+        if any part of the range is gone, including when the writer laps
+        the range while it is being copied.
+        """
+        if end_frame > self.frames_written:
+            raise ValueError(f"Frames up to {end_frame} have not been written yet")
+        self.check_range(start_frame)
+
+        audio_data = self.read_frames(start_frame, end_frame)
+
+        # The audio thread keeps writing while we copy, so check again afterwards
+        self.check_range(start_frame)
+        return audio_data
+
+    def available(self):
+        """Number of samples currently held in the buffer"""
+        return self.size if self.is_full else self.index
+
+    def views(self, num_frames=None):
+        """Return the last num_frames frames as (older, newer) views without copying
+
+        Concatenating the two segments gives the samples in chronological
+        order. The views alias the buffer, so they are only stable until the
+        next write.
+        """
+        count = self.available()
+        if num_frames is not None:
+            count = min(count, max(0, int(num_frames)) * self.channels)
+
+        start = self.index - count
+        if start >= 0:
+            return self.data[:0], self.data[start:self.index]
+        return self.data[start:], self.data[:self.index]
+
+    def snapshot(self, num_frames=None):
+        """Return a chronological copy of the last num_frames frames"""
+        try:
+            older, newer = self.views(num_frames)
+            if len(older) == 0:
+                return newer.copy()
+            return np.concatenate((older, newer))
+        except Exception as e:
+            logging.error(f"Error getting buffer snapshot: {e}")
+            return np.zeros(1, dtype=self.data.dtype)
+
+    def get_buffer(self):
+        """Return a chronological copy of everything held in the buffer"""
+        return self.snapshot()
+
+class BlockRing:
+    """Preallocated single-producer/single-consumer ring of audio blocks
+
+    The audio callback is the only writer and the analysis thread the only
+    reader. Each side only advances its own counter, so no lock is needed:
+    a slot is published by bumping write_count after it has been filled,
+    and released by bumping read_count after it has been processed. Frames
+    of blocks that never made it into the ring are carried by the next
+    block that does, so the reader can account for them.
+    """
+    def __init__(self, num_blocks, block_size, channels, dtype=np.float32):
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.blocks = np.zeros((num_blocks, block_size, channels), dtype=dtype)
+        self.frames = np.zeros(num_blocks, dtype=np.int64)
+        self.arrival_times = np.zeros(num_blocks, dtype=np.float64)
+        self.adc_times = np.zeros(num_blocks, dtype=np.float64)
+        self.missed_frames = np.zeros(num_blocks, dtype=np.int64)
+        self.write_count = 0
+        self.read_count = 0
+        self.dropped = 0
+        self.skipped_frames = 0  # Producer side: frames lost since the last published block
+
+    def push(self, indata, arrival_time, adc_time=0.0):
+        """Copy one block into the ring (producer side); returns False if dropped"""
+        frames = len(indata)
+        if frames > self.block_size or self.write_count - self.read_count >= self.num_blocks:
+            self.dropped += 1
+            self.skipped_frames += frames
+            return False
+
+        slot = self.write_count % self.num_blocks
+        self.blocks[slot, :frames] = indata
+        self.frames[slot] = frames
+        self.arrival_times[slot] = arrival_time
+        self.adc_times[slot] = adc_time
+        self.missed_frames[slot] = self.skipped_frames
+        self.skipped_frames = 0
+        self.write_count += 1
+        return True
+
+    def skip(self, frames):
+        """Account for a block the producer threw away without offering it to the ring"""
+        self.skipped_frames += frames
+
+    def pending(self):
+        """Number of published blocks not yet consumed"""
+        return self.write_count - self.read_count
+
+    def peek(self):
+        """Return (block, arrival_time, adc_time) for the oldest pending block (consumer side)"""
+        slot = self.read_count % self.num_blocks
+        return self.blocks[slot, :self.frames[slot]], self.arrival_times[slot], self.adc_times[slot]
+
+    def missed(self):
+        """Frames lost just before the oldest pending block (consumer side)"""
+        return int(self.missed_frames[self.read_count % self.num_blocks])
+
+    def release(self):
+        """Hand the oldest pending slot back to the producer"""
+        self.read_count += 1
+
+class StreamGaps:
+    """Audio the capture stream missed while it was being reopened or dropped blocks
+
+    The capture ring only holds audio that arrived, so its frame numbers
+    run straight across a gap. Each gap is kept as the ring frame it comes
+    just before and its length in frames, so ring frames can still be
+    placed in time. Gaps are only appended, by the block path.
+    """
+    def __init__(self):
+        self.frames = []        # Ring frame each gap comes before, ascending
+        self.cumulative = []    # Gap frames up to and including each gap
+        self.total = 0
+
+    def __len__(self):
+        return len(self.cumulative)
+
+    def add(self, frame, length):
+        self.total += length
+        # cumulative is appended last, so readers on other threads never see a half-added gap
+        self.frames.append(frame)
+        self.cumulative.append(self.total)
+
+    def before(self, frame):
+        """Frames missed before ring frame `frame` was captured"""
+        count = len(self.cumulative)
+        index = bisect.bisect_right(self.frames, frame, 0, count)
+        return self.cumulative[index - 1] if index else 0
+
+    def between(self, start, end):
+        """Frames missed after ring frame start and before ring frame end"""
+        return self.before(end) - self.before(start)
+
+    def __getitem__(self, index):
+        """(ring frame, length) of a gap"""
+        return self.frames[index], self.cumulative[index] - (self.cumulative[index - 1] if index else 0)
+
+class DetectionEvent:
+    """A detected event as an absolute frame range of the capture stream"""
+    __slots__ = ('start_frame', 'end_frame', 'trigger_frame', 'trigger_time',
+                 'peak_db', 'trigger_count', 'closed', 'queued_bytes', 'device', 'arrival', 'onsets',
+                 'blackbox_frame')
+
+    def __init__(self, start_frame, end_frame, trigger_frame, trigger_time, peak_db):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.trigger_frame = trigger_frame
+        self.trigger_time = trigger_time
+        self.peak_db = peak_db
+        self.trigger_count = 1
+        # Set once the end frame is final; streamed events are queued while still open
+        self.closed = False
+        self.queued_bytes = 0
+        # Input device the event came from, in multi-device mode
+        self.device = None
+        # Arrival delays, bearing and lane, filled in on the writer thread
+        self.arrival = None
+        # Frame offsets of the reports in the saved audio, filled in when it is saved
+        self.onsets = None
+        # Black box position of start_frame, when continuous recording is on
+        self.blackbox_frame = None
+
+    @property
+    def num_frames(self):
+        return self.end_frame - self.start_frame
+
+class EventCapture:
+    """Turns trigger frames into pre/post-rolled events, coalescing rapid fire
+
+    A trigger opens an event covering pre_frames before it and post_frames
+    after it. Triggers that land before the open event ends extend it
+    (up to max_frames in total) instead of starting another one, and a new
+    event never starts before the previous one ended, so no audio is
+    captured twice. A trigger inside an event that has already closed,
+    which happens when its loudest frame shares a block with the event's
+    end, is counted against that event rather than opening a new one.
+    """
+    def __init__(self, pre_frames, post_frames, max_frames):
+        self.pre_frames = pre_frames
+        self.post_frames = post_frames
+        self.max_frames = max(max_frames, post_frames + 1)
+        self.current = None
+        self.last_event = None
+        self.last_end_frame = 0
+
+    def trigger(self, frame, db_level, trigger_time):
+        """Register a trigger at an absolute frame; returns True if it opened a new event
+
+        poll() must be called first so a finished event is never replaced.
+        """
+        event = self.current
+        if event is not None and frame < event.end_frame:
+            event.end_frame = max(event.end_frame,
+                                  min(frame + self.post_frames, event.start_frame + self.max_frames))
+            event.peak_db = max(event.peak_db, db_level)
+            event.trigger_count += 1
+            return False
+
+        if frame < self.last_end_frame:
+            # Already captured by the event poll() just closed
+            self.last_event.peak_db = max(self.last_event.peak_db, db_level)
+            self.last_event.trigger_count += 1
+            return False
+
+        start_frame = max(frame - self.pre_frames, self.last_end_frame, 0)
+        end_frame = min(frame + self.post_frames, start_frame + self.max_frames)
+        self.current = DetectionEvent(start_frame, end_frame, frame, trigger_time, db_level)
+        return True
+
+    def poll(self, frames_written):
+        """Return the open event once all of its frames have been written"""
+        event = self.current
+        if event is None or frames_written < event.end_frame:
+            return None
+        self.current = None
+        self.last_event = event
+        self.last_end_frame = event.end_frame
+        event.closed = True
+        return event
+
+class DetectionQueue:
+    """Queue of DetectionEvent descriptors bounded by the audio they reference
+
+    Events only point into the capture ring, so the queue is limited by the
+    bytes of audio it would pin rather than by item count. An open event is
+    charged for the most frames it can grow to, passed as max_frames. The
+    charge is held until release(), not get(), so events taken off the queue
+    keep counting until they have been saved.
+    """
+    def __init__(self, max_bytes, bytes_per_frame):
+        self.max_bytes = max_bytes
+        self.bytes_per_frame = bytes_per_frame
+        self.pending_bytes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def put_nowait(self, event, max_frames=None):
+        """Queue an event, raising queue.Full if it would exceed the byte limit"""
+        size = (event.num_frames if max_frames is None else max_frames) * self.bytes_per_frame
+        with self._lock:
+            if self.pending_bytes + size > self.max_bytes:
+                raise queue.Full
+            self.pending_bytes += size
+        event.queued_bytes = size
+        self._queue.put_nowait(event)
+
+    def get(self, block=True, timeout=None):
+        return self._queue.get(block, timeout)
+
+    def release(self, event):
+        """Stop charging for an event once its audio is no longer needed"""
+        with self._lock:
+            self.pending_bytes -= event.queued_bytes
+        event.queued_bytes = 0
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def empty(self):
+        return self._queue.empty()
+
+class PcmSink:
+    """Base for sinks that take float32 or int16 audio and store 16-bit PCM
+
+    float32 samples are clipped, scaled and converted in preallocated
+    scratch buffers, so memory use stays constant however long the event
+    is; int16 samples are passed through as they are. Level statistics
+    (relative to full scale) are accumulated on the way through for
+    validation. Subclasses implement _emit() for each int16 chunk.
+    """
+    def __init__(self, channels, chunk_frames=4096):
+        self.channels = channels
+        self.samples_written = 0
+        self.sum_squares = 0.0
+        self.channel_sum_squares = np.zeros(channels)
+        self.max_amplitude = 0.0
+        self._float_scratch = np.empty(chunk_frames * channels, dtype=np.float32)
+        self._int_scratch = np.empty(chunk_frames * channels, dtype='<i2')
+
+    def _emit(self, converted):
+        raise NotImplementedError
+
+    @property
+    def frames_written(self):
+        return self.samples_written // self.channels
+
+    def write(self, samples):
+        """Convert and append interleaved float32 or int16 samples"""
+        if samples.dtype == np.int16:
+            self._write_int16(samples)
+            return
+
+        chunk = len(self._float_scratch)
+        for offset in range(0, len(samples), chunk):
+            count = min(chunk, len(samples) - offset)
+            scratch = self._float_scratch[:count]
+            np.clip(samples[offset:offset + count], -1.0, 1.0, out=scratch)
+
+            frames = scratch.reshape(-1, self.channels)
+            self.channel_sum_squares += np.einsum('ij,ij->j', frames, frames)
+            self.sum_squares += float(np.dot(scratch, scratch))
+            self.max_amplitude = max(self.max_amplitude, float(scratch.max()), -float(scratch.min()))
+
+            # Convert from float32 (-1.0 to 1.0) to int16 (-32768 to 32767)
+            np.multiply(scratch, 32767, out=scratch)
+            converted = self._int_scratch[:count]
+            np.copyto(converted, scratch, casting='unsafe')
+            self._emit(converted)
+            self.samples_written += count
+
+    def _write_int16(self, samples):
+        if len(samples) == 0:
+            return
+        scale = full_scale(np.int16)
+        frames = samples.reshape(-1, self.channels)
+        self.channel_sum_squares += np.einsum('ij,ij->j', frames, frames, dtype=np.int64) / scale ** 2
+        self.sum_squares += float(np.einsum('i,i->', samples, samples, dtype=np.int64)) / scale ** 2
+        self.max_amplitude = max(self.max_amplitude, max(int(samples.max()), -int(samples.min())) / scale)
+        self._emit(samples.astype('<i2', copy=False))
+        self.samples_written += len(samples)
+
+    def rms(self):
+        if self.samples_written == 0:
+            return 0.0
+        return float(np.sqrt(self.sum_squares / self.samples_written))
+
+    def channel_rms(self):
+        if self.samples_written == 0:
+            return np.zeros(self.channels)
+        return np.sqrt(self.channel_sum_squares / self.frames_written)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class WavStreamWriter(PcmSink):
+    """Streams audio into a 16-bit PCM WAV file chunk by chunk
+
+    The RIFF and data sizes are written as zero and patched on close.
+    """
+    HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+    def __init__(self, path, sample_rate, channels, chunk_frames=4096):
+        super().__init__(channels, chunk_frames)
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self._file = open(self.path, 'wb')
+        self._write_header(0)
+
+    def _write_header(self, data_bytes):
+        block_align = self.channels * 2
+        self._file.write(self.HEADER.pack(
+            b'RIFF', 36 + data_bytes, b'WAVE', b'fmt ', 16, 1, self.channels,
+            self.sample_rate, self.sample_rate * block_align, block_align, 16,
+            b'data', data_bytes
+        ))
+
+    def _emit(self, converted):
+        self._file.write(converted.data)
+
+    def close(self):
+        """Patch the header sizes and close the file"""
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._write_header(self.samples_written * 2)
+        self._file.close()
+
+class PcmCollector(PcmSink):
+    """Collects an event as an int16 (frames, channels) array, e.g. for encoding
+
+    Size it for the longest the event can become; it grows if the event
+    outruns that (e.g. MAX_EVENT_DURATION was raised by a reload).
+    """
+    def __init__(self, max_frames, channels, chunk_frames=4096):
+        super().__init__(channels, chunk_frames)
+        self._samples = np.empty(max_frames * channels, dtype=np.int16)
+
+    def _emit(self, converted):
+        end = self.samples_written + len(converted)
+        if end > len(self._samples):
+            grown = np.empty(max(end, 2 * len(self._samples)), dtype=np.int16)
+            grown[:self.samples_written] = self._samples[:self.samples_written]
+            self._samples = grown
+        self._samples[self.samples_written:end] = converted
+
+    def samples(self):
+        """The collected audio; a new array per collector, safe to hand to another process"""
+        return self._samples[:self.frames_written * self.channels].reshape(-1, self.channels)
+
+def encode_flac(path, audio, sample_rate):
+    """Encode int16 audio to a FLAC file; runs in an encoder pool process
+
+    Returns (encoded_bytes, encode_seconds).
+    """
+    start = time.perf_counter()
+    soundfile.write(path, audio, sample_rate, format='FLAC', subtype='PCM_16')
+    return os.path.getsize(path), time.perf_counter() - start
+
+def _init_encoder_process():
+    # Encoding is background work; keep it out of the capture process's way
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+class EventEncoder:
+    """Bounded process pool that encodes events to FLAC outside the capture process
+
+    Encoding in separate processes keeps it off the GIL the audio and
+    analysis threads need. submit() blocks once max_pending encodes are in
+    flight, which bounds the memory held by queued audio. encode is called
+    as encode(path, audio, sample_rate) in a pool process and must be a
+    picklable module-level function returning (encoded_bytes, encode_seconds).
+    """
+    def __init__(self, workers, max_pending, encode=encode_flac):
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_init_encoder_process
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.encode = encode
+
+    def submit(self, path, audio, sample_rate, on_done):
+        """Encode audio to path in the pool; on_done(future) runs when it finishes"""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self.encode, str(path), audio, sample_rate)
+        except Exception:
+            self._slots.release()
+            raise
+
+        def done(future):
+            self._slots.release()
+            on_done(future)
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        """Wait for pending encodes and stop the pool"""
+        self._executor.shutdown(wait=True)
+
+def parse_mountinfo(text):
+    """Parse /proc/self/mountinfo text into a list of (mount_point, source) tuples"""
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        try:
+            # Optional fields end at '-', followed by fstype and mount source
+            separator = fields.index('-', 6)
+        except ValueError:
+            continue
+        # Spaces and other specials are octal-escaped, e.g. '\040'
+        mount_point = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[4])
+        source = fields[separator + 2] if len(fields) > separator + 2 else ''
+        mounts.append((mount_point, source))
+    return mounts
+
+class MountWatcher:
+    """Keeps a cached view of where the USB drive is mounted
+
+    The kernel flags /proc/self/mountinfo with POLLPRI whenever the mount
+    table changes, so a background thread can sleep in poll() and re-read
+    the table only on mount, unmount or hot-unplug. No processes are
+    forked, and current_path is a plain attribute read.
+    """
+    def __init__(self, mount_path, fallback_prefix='/media/', on_change=None,
+                 mountinfo_file='/proc/self/mountinfo', poll_interval=1.0):
+        self.mount_path = str(mount_path)
+        self.fallback_prefix = fallback_prefix
+        self.on_change = on_change
+        self.mountinfo_file = mountinfo_file
+        self.poll_interval = poll_interval
+        self.current_path = None
+        self.running = False
+        self.refresh()
+
+    def read_mounts(self):
+        try:
+            with open(self.mountinfo_file, 'r') as f:
+                return parse_mountinfo(f.read())
+        except OSError:
+            # No procfs (e.g. a dev box); fall back to psutil's view
+            return [(part.mountpoint, part.device) for part in psutil.disk_partitions(all=False)]
+
+    def is_mounted(self, path):
+        path = str(path)
+        return any(mount_point == path for mount_point, _ in self.read_mounts())
+
+    def resolve(self, mounts):
+        """Pick the configured mount point, else any block device mounted under the prefix"""
+        for mount_point, _ in mounts:
+            if mount_point == self.mount_path:
+                return Path(mount_point)
+        for mount_point, source in mounts:
+            if mount_point.startswith(self.fallback_prefix) and source.startswith('/dev/'):
+                return Path(mount_point)
+        return None
+
+    def refresh(self):
+        """Re-read the mount table and notify on_change if the USB path changed"""
+        path = self.resolve(self.read_mounts())
+        if path != self.current_path:
+            self.current_path = path
+            if self.on_change is not None:
+                self.on_change(path)
+        return path
+
+    def run(self):
+        try:
+            f = open(self.mountinfo_file, 'r')
+        except OSError:
+            f = None
+
+        try:
+            poller = None
+            if f is not None:
+                poller = select.poll()
+                poller.register(f, select.POLLPRI | select.POLLERR)
+
+            while self.running:
+                if poller is None:
+                    time.sleep(self.poll_interval)
+                elif not poller.poll(self.poll_interval * 1000):
+                    continue
+                if f is not None:
+                    # Reading the file clears the change notification
+                    f.seek(0)
+                    f.read()
+                self.refresh()
+        finally:
+            if f is not None:
+                f.close()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if hasattr(self, 'thread'):
+            self.thread.join()
+
+_libc = None
+
+def sync_filesystem(path):
+    """Flush the filesystem holding path with one syncfs() call, falling back to sync()"""
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        except OSError:
+            _libc = False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _libc and hasattr(_libc, 'syncfs') and _libc.syncfs(fd) == 0:
+            return
+        os.sync()
+    finally:
+        os.close(fd)
+
+class SpoolStore:
+    """Write-behind spool that holds saved events locally until the USB drive takes them
+
+    Events are written to fast local storage first, so the writer never
+    waits on the USB stick, and they survive the stick being swapped. A
+    background thread moves them to the USB gunshots directory in batches:
+    each batch is copied as .part files, flushed with a single filesystem
+    sync, renamed into place and synced again before the spooled copies are
+    removed. The spool is capped at max_bytes; when full, drop_policy
+    'oldest' evicts the oldest spooled event and 'newest' refuses the new
+    one.
+
+    Each spooled file can carry a metadata dict, kept in a small .json
+    sidecar so it survives restarts, and companion files with the same
+    stem and one of companion_suffixes, which are moved along with it. on_migrated(records) is called from
+    the migrating thread with (final_path, size, metadata) for every batch
+    that lands on the drive. shard(metadata, path), if given, names the
+    subdirectory of the target a file goes to, and reserve(nbytes) is asked
+    before each batch is copied; batches it refuses stay in the spool.
+    """
+    def __init__(self, spool_dir, max_bytes, target_dir, drop_policy='oldest',
+                 fsync_batch=8, fsync_interval=5.0, on_migrated=None, companion_suffixes=(),
+                 shard=None, reserve=None):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.target_dir = target_dir
+        self.drop_policy = drop_policy
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.on_migrated = on_migrated
+        self.companion_suffixes = tuple(companion_suffixes)
+        self.shard = shard
+        self.reserve = reserve
+        self.logger = logging.getLogger(__name__)
+
+        self.pending_bytes = 0
+        self.dropped_files = 0
+        self.migrated_files = 0
+        self.migrated_bytes = 0
+        self.migrate_seconds = 0.0
+        self._pending = collections.deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._wake = threading.Event()
+        self.running = False
+
+        # Pick up events left behind by a previous run
+        leftovers = [p for p in self.spool_dir.iterdir() if p.is_file() and p.suffix in ('.wav', '.flac')]
+        for path in sorted(leftovers, key=lambda p: (p.stat().st_mtime, p.name)):
+            self.add(path, self._read_metadata(path))
+
+    def path_for(self, filename):
+        return self.spool_dir / filename
+
+    def _metadata_path(self, path):
+        return path.with_name(f"{path.name}.json")
+
+    def _read_metadata(self, path):
+        try:
+            return json.loads(self._metadata_path(path).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _companions(self, path):
+        return [companion for companion in (path.with_suffix(suffix) for suffix in self.companion_suffixes)
+                if companion.exists()]
+
+    def _discard(self, path):
+        for companion in self._companions(path):
+            companion.unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+        self._metadata_path(path).unlink(missing_ok=True)
+
+    def file_names(self):
+        """Names of the spooled files, oldest first"""
+        with self._lock:
+            return [path.name for path, _, _ in self._pending]
+
+    def pending_files(self):
+        return len(self._pending)
+
+    def make_room(self, nbytes):
+        """Ensure nbytes fit under the cap, applying the drop policy; False if they never will"""
+        with self._lock:
+            while self.pending_bytes + nbytes > self.max_bytes:
+                if self.drop_policy != 'oldest' or len(self._pending) <= self._in_flight:
+                    return False
+                # Evict the oldest event that is not being migrated right now
+                path, size, _ = self._pending[self._in_flight]
+                del self._pending[self._in_flight]
+                self.pending_bytes -= size
+                self.dropped_files += 1
+                self._discard(path)
+                self.logger.warning(f"⚠️  Spool full, dropped oldest spooled event {path.name}")
+        return True
+
+    def add(self, path, metadata=None):
+        """Register a completed file in the spool for migration"""
+        if metadata is not None and not self._metadata_path(path).exists():
+            self._metadata_path(path).write_text(json.dumps(metadata))
+        size = path.stat().st_size + sum(companion.stat().st_size for companion in self._companions(path))
+        with self._lock:
+            self._pending.append((path, size, metadata))
+            self.pending_bytes += size
+        self._wake.set()
+
+    def wake(self):
+        """Ask the migrator to try now, e.g. because the USB drive appeared"""
+        self._wake.set()
+
+    def migrate_batch(self):
+        """Move one batch of spooled events to the USB drive; returns the number moved"""
+        target = self.target_dir()
+        if target is None:
+            return 0
+
+        with self._migrate_lock:
+            with self._lock:
+                batch = list(self._pending)[:self.fsync_batch]
+                self._in_flight = len(batch)
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            migrated = False
+            try:
+                if self.reserve is not None and not self.reserve(sum(size for _, size, _ in batch)):
+                    return 0
+                target.mkdir(exist_ok=True)
+                parts = []
+                destinations = []
+                for path, _, metadata in batch:
+                    destination = target / self.shard(metadata, path) if self.shard is not None else target
+                    destination.mkdir(parents=True, exist_ok=True)
+                    destinations.append(destination)
+                    # Companions first, so the audio file never lands without them
+                    for source in self._companions(path) + [path]:
+                        part = destination / f"{source.name}.part"
+                        shutil.copyfile(source, part)
+                        parts.append((part, destination / source.name))
+                sync_filesystem(target)
+
+                for part, final in parts:
+                    os.replace(part, final)
+                sync_filesystem(target)
+                elapsed = time.monotonic() - started
+
+                if self.on_migrated is not None:
+                    # Sizes of the event files alone, without their companions
+                    self.on_migrated([(destination / path.name, path.stat().st_size, metadata)
+                                      for destination, (path, _, metadata) in zip(destinations, batch)])
+                migrated = True
+            finally:
+                # Retire the batch and release it in one step, so make_room()
+                # never sees migrated entries as evictable
+                with self._lock:
+                    if migrated:
+                        moved = {id(entry) for entry in batch}
+                        self._pending = collections.deque(entry for entry in self._pending
+                                                          if id(entry) not in moved)
+                        for _, size, _ in batch:
+                            self.pending_bytes -= size
+                            self.migrated_files += 1
+                            self.migrated_bytes += size
+                        self.migrate_seconds += elapsed
+                    self._in_flight = 0
+
+            for path, _, _ in batch:
+                self._discard(path)
+            return len(batch)
+
+    def flush(self):
+        """Migrate everything that can be migrated now"""
+        while self.migrate_batch():
+            pass
+
+    def run(self):
+        last_flush = time.monotonic()
+        while self.running:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            # Let small batches fill up so syncs are shared
+            if len(self._pending) < self.fsync_batch and time.monotonic() - last_flush < self.fsync_interval:
+                continue
+            try:
+                self.flush()
+            except OSError as e:
+                # Stick pulled mid-copy; the spooled files are still here
+                self.logger.warning(f"⚠️  Moving spooled events to USB failed, will retry: {e}")
+            except Exception as e:
+                # Whatever went wrong, the events stay spooled and the migrator keeps going
+                self.logger.error(f"❌ Moving spooled events to USB failed, will retry: {e}")
+            last_flush = time.monotonic()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if hasattr(self, 'thread'):
+            self.thread.join()
+
+class StorageManager:
+    """Sharded layout and retention for the events on the USB drive
+
+    Events are filed under GUNSHOT_DIR/<shard>/, the shard being the event's
+    trigger time formatted with layout (strftime, e.g. '%Y-%m-%d/%H'), so no
+    directory on the FAT drive grows past an hour of events. The events on
+    the drive are indexed in memory, loaded once from the catalog, and free
+    space is read with statvfs once and then tracked from every write and
+    eviction, re-read only every resync_interval seconds. reserve() is called
+    before each batch is written and evicts events until the batch fits in
+    max_bytes and leaves min_free_bytes free; a background thread evicts
+    events older than max_age. Events onset detection found no reports in
+    (most likely false triggers) are evicted first, oldest first, then
+    everything else, oldest first. While the catalog cannot be read, only
+    free space is enforced and loading is retried before each batch.
+    """
+    def __init__(self, root, catalog, layout=None, max_bytes=None, max_age=None,
+                 min_free_bytes=0, interval=60.0, resync_interval=3600.0):
+        self.root = root
+        self.catalog = catalog
+        self.layout = layout
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+        self.resync_interval = resync_interval
+        self.logger = logging.getLogger(__name__)
+
+        self.used_bytes = 0
+        self.free_bytes = None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.full = False
+        self._loaded_root = None
+        self._catalog_failed = False
+        self._last_resync = 0.0
+        # (time, relative path, bytes), oldest first: likely false triggers, then everything else
+        self._unlikely = collections.deque()
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread = None
+
+    def shard(self, metadata, path):
+        """Directory under GUNSHOT_DIR an event is filed in ('' for a flat layout)"""
+        if not self.layout:
+            return ''
+        event_time = None
+        if metadata:
+            event_time = metadata.get('trigger_time') or metadata.get('start_time')
+        if event_time is None:
+            event_time = path.stat().st_mtime
+        return datetime.datetime.fromtimestamp(event_time).strftime(self.layout)
+
+    def _queue_for(self, shot_count):
+        return self._unlikely if shot_count == 0 else self._events
+
+    def _load(self, root):
+        """Index the events on the drive at root from its catalog, and read its free space"""
+        self._unlikely.clear()
+        self._events.clear()
+        self.used_bytes = 0
+        self.free_bytes = shutil.disk_usage(root).free
+        self._last_resync = time.monotonic()
+        try:
+            self.catalog.open(root / CATALOG_FILE)
+            rows = self.catalog.storage_rows()
+        except (sqlite3.Error, AttributeError) as e:
+            # AttributeError: the catalog was closed under us
+            if not self._catalog_failed:
+                self.logger.error(f"❌ Could not read the event catalog, enforcing free space only: {e}")
+            self._catalog_failed = True
+            return
+        self._catalog_failed = False
+        for file_path, size, event_time, shot_count in rows:
+            self._queue_for(shot_count).append((event_time or 0.0, file_path, size or 0))
+            self.used_bytes += size or 0
+        self._loaded_root = root
+
+    def _ready(self):
+        """USB root with the index loaded for it, or None while no drive is mounted"""
+        root = self.root()
+        if root is None:
+            return None
+        if root != self._loaded_root:
+            self._load(root)
+        return root
+
+    def reserve(self, nbytes):
+        """Make room for nbytes about to be written, evicting events; False if that is impossible"""
+        with self._lock:
+            root = self._ready()
+            if root is None:
+                return True
+            evicted = []
+            while (self.free_bytes - nbytes < self.min_free_bytes
+                   or (self.max_bytes is not None and self.used_bytes + nbytes > self.max_bytes)):
+                queue_ = self._unlikely or self._events
+                if not queue_:
+                    break
+                evicted.append(self._evict(root, queue_.popleft()))
+            self._forget(evicted)
+            full = self.free_bytes - nbytes < self.min_free_bytes
+            if full and not self.full:
+                self.logger.warning("⚠️  USB drive full and no events left to evict, keeping new events in the spool")
+            self.full = full
+            return not full
+
+    def add(self, records):
+        """Spool callback: index events that just landed, as (final path, size, metadata)"""
+        with self._lock:
+            root = self._ready()
+            if root is None:
+                return
+            for path, _, metadata in records:
+                # Sidecars count against the budget too
+                size = sum(companion.stat().st_size for companion in path.parent.glob(f"{path.stem}.*"))
+                shot_count = (metadata or {}).get('shot_count')
+                event_time = (metadata or {}).get('trigger_time') or path.stat().st_mtime
+                self._queue_for(shot_count).append((event_time, str(path.relative_to(root)), size))
+                self.used_bytes += size
+                self.free_bytes -= size
+
+    def _evict(self, root, entry):
+        """Delete one event and everything saved with it; returns its catalog path"""
+        _, file_path, _ = entry
+        path = root / file_path
+        freed = 0
+        # gunshot_NNN.wav, its .peaks sidecar, cached onsets and the like
+        for companion in path.parent.glob(f"{path.stem}.*"):
+            try:
+                size = companion.stat().st_size
+                companion.unlink()
+                freed += size
+            except OSError as e:
+                self.logger.warning(f"⚠️  Could not delete {companion}: {e}")
+        # Drop shard directories that are now empty
+        for directory in path.parents:
+            if directory == root or directory.name == CONFIG['GUNSHOT_DIR']:
+                break
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+        self.used_bytes -= freed
+        self.free_bytes += freed
+        self.evicted_files += 1
+        self.evicted_bytes += freed
+        return file_path
+
+    def _forget(self, file_paths):
+        if file_paths:
+            try:
+                self.catalog.delete_many(file_paths)
+            except Exception as e:
+                # The files are gone either way; a rebuild drops the stale rows
+                self.logger.error(f"❌ Could not remove {len(file_paths)} evicted events from the catalog: {e}")
+            self.logger.info(f"🗑️  Evicted {len(file_paths)} events from the USB drive "
+                             f"({self.free_bytes / 1e6:.0f} MB free)")
+
+    def enforce(self):
+        """One retention pass: evict events past max_age and re-read free space when due"""
+        with self._lock:
+            root = self._ready()
+            if root is None:
+                return
+            if time.monotonic() - self._last_resync >= self.resync_interval:
+                self.free_bytes = shutil.disk_usage(root).free
+                self._last_resync = time.monotonic()
+            evicted = []
+            if self.max_age is not None:
+                cutoff = time.time() - self.max_age
+                while True:
+                    oldest = min((queue_ for queue_ in (self._unlikely, self._events) if queue_),
+                                 key=lambda queue_: queue_[0][0], default=None)
+                    if oldest is None or oldest[0][0] >= cutoff:
+                        break
+                    evicted.append(self._evict(root, oldest.popleft()))
+            self._forget(evicted)
+        # Budget and free space too, for a drive that filled up from elsewhere
+        self.reserve(0)
+
+    def mount_changed(self):
+        """The USB drive changed; reload the index for the new one on next use"""
+        with self._lock:
+            self._loaded_root = None
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.enforce()
+            except Exception as e:
+                self.logger.error(f"❌ Retention pass failed: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+
+BLACKBOX_MAGIC = b'GSBB'
+BLACKBOX_VERSION = 1
+# magic, version, sample_rate, channels, data offset, segment frames, sequence, flushed frames, start time
+BLACKBOX_HEADER = struct.Struct('<4sHIHIIqqd')
+
+def read_segment_header(path):
+    """Header of a black box segment file as a dict, or None if it is not one"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read(BLACKBOX_HEADER.size)
+    except OSError:
+        return None
+    if len(raw) < BLACKBOX_HEADER.size:
+        return None
+    (magic, version, sample_rate, channels, data_offset, segment_frames,
+     sequence, frames, start_time) = BLACKBOX_HEADER.unpack(raw)
+    if magic != BLACKBOX_MAGIC or version != BLACKBOX_VERSION:
+        return None
+    return {
+        'path': Path(path),
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'data_offset': data_offset,
+        'segment_frames': segment_frames,
+        'sequence': sequence,
+        'frames': frames,
+        'start_time': start_time,
+    }
+
+def blackbox_segments(directory):
+    """Headers of the segments in a black box directory that hold audio, oldest first"""
+    headers = (read_segment_header(path) for path in Path(directory).glob('segment_*.pcm'))
+    return sorted((header for header in headers if header is not None and header['frames']),
+                  key=lambda header: header['sequence'])
+
+class BlackBoxRecorder(PcmSink):
+    """Continuous int16 recording of the capture stream into a disk ring of segment files
+
+    The ring is `count` preallocated, memory-mapped segment files of
+    segment_frames each. Segments are numbered by an ever-increasing
+    sequence and segment N lives in slot N % count, so a recorded frame has
+    the position sequence * segment_frames + offset until its slot is
+    reused. A background thread copies new audio out of the capture ring
+    every flush_interval seconds and flushes whole pages; a segment's header
+    only counts frames that are flushed. Every run starts a new segment, so
+    stream frame f of this run is at position(f). Gaps in the stream (see
+    StreamGaps) are recorded as silence, so positions stay in step with time.
+    """
+    def __init__(self, directory, ring, segment_frames, count, sample_rate, flush_interval=1.0, gaps=None):
+        super().__init__(ring.channels)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ring = ring
+        self.segment_frames = segment_frames
+        self.count = count
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.gaps = gaps
+        self.logger = logging.getLogger(__name__)
+
+        self.frame_bytes = 2 * self.channels
+        # Audio starts on a page boundary so page-aligned flushes line up with it
+        self.data_offset = max(4096, mmap.PAGESIZE)
+        self.segment_bytes = self.data_offset + segment_frames * self.frame_bytes
+        self.lost_frames = 0
+        self.flushed_bytes = 0
+
+        # Carry on from the newest segment a previous run left behind
+        segments = blackbox_segments(self.directory)
+        self.first_sequence = segments[-1]['sequence'] + 1 if segments else 0
+        self.sequence = None
+        self.copied_frames = 0  # Capture ring frames copied so far
+        self.copied_gaps = 0    # Stream gaps recorded as silence so far
+        self._mm = None
+        self._samples = None
+        self._segment_frame = 0
+        self._segment_flushed = 0
+        self._segment_start_time = 0.0
+        self._clock = (self.position(0), time.time())
+        self._silence = np.zeros_like(self._int_scratch)
+        # Ring audio is copied here first, so frames lapped during the copy never reach a segment
+        self._ring_scratch = np.empty(len(self._int_scratch), dtype=ring.data.dtype)
+        self._stop = threading.Event()
+        self.thread = None
+
+    def position(self, stream_frame):
+        """Black box position of a frame of this run's capture stream"""
+        missed = self.gaps.before(stream_frame) if self.gaps is not None else 0
+        return self.first_sequence * self.segment_frames + stream_frame + missed
+
+    def slot_path(self, sequence):
+        return self.directory / f"segment_{sequence % self.count:04d}.pcm"
+
+    def _open_segment(self):
+        self.sequence = self.first_sequence if self.sequence is None else self.sequence + 1
+        fd = os.open(self.slot_path(self.sequence), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self.segment_bytes:
+                os.ftruncate(fd, self.segment_bytes)
+                if hasattr(os, 'posix_fallocate'):
+                    # Claim the blocks now rather than on the first write to each page
+                    os.posix_fallocate(fd, 0, self.segment_bytes)
+            self._mm = mmap.mmap(fd, self.segment_bytes)
+        finally:
+            os.close(fd)
+        self._samples = np.frombuffer(self._mm, dtype='<i2', offset=self.data_offset)
+        self._segment_frame = 0
+        self._segment_flushed = 0
+        # Wall-clock time of the segment's first frame, from the last capture ring reading
+        clock_position, clock_time = self._clock
+        first_position = self.sequence * self.segment_frames
+        self._segment_start_time = clock_time - (clock_position - first_position) / self.sample_rate
+        # Until the header says otherwise the slot holds no frames, whatever a previous lap left
+        self._write_header(0)
+
+    def _write_header(self, frames):
+        BLACKBOX_HEADER.pack_into(self._mm, 0, BLACKBOX_MAGIC, BLACKBOX_VERSION, self.sample_rate,
+                                  self.channels, self.data_offset, self.segment_frames, self.sequence,
+                                  frames, self._segment_start_time)
+        self._mm.flush(0, self.data_offset)
+
+    def _flush(self, final=False):
+        """Flush the segment's newly completed pages (all of it if final) and publish them in the header"""
+        written = self._segment_frame * self.frame_bytes
+        end = written if final else written - written % mmap.PAGESIZE
+        if end > self._segment_flushed:
+            self._mm.flush(self.data_offset + self._segment_flushed, end - self._segment_flushed)
+            self.flushed_bytes += end - self._segment_flushed
+            self._segment_flushed = end
+            self._write_header(end // self.frame_bytes)
+
+    def _close_segment(self):
+        if self._mm is not None:
+            self._flush(final=True)
+            self._samples = None
+            self._mm.close()
+            self._mm = None
+
+    def _emit(self, converted):
+        offset = 0
+        while offset < len(converted):
+            if self._mm is None or self._segment_frame == self.segment_frames:
+                self._close_segment()
+                self._open_segment()
+            start = self._segment_frame * self.channels
+            count = min(len(converted) - offset, len(self._samples) - start)
+            self._samples[start:start + count] = converted[offset:offset + count]
+            self._segment_frame += count // self.channels
+            offset += count
+
+    def write_silence(self, frames):
+        """Record frames that never made it to disk as silence, keeping later positions right"""
+        samples = frames * self.channels
+        while samples:
+            count = min(samples, len(self._silence))
+            self._emit(self._silence[:count])
+            self.samples_written += count
+            samples -= count
+
+    def _copy(self, start, end, oldest):
+        """Copy capture ring frames [start, end), as silence where the ring no longer holds them"""
+        if start < oldest:
+            lost = min(oldest, end) - start
+            self.write_silence(lost)
+            self.lost_frames += lost
+            self.logger.warning(f"⚠️  Black box fell behind, {lost} frames lost")
+            start += lost
+        chunk_frames = len(self._ring_scratch) // self.channels
+        while start < end:
+            chunk_end = min(end, start + chunk_frames)
+            copied = 0
+            for view in self.ring.range_views(start, chunk_end):
+                self._ring_scratch[copied:copied + len(view)] = view
+                copied += len(view)
+            # The audio thread may have lapped the start of the chunk during the copy
+            lapped = max(min(self.ring.oldest_held(), chunk_end) - start, 0)
+            if lapped:
+                self.write_silence(lapped)
+                self.lost_frames += lapped
+                self.logger.warning(f"⚠️  Black box frames from {start} were overwritten while being copied, "
+                                    f"{lapped} frames lost")
+            self.write(self._ring_scratch[lapped * self.channels:copied])
+            start = chunk_end
+
+    def write_pending(self):
+        """Copy the audio captured since the last call to the segments and flush; returns frames copied"""
+        ring = self.ring
+        newest = ring.frames_written
+        self._clock = (self.position(newest), time.time())
+        start = self.copied_frames
+        oldest = newest - ring.available() // self.channels
+
+        gaps = self.gaps if self.gaps is not None else ()
+        while self.copied_gaps < len(gaps) and gaps[self.copied_gaps][0] <= newest:
+            frame, length = gaps[self.copied_gaps]
+            self._copy(start, frame, oldest)
+            self.write_silence(length)
+            self.copied_gaps += 1
+            start = frame
+        self._copy(start, newest, oldest)
+        if self._mm is not None:
+            self._flush()
+        copied = newest - self.copied_frames
+        self.copied_frames = newest
+        return copied
+
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.write_pending()
+            except Exception as e:
+                self.logger.error(f"❌ Black box write failed: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Write out everything captured so far and close the current segment"""
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        try:
+            self.write_pending()
+        finally:
+            self._close_segment()
+
+class EnvelopeFrontEnd:
+    """Decimated energy envelope of the incoming audio, for triggering
+
+    Each block is reduced to one energy (sum of squares over frames and
+    channels) per hop of frames with a single batched dot product, written
+    into preallocated arrays. The block level and the sliding trigger-window
+    levels are sums over that envelope (an energy pyramid), so a trigger
+    window shorter than a block costs one small matrix product rather than
+    another pass over the full-rate audio. Blocks may be shorter than
+    block_size but not longer.
+    """
+    def __init__(self, block_size, channels, dtype, hop=128, window=None):
+        self.block_size = block_size
+        self.channels = channels
+        self.hop = math.gcd(block_size, hop)
+        self.hops = block_size // self.hop
+        self.power_scale = full_scale(dtype) ** 2
+        self.convert = np.dtype(dtype) != np.float32
+        # int16 blocks and short blocks are staged here as float32 (exact for int16)
+        self._staging = np.zeros((block_size, channels), dtype=np.float32)
+        self._energy = np.zeros((self.hops, 1, 1), dtype=np.float32)
+        self.energy = self._energy.reshape(-1)
+
+        self.window_hops = None
+        if window is not None:
+            self.window_hops = max(window // self.hop, 1)
+            # Energies of the previous block's last hops, so windows can span blocks
+            self.history = np.zeros(self.window_hops - 1 + self.hops, dtype=np.float32)
+            # Row i sums the window ending at hop i of the current block
+            self._window_matrix = np.zeros((self.hops, len(self.history)), dtype=np.float32)
+            for i in range(self.hops):
+                self._window_matrix[i, i:i + self.window_hops] = 1
+            self.window_sums = np.zeros(self.hops, dtype=np.float32)
+        self.block_db = -np.inf
+        self.trigger_db = -np.inf
+
+    def process(self, block):
+        """Update the envelope for one block; returns the block's RMS level in dB"""
+        frames = len(block)
+        if self.convert or frames != self.block_size:
+            staging = self._staging
+            staging[frames:] = 0
+            staging[:frames] = block
+            block = staging
+        hops = block.reshape(self.hops, 1, -1)
+        np.matmul(hops, hops.transpose(0, 2, 1), out=self._energy)
+
+        total = float(self.energy.sum()) / self.power_scale
+        self.block_db = 20 * math.log10(math.sqrt(total / max(frames * self.channels, 1)) + 1e-10)
+        if self.window_hops is None:
+            self.trigger_db = self.block_db
+        else:
+            history = self.history
+            history[-self.hops:] = self.energy
+            np.matmul(self._window_matrix, history, out=self.window_sums)
+            loudest = float(self.window_sums.max()) / self.power_scale
+            samples = self.window_hops * self.hop * self.channels
+            self.trigger_db = 20 * math.log10(math.sqrt(max(loudest, 0.0) / samples) + 1e-10)
+            history[:self.window_hops - 1] = history[self.hops:]
+        return self.block_db
+
+    def loudest_frame(self, block):
+        """(frame offset, peak amplitude in full scale) of the loudest sample in the block's loudest hop"""
+        start = int(self.energy.argmax()) * self.hop
+        frame_peaks = np.abs(block[start:start + self.hop], dtype=np.float32).max(axis=1)
+        if len(frame_peaks) == 0:
+            return 0, 0.0
+        offset = int(frame_peaks.argmax())
+        return start + offset, float(frame_peaks[offset]) / math.sqrt(self.power_scale)
+
+class NoiseFloorTracker:
+    """Running percentile of recent block levels, for the adaptive detector
+
+    Block levels are decimated to the quietest block of each group, so short
+    loud events barely move the floor, and kept in a fixed window. A
+    histogram of the window is updated incrementally, so each block is O(1)
+    and the percentile is read from a fixed number of bins once per group.
+    Until the window is half full, the fallback threshold is used.
+    """
+    def __init__(self, window, percentile, margin_db, min_db, fallback_db,
+                 decimation=4, bin_db=0.25, floor_db=-120.0, ceiling_db=0.0):
+        self.percentile = percentile
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.decimation = decimation
+        self.bin_db = bin_db
+        self.lowest_db = floor_db
+        self.top_bin = int((ceiling_db - floor_db) / bin_db) - 1
+        self.bins = np.zeros(self.top_bin + 1, dtype=np.int64)
+        self._cumulative = np.zeros_like(self.bins)
+        self.window = np.zeros(max(window, 1), dtype=np.int64)
+        self.count = 0
+        self.index = 0
+        self.group_min = np.inf
+        self.group_count = 0
+        self.floor_db = np.nan
+        self.threshold_db = fallback_db
+
+    def update(self, db_level):
+        """Add one block level; the floor and threshold move once per group"""
+        if db_level < self.group_min:
+            self.group_min = db_level
+        self.group_count += 1
+        if self.group_count < self.decimation:
+            return
+
+        level_bin = min(max(int((self.group_min - self.lowest_db) / self.bin_db), 0), self.top_bin)
+        self.group_min = np.inf
+        self.group_count = 0
+        if self.count == len(self.window):
+            self.bins[self.window[self.index]] -= 1
+        else:
+            self.count += 1
+        self.window[self.index] = level_bin
+        self.bins[level_bin] += 1
+        self.index = (self.index + 1) % len(self.window)
+
+        if self.count * 2 >= len(self.window):
+            np.cumsum(self.bins, out=self._cumulative)
+            floor_bin = int(np.searchsorted(self._cumulative, max(self.count * self.percentile / 100, 1)))
+            self.floor_db = self.lowest_db + (floor_bin + 0.5) * self.bin_db
+            self.threshold_db = max(self.floor_db + self.margin_db, self.min_db)
+
+class ArrivalEstimator:
+    """Time differences of arrival between channels by GCC-PHAT, for a batch of events
+
+    Each event contributes a (window, channels) slice around its trigger.
+    The whole batch goes through one real FFT, every channel pair is
+    cross-correlated with phase-transform weighting, and the peak within
+    max_lag frames is refined to a fraction of a frame by parabolic
+    interpolation. The FFT is long enough that lags up to max_lag do not
+    wrap around.
+    """
+    def __init__(self, window, channels, max_lag, batch_size=16):
+        self.window = window
+        self.channels = channels
+        self.max_lag = max(1, min(int(max_lag), window - 1))
+        self.nfft = 1 << (window + self.max_lag - 1).bit_length()
+        self.pairs = list(itertools.combinations(range(channels), 2))
+        self.first = np.array([a for a, _ in self.pairs], dtype=np.intp)
+        self.second = np.array([b for _, b in self.pairs], dtype=np.intp)
+        # Tapering keeps the window edges from correlating with each other
+        self.taper = np.hanning(window).astype(np.float32)[:, None]
+        self.windows = np.zeros((batch_size, window, channels), dtype=np.float32)
+
+    def estimate(self, windows):
+        """Delay in frames of the second channel of each pair after the first, shape (events, pairs)"""
+        count = len(windows)
+        if count == 0 or not self.pairs:
+            return np.zeros((count, len(self.pairs)))
+        import scipy.fft
+        spectra = scipy.fft.rfft(windows * self.taper, n=self.nfft, axis=1)
+        cross = spectra[:, :, self.second] * np.conj(spectra[:, :, self.first])
+        cross /= np.abs(cross) + 1e-12
+        correlation = scipy.fft.irfft(cross, n=self.nfft, axis=1)
+
+        # Lags -max_lag..max_lag in order
+        lags = np.concatenate((correlation[:, -self.max_lag:], correlation[:, :self.max_lag + 1]), axis=1)
+        peak = np.clip(np.argmax(lags, axis=1), 1, 2 * self.max_lag - 1)
+        events = np.arange(count)[:, None]
+        pairs = np.arange(len(self.pairs))[None, :]
+        before = lags[events, peak - 1, pairs]
+        at = lags[events, peak, pairs]
+        after = lags[events, peak + 1, pairs]
+        curvature = before - 2 * at + after
+        offset = np.divide(0.5 * (before - after), curvature,
+                           out=np.zeros_like(curvature), where=curvature < 0)
+        return peak - self.max_lag + np.clip(offset, -0.5, 0.5)
+
+def bearing_degrees(delay, spacing, speed_of_sound):
+    """Bearing from broadside of a mic pair, positive toward the first microphone"""
+    return math.degrees(math.asin(max(-1.0, min(1.0, delay * speed_of_sound / spacing))))
+
+def nearest_lane(bearing, lane_bearings):
+    return min(lane_bearings, key=lambda lane: abs(lane_bearings[lane] - bearing))
+
+def detect_onsets(audio, sample_rate, hop=128, rise_db=12.0, lookback=4, range_db=30.0, min_gap=0.04):
+    """Frame offsets of the reports (sharp level rises) in an event's (frames, channels) audio
+
+    Levels are taken per hop over all channels in one pass. A report starts
+    at the first hop whose level is rise_db above the quietest of the
+    previous lookback hops and within range_db of the loudest hop; rises
+    less than min_gap seconds after the previous report belong to it. The
+    offset is the first frame around that hop reaching a quarter of its peak.
+    """
+    hops = len(audio) // hop
+    if hops <= lookback:
+        return np.zeros(0, dtype=np.int64)
+    frames = audio[:hops * hop].astype(np.float32).reshape(hops, -1)
+    level = 10 * np.log10(np.einsum('ij,ij->i', frames, frames) / frames.shape[1] + 1e-20)
+
+    # Rise of each hop over the quietest of the hops before it
+    quietest = np.lib.stride_tricks.sliding_window_view(level[:-1], lookback).min(axis=1)
+    rising = (level[lookback:] - quietest >= rise_db) & (level[lookback:] >= level.max() - range_db)
+    starts = np.flatnonzero(rising & ~np.concatenate(([False], rising[:-1]))) + lookback
+
+    onsets = []
+    min_gap_frames = min_gap * sample_rate
+    amplitude = np.abs(audio)
+    for start in starts * hop:
+        if onsets and start - onsets[-1] < min_gap_frames:
+            continue
+        first = max(start - hop, 0)
+        segment = amplitude[first:start + 2 * hop].max(axis=1)
+        onsets.append(first + int(np.argmax(segment >= segment.max() / 4)))
+    return np.array(onsets, dtype=np.int64)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram whose counters are allocated up front
+
+    record() only bisects a preallocated bound list and bumps numpy counters,
+    so it is safe to call from the audio callback. Readers on other threads
+    may see a count and sum from slightly different moments, which is fine
+    for monitoring.
+    """
+    def __init__(self, bounds_seconds):
+        self.bounds_seconds = list(bounds_seconds)
+        self.bounds_ns = [int(bound * 1e9) for bound in self.bounds_seconds]
+        # Last bucket is +Inf
+        self.counts = np.zeros(len(self.bounds_ns) + 1, dtype=np.int64)
+        self.sum_ns = np.zeros(1, dtype=np.int64)
+
+    def record(self, elapsed_ns):
+        self.counts[bisect.bisect_left(self.bounds_ns, elapsed_ns)] += 1
+        self.sum_ns[0] += elapsed_ns
+
+    def count(self):
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, in seconds (inf if past the last bound)"""
+        counts = self.counts.copy()
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(counts), q * total))
+        return self.bounds_seconds[index] if index < len(self.bounds_seconds) else float('inf')
+
+    def prometheus(self, name, help_text):
+        counts = self.counts.copy()
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = np.cumsum(counts)
+        for bound, total in zip(self.bounds_seconds, cumulative):
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {total}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative[-1]}')
+        lines.append(f"{name}_sum {self.sum_ns[0] / 1e9:.9f}")
+        lines.append(f"{name}_count {cumulative[-1]}")
+        return lines
+
+def prometheus_metric(name, metric_type, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value:g}"]
+
+class MetricsFile:
+    """Periodically rewrite a Prometheus text file from a collect() callable
+
+    Suitable for node_exporter's textfile collector. The file is replaced
+    atomically, and all formatting and I/O happen on this thread.
+    """
+    def __init__(self, path, interval, collect):
+        self.path = Path(path)
+        self.interval = interval
+        self.collect = collect
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+
+    def write(self):
+        part = self.path.with_name(f"{self.path.name}.part")
+        part.write_text('\n'.join(self.collect()) + '\n')
+        os.replace(part, self.path)
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                self.logger.warning(f"⚠️  Failed to write metrics to {self.path}: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if hasattr(self, 'thread'):
+            self.thread.join()
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller
+
+    Records go onto a bounded queue as they are, with no formatting on the
+    calling thread; a QueueListener thread formats them and passes them to
+    the real handlers. When the queue is full the record is dropped and
+    counted.
+    """
+    def __init__(self, queue_size, *handlers):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers)
+        self.handlers = handlers
+        self.listening = False
+
+    def start_writer(self):
+        self.listener.start()
+        self.listening = True
+
+    def stop_writer(self):
+        """Write out everything queued so far and stop the writer thread"""
+        if not self.listening:
+            return
+        while True:
+            try:
+                self.listener.stop()
+                break
+            except queue.Full:
+                # The end-of-queue marker needs a free slot
+                time.sleep(0.01)
+        self.listening = False
 
-    def write(self, data):
-        try:
-            data_len = len(data)
-            if data_len == 0:
-                return
-                
-            # Write data to circular buffer
-            for i in range(data_len):
-                self.data[self.index] = data[i]
-                self.index = (self.index + 1) % self.size
-                if self.index == 0:
-                    self.is_full = True
-            
-            self.total_samples_written += data_len
-            
-        except Exception as e:
-            logging.error(f"Error writing to circular buffer: {e}")
+    def close(self):
+        self.stop_writer()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
 
-    def get_buffer(self):
+    def prepare(self, record):
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record):
         try:
-            if not self.is_full:
-                # Buffer not full yet, return what we have
-                return self.data[:self.index].copy()
-            else:
-                # Buffer is full, return the most recent data
-                # Roll the data so the most recent samples are at the end
-                return np.roll(self.data, -self.index).copy()
-        except Exception as e:
-            logging.error(f"Error getting buffer data: {e}")
-            return np.zeros(1, dtype=np.float32)
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class RateLimiter:
+    """Fixed-size per-key counters for rate-limited logging
+
+    Each key gets a slot the first time it is seen; after that, checking a
+    key only reads a dict and updates preallocated arrays. Keys beyond the
+    slot count share the last slot.
+    """
+    def __init__(self, slots, cooldown):
+        self.cooldown = cooldown
+        self.slot_for = {}
+        self.suppressed = np.zeros(slots, dtype=np.int64)
+        self.last_times = np.full(slots, -np.inf)
+
+    def check(self, key, now):
+        """Return (should_log, suppressed_since_last) for key at time now"""
+        slot = self.slot_for.get(key)
+        if slot is None:
+            slot = min(len(self.slot_for), len(self.suppressed) - 1)
+            if len(self.slot_for) < len(self.suppressed):
+                self.slot_for[key] = slot
+        if now - self.last_times[slot] > self.cooldown:
+            count = int(self.suppressed[slot])
+            self.suppressed[slot] = 0
+            self.last_times[slot] = now
+            return True, count
+        self.suppressed[slot] += 1
+        return False, 0
 
 class GunshotLogger:
-    def __init__(self, usb_mount_path=None):
+    def __init__(self, usb_mount_path=None, verify_mount=True):
         self.setup_logging()
         
         # Set USB mount path - use command line argument, then default
@@ -93,42 +1928,212 @@ class GunshotLogger:
             current_user = os.getenv('USER') or subprocess.check_output(['whoami'], text=True).strip()
             self.usb_mount_path = Path(f"/media/{current_user}/gunshot-logger")
         
-        # Verify USB mount before starting
-        if not self.verify_usb_mount():
-            self.logger.error(f"USB drive not properly mounted at {self.usb_mount_path}. Please run ./mount_usb_only.sh or mount manually.")
-            raise RuntimeError("USB drive not mounted")
-        
-        self.buffer = CircularBuffer(
-            CONFIG['BUFFER_DURATION'],
-            CONFIG['SAMPLE_RATE'],
-            CONFIG['CHANNELS']
-        )
+        self.setup_storage(verify_mount)
+
+        # One shared capture ring; queued events are frame ranges into it
+        ring_duration = max(CONFIG['BUFFER_DURATION'], CONFIG['CAPTURE_RING_DURATION'])
+        self.sample_dtype = np.dtype(CONFIG['SAMPLE_FORMAT'])
+        self.buffer = self.create_capture_ring(ring_duration)
         
         # Log buffer configuration
         self.logger.info(
-            f"Circular buffer initialized: duration={CONFIG['BUFFER_DURATION']}s, "
+            f"Circular buffer initialized: duration={ring_duration}s, "
             f"sample_rate={CONFIG['SAMPLE_RATE']}, channels={CONFIG['CHANNELS']}, "
-            f"buffer_size={self.buffer.size} samples"
+            f"buffer_size={self.buffer.size} samples ({self.sample_dtype.name}, {self.buffer.data.nbytes / 1e6:.1f} MB)"
         )
         
-        self.file_counter = self.load_state()
-        self.detection_queue = queue.Queue(maxsize=CONFIG['MAX_QUEUE_SIZE'])
+        bytes_per_frame = self.buffer.data.itemsize * CONFIG['CHANNELS']
+        max_queue_bytes = CONFIG['MAX_QUEUE_BYTES']
+        if max_queue_bytes is None:
+            max_queue_bytes = int(CONFIG['MAX_QUEUE_SECONDS'] * CONFIG['SAMPLE_RATE'] * bytes_per_frame)
+        self.detection_queue = DetectionQueue(max_queue_bytes, bytes_per_frame)
+        self.overwritten_events = 0
+        self.queued_events = 0
+        self.dropped_events = 0
+
         self.running = False
         self.usb_path = self.usb_mount_path  # Use the verified mount path
-        self.last_usb_log = 0
         self.detection_state = 'IDLE'
-        self.trigger_time = None
-        self.last_error_time = 0
-        self.error_counts = {}
+        max_event = min(CONFIG['MAX_EVENT_DURATION'], ring_duration)
+        self.event_capture = EventCapture(
+            int(CONFIG['PRE_TRIGGER'] * CONFIG['SAMPLE_RATE']),
+            int(CONFIG['POST_TRIGGER'] * CONFIG['SAMPLE_RATE']),
+            int(max_event * CONFIG['SAMPLE_RATE'])
+        )
         self.last_debug_time = 0
-        self.audio_levels = []  # Store recent audio levels for debugging
+        # Store recent audio levels for debugging in a fixed ring
+        self.audio_levels = np.full(CONFIG['AUDIO_LEVEL_HISTORY'], np.nan)
+        self.audio_level_index = 0
+        self.last_threshold = CONFIG['DETECTION_THRESHOLD']
+
+        # Detection runs on a decimated envelope; the ring keeps full-rate audio
+        self.envelope = EnvelopeFrontEnd(
+            CONFIG['BUFFER_SIZE'],
+            CONFIG['CHANNELS'],
+            self.sample_dtype,
+            hop=CONFIG['ENVELOPE_HOP'],
+            window=CONFIG['TRIGGER_WINDOW_FRAMES']
+        )
+
+        # Adaptive detection tracks the noise floor instead of using a fixed threshold
+        self.noise_floor = None
+        if CONFIG['DETECTOR'] == 'adaptive':
+            blocks_per_second = CONFIG['SAMPLE_RATE'] / CONFIG['BUFFER_SIZE']
+            self.noise_floor = NoiseFloorTracker(
+                int(CONFIG['NOISE_FLOOR_WINDOW'] * blocks_per_second / CONFIG['NOISE_FLOOR_DECIMATION']),
+                CONFIG['NOISE_FLOOR_PERCENTILE'],
+                CONFIG['ADAPTIVE_MARGIN_DB'],
+                CONFIG['ADAPTIVE_MIN_DB'],
+                CONFIG['DETECTION_THRESHOLD'],
+                decimation=CONFIG['NOISE_FLOOR_DECIMATION']
+            )
+        self.rejected_triggers = 0
+
+        # Reloaded settings wait here until the block path swaps them in between two blocks
+        self.config_updates = collections.deque()
+        self.config_reload_requested = False
+        self.config_signature = self.config_file_signature()
+        self.config_reloads = 0
+        self.config_rejections = 0
+
+        # Blocks handed from the audio callback to the analysis thread
+        self.block_ring = BlockRing(
+            CONFIG['ANALYSIS_RING_BLOCKS'],
+            CONFIG['BUFFER_SIZE'],
+            CONFIG['CHANNELS'],
+            self.sample_dtype
+        )
+        self.callback_status_count = 0
+        self.last_callback_status = None
+
+        # Pipeline metrics; hot-path counters are preallocated
+        block_budget = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE']
+        self.callback_latency = LatencyHistogram([block_budget * f for f in (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)])
+        self.status_counts = np.zeros(2, dtype=np.int64)  # input overflows, input underflows
+        self.save_latency = LatencyHistogram([0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0])
+        self.encode_latency = LatencyHistogram([0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5])
+        self.arrival_latency = LatencyHistogram([0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.05])
+        self.metrics_file = None
+        if CONFIG['METRICS_FILE']:
+            self.metrics_file = MetricsFile(CONFIG['METRICS_FILE'], CONFIG['METRICS_INTERVAL'], self.collect_metrics)
+        self.analysis_lag = 0.0
+        self.max_analysis_lag = 0.0
+
+        # Startup-to-armed time counts from process start, so imports are included
+        self.process_started = psutil.Process().create_time()
+        self.armed_at = None
+        self.startup_seconds = None
+        self.microphone_ok = None
+
+        # Stream supervision: the callback's heartbeat, and the gaps reopening the stream leaves
+        self.stream_gaps = StreamGaps()
+        self.heartbeat_ns = 0
+        self.next_block_time = None
+        self.stream_resumed = False
+        self.outage_started = None
+        self.stream_failures = 0
+        self.stream_reopens = 0
+        self.dropped_blocks = 0         # Blocks discarded for a callback status, recorded as gaps
+        self.dropped_block_frames = 0   # Callback-thread mode: their frames, until the next block takes them
+        self.recovery_latency = LatencyHistogram([0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0])
+
+        # Arrival delays between channels, worked out on the writer thread
+        self.arrival = None
+        if CONFIG['ARRIVAL_ANALYSIS']:
+            self.arrival = ArrivalEstimator(CONFIG['ARRIVAL_WINDOW'], CONFIG['CHANNELS'],
+                                            math.ceil(CONFIG['ARRIVAL_MAX_DELAY'] * CONFIG['SAMPLE_RATE']),
+                                            CONFIG['ARRIVAL_BATCH'])
+
+        # Continuous recording of the whole stream, alongside the events
+        self.blackbox = self.create_blackbox()
+
+        # Number new files after everything already catalogued or spooled
+        self.file_counter = self.next_file_number()
         
-    def setup_logging(self):
-        """Configure logging to both file and stdout"""
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
+    def create_capture_ring(self, duration):
+        """The ring blocks are captured into (multi-device mode puts it in shared memory)"""
+        return CircularBuffer(duration, CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'], self.sample_dtype)
+
+    def ring_for(self, event):
+        """Capture ring holding an event's audio"""
+        return self.buffer
+
+    def create_blackbox(self):
+        """Black box recorder fed from the capture ring, or None if continuous recording is off"""
+        if not CONFIG['BLACKBOX']:
+            return None
+        segment_frames = int(CONFIG['BLACKBOX_SEGMENT_SECONDS'] * CONFIG['SAMPLE_RATE'])
+        count = max(2, math.ceil(CONFIG['BLACKBOX_HOURS'] * 3600 / CONFIG['BLACKBOX_SEGMENT_SECONDS']))
+        blackbox = BlackBoxRecorder(CONFIG['BLACKBOX_DIR'], self.buffer, segment_frames, count,
+                                    CONFIG['SAMPLE_RATE'], CONFIG['BLACKBOX_FLUSH_INTERVAL'], self.stream_gaps)
+        self.logger.info(f"📼 Black box: {count} x {CONFIG['BLACKBOX_SEGMENT_SECONDS']}s segments in "
+                         f"{CONFIG['BLACKBOX_DIR']}, starting at segment {blackbox.first_sequence}")
+        return blackbox
+
+    def setup_storage(self, verify_mount=True):
+        """Build the USB side: mount watcher, catalog, retention, spool and encoder pool"""
+        self.mount_watcher = MountWatcher(
+            self.usb_mount_path,
+            on_change=self.usb_mount_changed,
+            mountinfo_file=CONFIG['MOUNTINFO_FILE'],
+            poll_interval=CONFIG['MOUNT_POLL_INTERVAL']
         )
+
+        # Verify USB mount before starting (offline replay writes to a plain directory)
+        if verify_mount and not self.verify_usb_mount():
+            self.logger.error(f"USB drive not properly mounted at {self.usb_mount_path}. Please run ./mount_usb_only.sh or mount manually.")
+            raise RuntimeError("USB drive not mounted")
+
+        # Indexed record of every event on the USB drive, filled in as the spool migrates
+        self.catalog = EventCatalog()
+
+        # Sharded layout on the USB drive, kept within its byte budget, age limit and free space
+        max_age = CONFIG['RETENTION_MAX_AGE_DAYS']
+        self.storage = StorageManager(
+            lambda: self.usb_path,
+            self.catalog,
+            layout=CONFIG['SHARD_LAYOUT'],
+            max_bytes=CONFIG['RETENTION_MAX_BYTES'],
+            max_age=max_age * 86400 if max_age is not None else None,
+            min_free_bytes=CONFIG['RETENTION_MIN_FREE_BYTES'],
+            interval=CONFIG['RETENTION_INTERVAL'],
+            resync_interval=CONFIG['RETENTION_RESYNC_INTERVAL']
+        )
+
+        # Events are spooled locally and moved to the USB drive in the background
+        self.spool = SpoolStore(
+            CONFIG['SPOOL_DIR'],
+            CONFIG['SPOOL_MAX_BYTES'],
+            self.usb_gunshot_dir,
+            drop_policy=CONFIG['SPOOL_DROP_POLICY'],
+            fsync_batch=CONFIG['SPOOL_FSYNC_BATCH'],
+            fsync_interval=CONFIG['SPOOL_FSYNC_INTERVAL'],
+            on_migrated=self.catalog_migrated,
+            companion_suffixes=(SIDECAR_SUFFIX,),
+            shard=self.storage.shard,
+            reserve=self.storage.reserve
+        )
+        if self.spool.pending_files():
+            self.logger.info(f"💾 {self.spool.pending_files()} spooled events from a previous run will be moved to USB")
+
+        # Optional background FLAC encoding, WAV otherwise
+        self.encoder = None
+        self.encoded_events = 0
+        if CONFIG['OUTPUT_FORMAT'] == 'flac':
+            if soundfile is None:
+                self.logger.warning("FLAC output needs the soundfile package, saving WAV instead")
+            else:
+                self.encoder = EventEncoder(CONFIG['ENCODER_WORKERS'], CONFIG['MAX_PENDING_ENCODES'])
+
+    def setup_logging(self):
+        """Configure logging to both file and stdout through a background writer thread"""
+        if CONFIG['LOG_FORMAT'] == 'json':
+            formatter = JsonLinesFormatter()
+        else:
+            formatter = logging.Formatter(
+                '%(asctime)s - %(levelname)s - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
         
         # File handler
         file_handler = logging.FileHandler(CONFIG['LOG_FILE'])
@@ -141,62 +2146,87 @@ class GunshotLogger:
         # Setup logger
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        for handler in list(self.logger.handlers):
+            # Replace the handlers of a previous instance in this process
+            self.logger.removeHandler(handler)
+            handler.close()
 
-    def rate_limited_log(self, level, message, error_key=None):
-        """Rate-limited logging to prevent log spam"""
-        current_time = time.time()
-        if error_key not in self.error_counts:
-            self.error_counts[error_key] = {'count': 0, 'last_time': 0}
-        
-        if current_time - self.error_counts[error_key]['last_time'] > CONFIG['ERROR_COOLDOWN']:
-            count = self.error_counts[error_key]['count']
-            if count > 1:
-                message = f"{message} (occurred {count} times)"
-            if level == 'error':
-                self.logger.error(message)
-            elif level == 'warning':
-                self.logger.warning(message)
+        # Callers only enqueue; the writer thread does the formatting and writes
+        self.log_handler = LogQueueHandler(CONFIG['LOG_QUEUE_SIZE'], file_handler, console_handler)
+        self.logger.addHandler(self.log_handler)
+        self.log_handler.start_writer()
+        self.rate_limiter = RateLimiter(CONFIG['RATE_LIMIT_SLOTS'], CONFIG['ERROR_COOLDOWN'])
+
+    def rate_limited_log(self, level, message, error_key=None, *args):
+        """Rate-limited logging to prevent log spam
+
+        args are %-style arguments for message, formatted on the log writer thread.
+        """
+        should_log, count = self.rate_limiter.check(error_key, time.time())
+        if not should_log:
+            return
+        if count > 1:
+            if args:
+                message += " (occurred %d times)"
+                args += (count,)
             else:
-                self.logger.info(message)
-            self.error_counts[error_key] = {'count': 0, 'last_time': current_time}
+                message = f"{message} (occurred {count} times)"
+        if level == 'error':
+            self.logger.error(message, *args)
+        elif level == 'warning':
+            self.logger.warning(message, *args)
         else:
-            self.error_counts[error_key]['count'] += 1
+            self.logger.info(message, *args)
 
-    def load_state(self):
-        """Load the last used file counter"""
-        try:
-            with open(CONFIG['STATE_FILE'], 'r') as f:
-                state = json.load(f)
-                return state.get('file_counter', 1)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return 1
-        except Exception as e:
-            self.rate_limited_log('error', f"Failed to load state: {e}", 'load_state')
-            return 1
+    def next_file_number(self):
+        """Number for the next saved event, after everything in the catalog and spool"""
+        numbers = [file_number(name) or 0 for name in self.spool.file_names()]
+        if self.usb_path:
+            try:
+                self.catalog.open(self.usb_path / CATALOG_FILE)
+                catalogued = self.catalog.max_number()
+                if catalogued is None:
+                    # No catalog yet, so fall back to the files already on the drive
+                    usb_dir = self.usb_path / CONFIG['GUNSHOT_DIR']
+                    if usb_dir.is_dir():
+                        numbers.extend(file_number(p) or 0 for p in usb_dir.rglob('gunshot_*'))
+                else:
+                    numbers.append(catalogued)
+            except Exception as e:
+                self.rate_limited_log('error', f"Failed to read event catalog: {e}", 'catalog')
+        return max(numbers, default=0) + 1
 
-    def save_state(self):
-        """Save current file counter"""
+    def catalog_migrated(self, records):
+        """Spool callback: catalog a batch of events that just landed on the USB drive"""
+        self.storage.add(records)
+        rows = []
+        for path, size, metadata in records:
+            root = next(parent for parent in path.parents if parent.name == CONFIG['GUNSHOT_DIR']).parent
+            if metadata is None:
+                # Spooled before the catalog existed, so read what we can from the file
+                try:
+                    metadata = describe_audio_file(path)
+                except Exception as e:
+                    self.rate_limited_log('warning', f"Could not describe {path.name} for the catalog: {e}", 'catalog_describe')
+                    continue
+            row = dict(metadata)
+            row['file_path'] = str(path.relative_to(root))
+            row['file_size'] = size
+            rows.append(row)
         try:
-            with open(CONFIG['STATE_FILE'], 'w') as f:
-                json.dump({'file_counter': self.file_counter}, f)
+            self.catalog.open(root / CATALOG_FILE)
+            self.catalog.insert_many(rows)
         except Exception as e:
-            self.rate_limited_log('error', f"Failed to save state: {e}", 'save_state')
+            self.rate_limited_log('error', f"Failed to update event catalog: {e}", 'catalog')
 
     def verify_usb_mount(self):
         """Verify that USB drive is properly mounted and writable"""
         try:
-            import subprocess
-            import os
-            
             # Use the mount path that was set in __init__
             mount_point = str(self.usb_mount_path)
             
             # Check if mount point exists and is mounted
-            result = subprocess.run(['mountpoint', '-q', mount_point], 
-                                  capture_output=True, text=True)
-            if result.returncode != 0:
+            if not self.mount_watcher.is_mounted(mount_point):
                 self.logger.error(f"USB drive is not mounted at {mount_point}")
                 return False
             
@@ -217,108 +2247,258 @@ class GunshotLogger:
             return False
 
     def find_usb_drive(self):
-        """Find the USB drive mount point"""
-        try:
-            # Use the mount path that was set in __init__
-            mount_point = str(self.usb_mount_path)
-            
-            # Check if mount point exists and is mounted
-            result = subprocess.run(['mountpoint', '-q', mount_point], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
-                return Path(mount_point)
-            
-            # Fallback to checking all mounted media
-            for part in psutil.disk_partitions(all=False):
-                if part.mountpoint.startswith('/media/'):
-                    return Path(part.mountpoint)
-            
-            current_time = time.time()
-            if current_time - self.last_usb_log >= 60:
-                self.logger.warning("No USB drive found")
-                self.last_usb_log = current_time
-                
-        except Exception as e:
-            self.rate_limited_log('error', f"Failed to find USB drive: {e}", 'find_usb')
-        return None
+        """Find the USB drive mount point (cached by the mount watcher)"""
+        return self.mount_watcher.current_path
 
-    def calculate_db(self, audio_chunk):
-        """Calculate decibel level from audio chunk"""
-        try:
-            if len(audio_chunk) == 0:
-                return -np.inf
-            rms = np.sqrt(np.mean(np.square(audio_chunk)))
-            db = 20 * np.log10(rms + 1e-10)  # Add small value to avoid log(0)
-            return db
-        except Exception as e:
-            self.rate_limited_log('error', f"Error calculating dB: {e}", 'calc_db')
-            return -np.inf
+    def usb_mount_changed(self, path):
+        """Mount watcher callback: track the USB drive as it comes and goes"""
+        if not hasattr(self, 'usb_path'):
+            return
+        self.usb_path = path
+        self.storage.mount_changed()
+        if path is None:
+            self.catalog.close()
+            self.logger.warning("⚠️  USB drive removed - events will be spooled until it is back")
+        else:
+            self.logger.info(f"💾 USB drive mounted at {path}")
+            self.spool.wake()
+
+    def usb_gunshot_dir(self):
+        """Where spooled events go, or None while no USB drive is mounted"""
+        usb_path = self.usb_path
+        if not usb_path:
+            return None
+        return usb_path / CONFIG['GUNSHOT_DIR']
 
     def audio_callback(self, indata, frames, time_info, status):
         """Callback for audio stream processing"""
+        started = time.perf_counter_ns()
+        if status:
+            if status.input_overflow:
+                self.status_counts[0] += 1
+            if status.input_underflow:
+                self.status_counts[1] += 1
+        if not status or status.input_overflow:
+            # Heartbeat for the stream supervisor: a block that will be used
+            self.heartbeat_ns = started
+        self.handle_block(indata, time_info, status)
+        self.callback_latency.record(time.perf_counter_ns() - started)
+
+    def handle_block(self, indata, time_info, status):
+        """Callback body: buffer and analyse the block, or hand it to the analysis thread"""
+        if CONFIG['ANALYSIS_THREAD']:
+            self.enqueue_block(indata, time_info, status)
+            return
+
         if status:
             # If we get an overflow, try to recover by processing what we have
             if status.input_overflow:
-                self.rate_limited_log('warning', f"Audio callback status: {status}", 'audio_status')
+                self.rate_limited_log('warning', "Audio callback status: %s", 'audio_status', status)
                 # Still process the data we have
                 pass
             else:
-                self.rate_limited_log('warning', f"Audio callback status: {status}", 'audio_status')
+                self.rate_limited_log('warning', "Audio callback status: %s", 'audio_status', status)
+                self.dropped_blocks += 1
+                self.dropped_block_frames += len(indata)
                 return
-        
+
+        missed_frames, self.dropped_block_frames = self.dropped_block_frames, 0
+        self.process_block(indata, self.block_capture_time(time_info), missed_frames)
+
+    def block_capture_time(self, time_info):
+        """Wall-clock time at which the first frame of a block hit the ADC"""
+        now = time.time()
+        try:
+            adc_time = time_info.inputBufferAdcTime
+            if adc_time > 0:
+                return now - (time_info.currentTime - adc_time)
+        except AttributeError:
+            pass
+        # Some ALSA backends report no ADC timestamps
+        return now
+
+    def enqueue_block(self, indata, time_info, status):
+        """Callback-side work in analysis thread mode: copy the block and return"""
+        if status:
+            # Logging happens on the analysis thread, just remember what we saw
+            self.callback_status_count += 1
+            self.last_callback_status = status
+            if not status.input_overflow:
+                self.dropped_blocks += 1
+                self.block_ring.skip(len(indata))
+                return
+        self.block_ring.push(indata, time.monotonic(), self.block_capture_time(time_info))
+
+    def process_block(self, indata, capture_time=None, missed_frames=0):
+        """Buffer one block of audio and run level tracking and detection on it
+
+        missed_frames is the audio dropped just before this block, which is
+        recorded as a gap.
+        """
         try:
+            if capture_time is None:
+                capture_time = time.time()
+            if self.armed_at is None:
+                # First block into the ring: detection is live from here
+                self.armed_at = time.time()
+            if self.config_updates:
+                self.apply_settings(self.config_updates.popleft())
+            block_start = self.buffer.frames_written
+            if missed_frames:
+                self.record_dropped(block_start, missed_frames)
+            if self.stream_resumed:
+                self.record_gap(block_start, capture_time)
+            self.next_block_time = capture_time + len(indata) / CONFIG['SAMPLE_RATE']
+
             # Always write to circular buffer
-            # Use a copy to prevent any potential buffer overruns
-            self.buffer.write(indata.copy().flatten())
+            # The buffer copies the samples itself, so a flat view is enough
+            self.buffer.write(indata.reshape(-1))
 
-            # Calculate dB level for this chunk
-            db_level = self.calculate_db(indata)
-            
-            # Store audio level for debugging
-            self.audio_levels.append(db_level)
-            if len(self.audio_levels) > 100:  # Keep last 100 readings
-                self.audio_levels.pop(0)
-            
-            # Debug logging every few seconds
-            current_time = time.time()
-            if current_time - self.last_debug_time >= CONFIG['DEBUG_INTERVAL']:
-                if self.audio_levels:
-                    avg_level = sum(self.audio_levels) / len(self.audio_levels)
-                    max_level = max(self.audio_levels)
-                    min_level = min(self.audio_levels)
-                    self.logger.info(f"Audio levels - Current: {db_level:.1f}dB, Avg: {avg_level:.1f}dB, Max: {max_level:.1f}dB, Min: {min_level:.1f}dB, Threshold: {CONFIG['DETECTION_THRESHOLD']}dB")
-                self.last_debug_time = current_time
-
-            # State machine for detection
-            if self.detection_state == 'IDLE':
-                if db_level > CONFIG['DETECTION_THRESHOLD']:
-                    self.detection_state = 'TRIGGERED'
-                    self.trigger_time = time.time()
-                    self.logger.info(f"🎯 GUNSHOT DETECTED at {db_level:.1f} dB (threshold: {CONFIG['DETECTION_THRESHOLD']}dB)")
+            # Level of this block, and of the loudest trigger window ending in it
+            db_level = self.envelope.process(indata)
+            trigger_db = self.envelope.trigger_db
+
+            # The block is judged against the floor from before it
+            if self.noise_floor is None:
+                threshold = CONFIG['DETECTION_THRESHOLD']
+            else:
+                threshold = self.noise_floor.threshold_db
+                self.noise_floor.update(db_level)
             
-            elif self.detection_state == 'TRIGGERED':
-                # Wait for the configured delay after trigger to capture the full gunshot sound
-                # This ensures we get the initial impact and the reverberation
-                if time.time() - self.trigger_time >= CONFIG['CAPTURE_DELAY']:
-                    try:
-                        # Get the buffer data which should contain the gunshot
-                        buffer_data = self.buffer.get_buffer().copy()
-                        buffer_rms = np.sqrt(np.mean(np.square(buffer_data)))
-                        buffer_db = 20 * np.log10(buffer_rms + 1e-10)
-                        
-                        self.logger.info(
-                            f"💾 Capturing gunshot audio, buffer size: {len(buffer_data)}, "
-                            f"buffer RMS: {buffer_rms:.6f}, buffer dB: {buffer_db:.1f}"
-                        )
-                        
-                        # Use non-blocking put with timeout
-                        self.detection_queue.put_nowait((db_level, buffer_data))
-                    except queue.Full:
-                        self.rate_limited_log('warning', "Detection queue full, skipping detection", 'queue_full')
-                    self.detection_state = 'IDLE'
+            # Store audio level for debugging; the writer thread logs the summary
+            self.audio_levels[self.audio_level_index] = db_level
+            self.audio_level_index = (self.audio_level_index + 1) % len(self.audio_levels)
+            self.last_threshold = threshold
+
+            # Hand the open event over once its post-roll has been written
+            event = self.event_capture.poll(self.buffer.frames_written)
+            if event is not None:
+                self.detection_state = 'IDLE'
+                if not CONFIG['STREAM_EVENTS']:
+                    self.capture_event(event)
+
+            # Detection: anchor the trigger to the loudest frame of the block
+            if trigger_db > threshold:
+                peak_offset, peak = self.envelope.loudest_frame(indata)
+                min_crest = CONFIG['ADAPTIVE_MIN_CREST_DB']
+                if self.noise_floor is not None and min_crest is not None:
+                    # Impulses have a high peak-to-RMS ratio, steady noise does not
+                    if 20 * math.log10(peak + 1e-10) - trigger_db < min_crest:
+                        self.rejected_triggers += 1
+                        return
+                trigger_frame = block_start + peak_offset
+                trigger_time = capture_time + peak_offset / CONFIG['SAMPLE_RATE']
+                if self.event_capture.trigger(trigger_frame, trigger_db, trigger_time):
+                    self.detection_state = 'CAPTURING'
+                    self.logger.info("🎯 GUNSHOT DETECTED at %.1f dB (threshold: %.1fdB)", trigger_db, threshold)
+                    if CONFIG['STREAM_EVENTS']:
+                        # The writer follows the event while its post-roll arrives
+                        self.capture_event(self.event_capture.current)
                     
         except Exception as e:
-            self.rate_limited_log('error', f"Error in audio callback: {e}", 'audio_callback')
+            self.rate_limited_log('error', "Error in audio callback: %s", 'audio_callback', e)
+
+    def log_level_summary(self):
+        """Log recent audio levels and callback latency every DEBUG_INTERVAL (writer thread)"""
+        current_time = time.time()
+        if current_time - self.last_debug_time < CONFIG['DEBUG_INTERVAL']:
+            return
+        self.last_debug_time = current_time
+        levels = self.audio_levels[np.isfinite(self.audio_levels)]
+        if not len(levels):
+            return
+        current = self.audio_levels[(self.audio_level_index - 1) % len(self.audio_levels)]
+        floor = f"Noise floor: {self.noise_floor.floor_db:.1f}dB, " if self.noise_floor is not None else ""
+        self.logger.info(f"Audio levels - Current: {current:.1f}dB, Avg: {levels.mean():.1f}dB, "
+                         f"Max: {levels.max():.1f}dB, Min: {levels.min():.1f}dB, {floor}"
+                         f"Threshold: {self.last_threshold:.1f}dB, "
+                         f"callback p99 <= {self.callback_latency.quantile(0.99) * 1000:.2f}ms")
+
+    def record_gap(self, frame, capture_time):
+        """First block of a reopened stream: record the audio missed since the last block"""
+        self.stream_resumed = False
+        if self.outage_started is not None:
+            self.recovery_latency.record(int((time.monotonic() - self.outage_started) * 1e9))
+            self.outage_started = None
+        if self.next_block_time is None:
+            # Nothing was captured before the stream first opened, so nothing was missed
+            return
+        rate = CONFIG['SAMPLE_RATE']
+        gap = max(0, round((capture_time - self.next_block_time) * rate))
+        self.stream_gaps.add(frame, gap)
+        self.logger.warning("🩹 Audio stream resumed at frame %d, %d frames (%.2fs) missed", frame, gap, gap / rate)
+
+    def record_dropped(self, frame, frames):
+        """Record blocks dropped just before ring frame `frame` as a gap of their length"""
+        self.stream_gaps.add(frame, frames)
+        if self.next_block_time is not None:
+            # A reopen gap measured from the last block must not count these again
+            self.next_block_time += frames / CONFIG['SAMPLE_RATE']
+
+    def capture_event(self, event):
+        """Queue a finished event for saving; the audio stays in the capture ring"""
+        if self.blackbox is not None:
+            event.blackbox_frame = self.blackbox.position(event.start_frame)
+        try:
+            # A streamed event is queued as it opens; charge it for all it may grow to
+            self.detection_queue.put_nowait(event, self.event_frame_bound(event))
+            self.queued_events += 1
+            self.logger.info(
+                "💾 Capturing gunshot audio from frame %d (%.2fs%s, %d triggers)",
+                event.start_frame, event.num_frames / CONFIG['SAMPLE_RATE'],
+                '' if event.closed else ' so far', event.trigger_count
+            )
+        except queue.Full:
+            self.dropped_events += 1
+            self.rate_limited_log('warning', "Detection queue full, skipping detection", 'queue_full')
+
+    def drain_block_ring(self, max_blocks=None):
+        """Process pending blocks from the callback ring; returns the number processed"""
+        ring = self.block_ring
+        if max_blocks is None:
+            max_blocks = CONFIG['ANALYSIS_BATCH_BLOCKS']
+
+        count = min(ring.pending(), max_blocks)
+        for _ in range(count):
+            block, arrival_time, adc_time = ring.peek()
+            # How long this block waited between the callback and analysis
+            self.analysis_lag = time.monotonic() - arrival_time
+            if self.analysis_lag > self.max_analysis_lag:
+                self.max_analysis_lag = self.analysis_lag
+            self.process_block(block, adc_time, ring.missed())
+            ring.release()
+        return count
+
+    def analysis_worker(self):
+        """Analysis thread: drain the block ring and run detection off the audio thread"""
+        block_period = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE']
+        last_status_count = 0
+        last_dropped = 0
+        last_report_time = time.time()
+
+        while self.running:
+            try:
+                if self.drain_block_ring() == 0:
+                    time.sleep(block_period / 2)
+
+                if self.callback_status_count != last_status_count:
+                    last_status_count = self.callback_status_count
+                    self.rate_limited_log('warning', f"Audio callback status: {self.last_callback_status}", 'audio_status')
+
+                current_time = time.time()
+                if current_time - last_report_time >= CONFIG['DEBUG_INTERVAL']:
+                    dropped = self.block_ring.dropped
+                    self.logger.info(
+                        f"Analysis thread - lag: {self.analysis_lag * 1000:.1f}ms "
+                        f"(max {self.max_analysis_lag * 1000:.1f}ms), "
+                        f"pending blocks: {self.block_ring.pending()}, "
+                        f"dropped blocks: {dropped} (+{dropped - last_dropped})"
+                    )
+                    last_dropped = dropped
+                    self.max_analysis_lag = 0.0
+                    last_report_time = current_time
+            except Exception as e:
+                self.rate_limited_log('error', f"Analysis worker error: {e}", 'analysis_error')
 
     def validate_audio_data(self, audio_data):
         """Validate that audio data contains actual sound"""
@@ -326,84 +2506,437 @@ class GunshotLogger:
             if len(audio_data) == 0:
                 return False, "Empty audio data"
             
-            # Check if audio is all zeros (silent)
-            if np.all(audio_data == 0):
-                return False, "Audio data is all zeros (silent)"
-            
-            # Check RMS level
+            audio_data = audio_data / full_scale(audio_data.dtype)
             rms = np.sqrt(np.mean(np.square(audio_data)))
-            if rms < 1e-6:  # Very low RMS indicates essentially silent audio
-                return False, f"Audio RMS too low: {rms:.8f}"
-            
-            # Check dynamic range
             max_amp = np.max(np.abs(audio_data))
-            if max_amp < 1e-4:  # Very low amplitude
-                return False, f"Audio amplitude too low: {max_amp:.8f}"
-            
-            return True, f"Valid audio - RMS: {rms:.6f}, Max: {max_amp:.6f}"
+            return self.validate_audio_levels(rms, max_amp)
             
         except Exception as e:
             return False, f"Error validating audio: {e}"
 
-    def save_gunshot(self, audio_data, db_level):
-        """Save detected gunshot to file"""
-        if not self.usb_path:
-            self.rate_limited_log('error', "No USB drive found", 'no_usb')
-            return
+    def validate_audio_levels(self, rms, max_amp):
+        """Validate RMS and peak levels, e.g. accumulated while streaming a file"""
+        # Check if audio is all zeros (silent)
+        if max_amp == 0:
+            return False, "Audio data is all zeros (silent)"
+        
+        # Check RMS level
+        if rms < 1e-6:  # Very low RMS indicates essentially silent audio
+            return False, f"Audio RMS too low: {rms:.8f}"
+        
+        # Check dynamic range
+        if max_amp < 1e-4:  # Very low amplitude
+            return False, f"Audio amplitude too low: {max_amp:.8f}"
+        
+        return True, f"Valid audio - RMS: {rms:.6f}, Max: {max_amp:.6f}"
+
+    def stream_event(self, event, writer):
+        """Copy an event from the capture ring into writer, following it while it is open"""
+        block_period = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE']
+        chunk_frames = CONFIG['WRITE_CHUNK_FRAMES']
+        # Give up on an open event if no audio arrives for this long (e.g. the stream died)
+        stall_timeout = CONFIG['POST_TRIGGER'] + 2.0
+        position = event.start_frame
+        last_progress = time.monotonic()
+        ring = self.ring_for(event)
+
+        while True:
+            # Read closed before end_frame so a closed event's end is final
+            closed = event.closed
+            end_frame = min(event.end_frame, ring.frames_written)
+
+            while position < end_frame:
+                chunk_end = min(end_frame, position + chunk_frames)
+                ring.check_range(position)
+                for segment in ring.range_views(position, chunk_end):
+                    writer.write(segment)
+                # The audio thread may have lapped us during the conversion
+                ring.check_range(position)
+                position = chunk_end
+                last_progress = time.monotonic()
+
+            if closed and position >= event.end_frame:
+                return
+            if not self.running or time.monotonic() - last_progress > stall_timeout:
+                self.rate_limited_log('warning', "Event audio stopped arriving, saving what was captured", 'event_stall')
+                return
+            time.sleep(block_period)
+
+    def event_frame_bound(self, event):
+        """Most frames an event can hold; a streamed event keeps growing after it is queued"""
+        if event.closed:
+            return event.num_frames
+        return max(event.num_frames, self.event_capture.max_frames)
 
+    def save_gunshot(self, event):
+        """Save detected gunshot to the spool, streaming it from the capture ring"""
+        filepath = None
         try:
-            # Validate audio data first
-            is_valid, validation_msg = self.validate_audio_data(audio_data)
+            name = f"gunshot_{self.file_counter:03d}"
+            if event.device is not None:
+                name = f"{name}_{event.device}"
+            # Raw PCM size is an upper bound for FLAC too
+            max_frames = self.event_frame_bound(event)
+            if not self.spool.make_room(44 + max_frames * CONFIG['CHANNELS'] * 2):
+                self.rate_limited_log('error', "Spool full, dropping detection", 'spool_full')
+                return
+
+            if self.encoder is not None:
+                # Collect the event in memory and let the pool encode and write it
+                sink = PcmCollector(max_frames, CONFIG['CHANNELS'], CONFIG['WRITE_CHUNK_FRAMES'])
+                self.stream_event(event, sink)
+            else:
+                filepath = self.spool.path_for(f"{name}.wav")
+                sink = WavStreamWriter(filepath, CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'],
+                                       CONFIG['WRITE_CHUNK_FRAMES'])
+                with sink:
+                    self.stream_event(event, sink)
+
+            # Validate the levels gathered while writing
+            is_valid, validation_msg = self.validate_audio_levels(sink.rms(), sink.max_amplitude)
             if not is_valid:
+                if filepath is not None:
+                    filepath.unlink()
                 self.rate_limited_log('error', f"Invalid audio data: {validation_msg}", 'invalid_audio')
                 return
 
-            gunshot_dir = self.usb_path / CONFIG['GUNSHOT_DIR']
-            gunshot_dir.mkdir(exist_ok=True)
+            # One more pass over the audio just saved, while it is still in memory
+            audio = self.saved_audio(event, sink)
+            event.onsets = self.event_onsets(audio)
+            self.write_review_sidecar(name, audio)
 
-            filename = f"gunshot_{self.file_counter:03d}.wav"
-            filepath = gunshot_dir / filename
-
-            # Reshape audio data for stereo
-            if CONFIG['CHANNELS'] == 2:
-                # Ensure we have an even number of samples for stereo
-                if len(audio_data) % 2 != 0:
-                    audio_data = audio_data[:-1]  # Remove last sample if odd
-                audio_data = audio_data.reshape(-1, 2)
+            if self.encoder is not None:
+                audio = sink.samples()
+                self.encoder.submit(
+                    self.spool.path_for(f"{name}.flac"), audio, CONFIG['SAMPLE_RATE'],
+                    lambda future: self.finish_encoded_save(future, name, audio, event, sink, validation_msg)
+                )
             else:
-                audio_data = audio_data.reshape(-1, 1)
-
-            # Convert from float32 (-1.0 to 1.0) to int16 (-32768 to 32767)
-            # Apply proper scaling and clipping
-            audio_data = np.clip(audio_data, -1.0, 1.0)
-            audio_data = (audio_data * 32767).astype(np.int16)
-            
-            # Save as WAV file
-            wavfile.write(str(filepath), CONFIG['SAMPLE_RATE'], audio_data)
-            
-            # Log detection with additional info
-            self.logger.info(
-                f"gunshot_{self.file_counter:03d} saved with decibel reading of {db_level:.1f} dB, "
-                f"audio shape: {audio_data.shape}, max amplitude: {np.max(np.abs(audio_data))}, "
-                f"validation: {validation_msg}"
-            )
+                self.spool.add(filepath, self.event_metadata(name, event, sink))
+                self.log_saved_gunshot(name, event, sink, validation_msg)
             
             self.file_counter += 1
-            self.save_state()
             
+        except RangeOverwrittenError:
+            # Don't leave a truncated file behind
+            if filepath is not None:
+                filepath.unlink(missing_ok=True)
+            raise
         except Exception as e:
             self.rate_limited_log('error', f"Failed to save gunshot: {e}", 'save_gunshot')
 
+    def saved_audio(self, event, sink):
+        """(frames, channels) audio of the event just saved, or None if it is no longer in memory"""
+        if not (CONFIG['ONSET_ANALYSIS'] or CONFIG['REVIEW_SIDECARS']):
+            return None
+        if isinstance(sink, PcmCollector):
+            return sink.samples()
+        # The file was streamed out, but the capture ring still holds the event
+        try:
+            audio = self.ring_for(event).read_range(event.start_frame, event.start_frame + sink.frames_written)
+        except RangeOverwrittenError:
+            return None
+        return audio.reshape(-1, CONFIG['CHANNELS'])
+
+    def write_review_sidecar(self, name, audio):
+        """Write the waveform/spectrogram sidecar that moves to USB with the event"""
+        if not CONFIG['REVIEW_SIDECARS'] or audio is None:
+            return
+        try:
+            write_sidecar(self.spool.path_for(f"{name}{SIDECAR_SUFFIX}"), build_sidecar(audio, CONFIG['SAMPLE_RATE']))
+        except OSError as e:
+            self.rate_limited_log('warning', f"Could not write review sidecar: {e}", 'sidecar')
+
+    def event_onsets(self, audio):
+        """Report offsets in the audio just saved, or None if it is not available"""
+        if not CONFIG['ONSET_ANALYSIS'] or audio is None:
+            return None
+        return detect_onsets(audio, CONFIG['SAMPLE_RATE'], CONFIG['ONSET_HOP'], CONFIG['ONSET_RISE_DB'],
+                             CONFIG['ONSET_LOOKBACK'], CONFIG['ONSET_RANGE_DB'], CONFIG['ONSET_MIN_GAP'])
+
+    def event_metadata(self, name, event, sink):
+        """Catalog fields for a saved event, kept with it in the spool"""
+        sample_rate = CONFIG['SAMPLE_RATE']
+        # Time the stream missed (while being reopened) is not in the saved audio
+        gaps = self.stream_gaps
+        lead_frames = event.trigger_frame - event.start_frame + gaps.between(event.start_frame, event.trigger_frame)
+        return {
+            'number': file_number(name),
+            'trigger_time': event.trigger_time,
+            'trigger_frame': event.trigger_frame,
+            'start_time': event.trigger_time - lead_frames / sample_rate,
+            'duration': sink.frames_written / sample_rate,
+            'peak_db': float(event.peak_db),
+            'buffer_db': level_db(sink.rms()),
+            'trigger_count': event.trigger_count,
+            'channel_db': json.dumps([round(level_db(rms), 2) for rms in sink.channel_rms()]),
+            'sample_rate': sample_rate,
+            'channels': CONFIG['CHANNELS'],
+            'device': event.device,
+            'shot_count': len(event.onsets) if event.onsets is not None else None,
+            'onsets': json.dumps(event.onsets.tolist()) if event.onsets is not None else None,
+            'blackbox_frame': event.blackbox_frame,
+            'gap_frames': gaps.between(event.start_frame, event.start_frame + sink.frames_written - 1),
+            **self.arrival_metadata(event),
+        }
+
+    def arrival_metadata(self, event):
+        arrival = event.arrival or {}
+        tdoa = arrival.get('tdoa')
+        return {
+            'tdoa': json.dumps([round(delay, 7) for delay in tdoa]) if tdoa is not None else None,
+            'bearing': arrival.get('bearing'),
+            'lane': arrival.get('lane'),
+            'device_delay': arrival.get('device_delay'),
+        }
+
+    def log_saved_gunshot(self, name, event, sink, validation_msg):
+        """Log a saved detection with additional info"""
+        trigger_time = datetime.datetime.fromtimestamp(event.trigger_time)
+        self.logger.info(
+            f"{name} saved with decibel reading of {event.peak_db:.1f} dB, "
+            f"audio shape: ({sink.frames_written}, {CONFIG['CHANNELS']}), "
+            f"max amplitude: {int(sink.max_amplitude * 32767)}, "
+            f"validation: {validation_msg}, "
+            f"trigger at {trigger_time.isoformat(timespec='milliseconds')} "
+            f"(frame {event.trigger_frame}), {event.trigger_count} triggers"
+            f"{f', {len(event.onsets)} reports' if event.onsets is not None else ''}"
+            f"{self.arrival_summary(event.arrival)}"
+        )
+
+    def arrival_summary(self, arrival):
+        if not arrival:
+            return ""
+        text = ""
+        if arrival.get('tdoa'):
+            text += f", channel delay {arrival['tdoa'][0] * 1e6:.0f}us"
+        if arrival.get('bearing') is not None:
+            text += f", bearing {arrival['bearing']:.0f}°"
+        if arrival.get('lane') is not None:
+            text += f", lane {arrival['lane']}"
+        return text
+
+    def finish_encoded_save(self, future, name, audio, event, sink, validation_msg):
+        """Encoder pool callback: report the result, or fall back to WAV if encoding failed"""
+        try:
+            encoded_bytes, encode_seconds = future.result()
+            raw_bytes = 44 + audio.nbytes
+            self.encoded_events += 1
+            self.encode_latency.record(int(encode_seconds * 1e9))
+            self.logger.info(
+                f"{name}.flac encoded in {encode_seconds * 1000:.0f}ms, "
+                f"{encoded_bytes} bytes (compression ratio {raw_bytes / max(encoded_bytes, 1):.2f}x)"
+            )
+            self.spool.add(self.spool.path_for(f"{name}.flac"), self.event_metadata(name, event, sink))
+            self.log_saved_gunshot(f"{name}.flac", event, sink, validation_msg)
+        except Exception as e:
+            self.rate_limited_log('warning', f"FLAC encoding failed, saving as WAV instead: {e}", 'encode_failed')
+            try:
+                self.spool.path_for(f"{name}.flac").unlink(missing_ok=True)
+                with WavStreamWriter(self.spool.path_for(f"{name}.wav"), CONFIG['SAMPLE_RATE'],
+                                     CONFIG['CHANNELS']) as writer:
+                    writer.write(audio.reshape(-1))
+                self.spool.add(writer.path, self.event_metadata(name, event, sink))
+                self.log_saved_gunshot(f"{name}.wav", event, sink, validation_msg)
+            except Exception as e:
+                self.spool.path_for(f"{name}{SIDECAR_SUFFIX}").unlink(missing_ok=True)
+                self.rate_limited_log('error', f"Failed to save gunshot: {e}", 'save_gunshot')
+
+    def persist_event(self, event):
+        """Save a queued event straight from the capture ring"""
+        started = time.perf_counter_ns()
+        try:
+            self.save_gunshot(event)
+            self.save_latency.record(time.perf_counter_ns() - started)
+        except RangeOverwrittenError as e:
+            self.overwritten_events += 1
+            self.rate_limited_log(
+                'warning',
+                f"Detection lost, audio overwritten before it was saved ({self.overwritten_events} total): {e}",
+                'overwritten'
+            )
+        finally:
+            self.detection_queue.release(event)
+
+    def read_trigger_window(self, event, window):
+        """Copy of the (window, channels) frames around an event's trigger, or None if unavailable
+
+        Waits for the frames if the event is still being captured.
+        """
+        ring = self.ring_for(event)
+        start = max(event.trigger_frame - window // 2, 0)
+        if event.closed:
+            start = max(min(start, event.end_frame - window), 0)
+        end = start + window
+        block_period = CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE']
+        deadline = time.monotonic() + window / CONFIG['SAMPLE_RATE'] + 2.0
+        while ring.frames_written < end:
+            if (event.closed and event.end_frame < end) or not self.running or time.monotonic() > deadline:
+                return None
+            time.sleep(block_period)
+        try:
+            return ring.read_range(start, end).reshape(window, CONFIG['CHANNELS'])
+        except RangeOverwrittenError:
+            return None
+
+    def describe_arrival(self, delays):
+        """Arrival fields for an event from its inter-channel delays (seconds)"""
+        arrival = {'tdoa': [float(delay) for delay in delays], 'bearing': None, 'lane': None}
+        if CONFIG['MIC_SPACING'] and len(delays):
+            arrival['bearing'] = bearing_degrees(delays[0], CONFIG['MIC_SPACING'], CONFIG['SPEED_OF_SOUND'])
+            if CONFIG['LANE_BEARINGS']:
+                arrival['lane'] = nearest_lane(arrival['bearing'], CONFIG['LANE_BEARINGS'])
+        return arrival
+
+    def analyze_arrivals(self, events):
+        """Fill in arrival delays, bearing and lane for a batch of events (writer thread)"""
+        estimator = self.arrival
+        if estimator is None or not estimator.pairs:
+            return
+        try:
+            for chunk_start in range(0, len(events), len(estimator.windows)):
+                started = time.perf_counter_ns()
+                analyzed = []
+                for event in events[chunk_start:chunk_start + len(estimator.windows)]:
+                    audio = self.read_trigger_window(event, estimator.window)
+                    if audio is not None:
+                        estimator.windows[len(analyzed)] = audio
+                        analyzed.append(event)
+                if not analyzed:
+                    continue
+                delays = estimator.estimate(estimator.windows[:len(analyzed)]) / CONFIG['SAMPLE_RATE']
+                for event, event_delays in zip(analyzed, delays):
+                    event.arrival = self.describe_arrival(event_delays)
+                per_event = (time.perf_counter_ns() - started) // len(analyzed)
+                for _ in analyzed:
+                    self.arrival_latency.record(per_event)
+        except Exception as e:
+            self.rate_limited_log('warning', f"Arrival analysis failed: {e}", 'arrival')
+
+    def next_batch(self, event):
+        """The event just taken from the detection queue plus any others already waiting"""
+        batch = [event]
+        while len(batch) < CONFIG['ARRIVAL_BATCH']:
+            try:
+                batch.append(self.detection_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def collect_metrics(self):
+        """Prometheus text lines for the capture pipeline (runs on the metrics thread)"""
+        spool = self.spool
+        lines = []
+        lines += self.callback_latency.prometheus(
+            'gunshot_callback_seconds', "Time spent in the audio callback per block")
+        lines += prometheus_metric('gunshot_callback_budget_seconds', 'gauge', "Audio duration of one block",
+                                   CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE'])
+        lines += prometheus_metric('gunshot_input_overflows_total', 'counter', "Input overflows reported by the stream",
+                                   self.status_counts[0])
+        lines += prometheus_metric('gunshot_input_underflows_total', 'counter', "Input underflows reported by the stream",
+                                   self.status_counts[1])
+        lines += prometheus_metric('gunshot_analysis_dropped_blocks_total', 'counter',
+                                   "Blocks dropped because the analysis thread fell behind", self.block_ring.dropped)
+        lines += prometheus_metric('gunshot_analysis_pending_blocks', 'gauge',
+                                   "Blocks waiting for the analysis thread", self.block_ring.pending())
+        if self.noise_floor is not None:
+            lines += prometheus_metric('gunshot_noise_floor_db', 'gauge', "Adaptive detector noise floor",
+                                       self.noise_floor.floor_db)
+            lines += prometheus_metric('gunshot_detection_threshold_db', 'gauge', "Adaptive detector threshold",
+                                       self.noise_floor.threshold_db)
+            lines += prometheus_metric('gunshot_crest_rejected_total', 'counter',
+                                       "Blocks above threshold rejected by the crest factor check", self.rejected_triggers)
+        lines += prometheus_metric('gunshot_detections_total', 'counter', "Events queued for saving", self.queued_events)
+        lines += prometheus_metric('gunshot_detections_dropped_total', 'counter',
+                                   "Events dropped because the detection queue was full", self.dropped_events)
+        lines += prometheus_metric('gunshot_detections_overwritten_total', 'counter',
+                                   "Events whose audio was overwritten before it was saved", self.overwritten_events)
+        lines += prometheus_metric('gunshot_detection_queue_depth', 'gauge', "Events waiting to be saved",
+                                   self.detection_queue.qsize())
+        lines += prometheus_metric('gunshot_detection_queue_bytes', 'gauge',
+                                   "Audio bytes pinned by queued or saving events", self.detection_queue.pending_bytes)
+        lines += self.save_latency.prometheus(
+            'gunshot_save_seconds', "Time to write an event to the spool, including waiting for streamed post-roll")
+        lines += self.encode_latency.prometheus('gunshot_encode_seconds', "FLAC encode time per event")
+        lines += self.arrival_latency.prometheus('gunshot_arrival_seconds', "Arrival analysis CPU time per event")
+        lines += prometheus_metric('gunshot_spool_bytes', 'gauge', "Bytes waiting in the spool", spool.pending_bytes)
+        lines += prometheus_metric('gunshot_spool_files', 'gauge', "Events waiting in the spool", spool.pending_files())
+        lines += prometheus_metric('gunshot_spool_dropped_files_total', 'counter',
+                                   "Spooled events dropped because the spool was full", spool.dropped_files)
+        lines += prometheus_metric('gunshot_usb_written_files_total', 'counter', "Events moved to the USB drive",
+                                   spool.migrated_files)
+        lines += prometheus_metric('gunshot_usb_written_bytes_total', 'counter', "Bytes moved to the USB drive",
+                                   spool.migrated_bytes)
+        lines += prometheus_metric('gunshot_usb_write_seconds_total', 'counter',
+                                   "Time spent copying and syncing to the USB drive", spool.migrate_seconds)
+        storage = self.storage
+        lines += prometheus_metric('gunshot_usb_event_bytes', 'gauge', "Bytes of events on the USB drive",
+                                   storage.used_bytes)
+        if storage.free_bytes is not None:
+            lines += prometheus_metric('gunshot_usb_free_bytes', 'gauge', "Free space on the USB drive (tracked)",
+                                       storage.free_bytes)
+        lines += prometheus_metric('gunshot_usb_evicted_files_total', 'counter',
+                                   "Events deleted from the USB drive by retention", storage.evicted_files)
+        lines += prometheus_metric('gunshot_usb_evicted_bytes_total', 'counter',
+                                   "Bytes deleted from the USB drive by retention", storage.evicted_bytes)
+        if self.blackbox is not None:
+            lines += prometheus_metric('gunshot_blackbox_written_bytes_total', 'counter',
+                                       "Audio bytes flushed to the black box segments", self.blackbox.flushed_bytes)
+            lines += prometheus_metric('gunshot_blackbox_lost_frames_total', 'counter',
+                                       "Frames the black box fell too far behind to record", self.blackbox.lost_frames)
+        lines += prometheus_metric('gunshot_log_dropped_total', 'counter',
+                                   "Log records dropped because the log writer fell behind", self.log_handler.dropped)
+        if self.startup_seconds is not None:
+            lines += prometheus_metric('gunshot_startup_seconds', 'gauge',
+                                       "Time from process start to the first captured block", self.startup_seconds)
+        lines += prometheus_metric('gunshot_stream_failures_total', 'counter',
+                                   "Times the audio stream failed or stalled", self.stream_failures)
+        lines += prometheus_metric('gunshot_stream_reopens_total', 'counter',
+                                   "Times the audio stream was reopened in-process", self.stream_reopens)
+        lines += prometheus_metric('gunshot_stream_dropped_blocks_total', 'counter',
+                                   "Blocks discarded for a callback status, each recorded as a gap",
+                                   self.dropped_blocks)
+        lines += prometheus_metric('gunshot_stream_gaps_total', 'counter',
+                                   "Gaps in the captured audio left by reopening the stream or dropping blocks",
+                                   len(self.stream_gaps))
+        lines += prometheus_metric('gunshot_stream_gap_frames_total', 'counter',
+                                   "Frames missed while the audio stream was reopened or blocks were dropped",
+                                   self.stream_gaps.total)
+        lines += self.recovery_latency.prometheus(
+            'gunshot_stream_recovery_seconds', "Time from a stream failure to the first block of the reopened stream")
+        if self.microphone_ok is not None:
+            lines += prometheus_metric('gunshot_microphone_ok', 'gauge',
+                                       "Whether the live microphone check passed", int(self.microphone_ok))
+        lines += prometheus_metric('gunshot_config_reloads_total', 'counter',
+                                   "Config file reloads that changed settings", self.config_reloads)
+        lines += prometheus_metric('gunshot_config_rejected_total', 'counter',
+                                   "Config file reloads rejected with nothing applied", self.config_rejections)
+        lines += prometheus_metric('gunshot_usb_mounted', 'gauge', "Whether the USB drive is mounted",
+                                   1 if self.usb_path else 0)
+        return lines
+
     def detection_worker(self):
         """Worker thread to handle gunshot detections"""
+        load_deferred_modules()
         while self.running:
+            batch = []
             try:
-                db_level, audio_data = self.detection_queue.get(timeout=1)
-                self.save_gunshot(audio_data, db_level)
+                # Periodic summaries are built here, off the block path
+                self.log_level_summary()
+                batch = [self.detection_queue.get(timeout=1)]
+                # Events that piled up during rapid fire are analysed together
+                batch = self.next_batch(batch[0])
+                self.analyze_arrivals(batch)
+                for event in batch:
+                    self.persist_event(event)
             except queue.Empty:
                 continue
             except Exception as e:
                 self.rate_limited_log('error', f"Detection worker error: {e}", 'worker_error')
+            finally:
+                # Events a failure left unsaved must not pin the queue forever
+                for event in batch:
+                    self.detection_queue.release(event)
 
     def test_audio_capture(self):
         """Test method to verify audio capture is working with REAL microphone input"""
@@ -419,7 +2952,7 @@ class GunshotLogger:
             audio_data = sd.rec(test_samples, 
                                samplerate=CONFIG['SAMPLE_RATE'], 
                                channels=CONFIG['CHANNELS'], 
-                               dtype=np.float32)
+                               dtype=self.sample_dtype)
             sd.wait()  # Wait for recording to complete
             
             # Flatten the audio data
@@ -430,120 +2963,322 @@ class GunshotLogger:
             
             # Get buffer data
             buffer_data = self.buffer.get_buffer()
-            
-            # Calculate levels
-            rms = np.sqrt(np.mean(np.square(audio_data)))
-            db_level = 20 * np.log10(rms + 1e-10)
-            max_amp = np.max(np.abs(audio_data))
-            
-            # Validate
-            is_valid, validation_msg = self.validate_audio_data(buffer_data)
-            
-            self.logger.info(f"🎤 REAL Audio Test Results:")
-            self.logger.info(f"   - Audio RMS: {rms:.6f}")
-            self.logger.info(f"   - Audio dB: {db_level:.1f}dB")
-            self.logger.info(f"   - Max Amplitude: {max_amp:.6f}")
-            self.logger.info(f"   - Buffer Size: {len(buffer_data)}")
-            self.logger.info(f"   - Validation: {validation_msg}")
+            is_valid = self.report_audio_health(audio_data, "REAL Audio Test Results")
             
             # Save the test file to the USB drive
             try:
                 test_filename = "preliminary_test.wav"
                 test_filepath = self.usb_path / test_filename
 
-                # Reshape and convert to int16
-                audio_to_save = buffer_data.copy()
-                if CONFIG['CHANNELS'] == 2:
-                    if len(audio_to_save) % 2 != 0:
-                        audio_to_save = audio_to_save[:-1]
-                    audio_to_save = audio_to_save.reshape(-1, 2)
-                
-                audio_data_int16 = np.clip(audio_to_save, -1.0, 1.0)
-                audio_data_int16 = (audio_data_int16 * 32767).astype(np.int16)
-                
-                wavfile.write(str(test_filepath), CONFIG['SAMPLE_RATE'], audio_data_int16)
+                with WavStreamWriter(test_filepath, CONFIG['SAMPLE_RATE'], CONFIG['CHANNELS'],
+                                     CONFIG['WRITE_CHUNK_FRAMES']) as writer:
+                    writer.write(buffer_data)
                 self.logger.info(f"✅ Preliminary audio test saved to: {test_filepath}")
             except Exception as e:
                 self.logger.error(f"❌ Failed to save preliminary test file: {e}")
 
-            if db_level > -60:  # If we're getting any reasonable audio level
-                self.logger.info("✅ Microphone is working and picking up sound!")
-            else:
-                self.logger.warning("⚠️  Microphone levels are very low - check microphone connection")
-            
             return is_valid
             
         except Exception as e:
             self.logger.error(f"❌ Audio capture test failed: {e}")
             return False
 
-    def start(self):
-        """Start the gunshot logger"""
+    def report_audio_health(self, audio_data, title):
+        """Log levels and validation of a stretch of microphone audio; returns whether it is valid"""
+        # Calculate levels relative to full scale
+        levels = audio_data / full_scale(audio_data.dtype)
+        rms = np.sqrt(np.mean(np.square(levels)))
+        db_level = 20 * np.log10(rms + 1e-10)
+        max_amp = np.max(np.abs(levels))
+        is_valid, validation_msg = self.validate_audio_levels(rms, max_amp)
+
+        self.logger.info(f"🎤 {title}:")
+        self.logger.info(f"   - Audio RMS: {rms:.6f}")
+        self.logger.info(f"   - Audio dB: {db_level:.1f}dB")
+        self.logger.info(f"   - Max Amplitude: {max_amp:.6f}")
+        self.logger.info(f"   - Buffer Size: {len(audio_data)}")
+        self.logger.info(f"   - Validation: {validation_msg}")
+
+        if db_level > -60:  # If we're getting any reasonable audio level
+            self.logger.info("✅ Microphone is working and picking up sound!")
+        else:
+            self.logger.warning("⚠️  Microphone levels are very low - check microphone connection")
+        return is_valid
+
+    def check_startup(self):
+        """Report arming and, in fast start mode, check the microphone on the first live audio
+
+        Runs from the loop that keeps the stream open, never from the audio callback.
+        """
+        if self.startup_seconds is None and self.armed_at is not None:
+            self.startup_seconds = self.armed_at - self.process_started
+            self.logger.info(f"🟢 Armed {self.startup_seconds:.2f}s after process start")
+
+        check_frames = int(CONFIG['HEALTH_CHECK_SECONDS'] * CONFIG['SAMPLE_RATE'])
+        if (CONFIG['FAST_START'] and self.microphone_ok is None
+                and self.buffer.frames_written >= check_frames):
+            # Whatever the ring still holds of the stream's first seconds
+            audio_data = self.buffer.read_frames(0, check_frames)
+            self.microphone_ok = self.report_audio_health(audio_data, "Live microphone check")
+            if self.microphone_ok:
+                self.logger.info("✅ Live microphone check passed")
+            else:
+                self.logger.warning("⚠️  Live microphone check failed - check audio configuration")
+
+    def config_file_signature(self):
+        """(mtime, size, inode) of the config file, or None if there is none"""
+        if not CONFIG['CONFIG_FILE']:
+            return None
         try:
-            self.running = True
-            
-            # Show current audio devices more robustly
-            self.logger.info("🔊 Available audio devices:")
+            st = os.stat(CONFIG['CONFIG_FILE'])
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def request_config_reload(self, signum=None, frame=None):
+        """SIGHUP handler: only sets a flag, the reload runs from check_config_reload()"""
+        self.config_reload_requested = True
+
+    def check_config_reload(self):
+        """Reload the config file after SIGHUP or when it changed on disk
+
+        Runs from the loop that keeps the stream open, never from the audio callback.
+        """
+        signature = self.config_file_signature()
+        if not self.config_reload_requested and signature == self.config_signature:
+            return
+        self.config_reload_requested = False
+        self.config_signature = signature
+        if signature is None:
+            self.logger.warning(f"⚠️  Config file {CONFIG['CONFIG_FILE']} is gone, keeping the current settings")
+            return
+        self.reload_config()
+
+    def file_settings(self):
+        """The config file's settings this process takes"""
+        return read_config_file(CONFIG['CONFIG_FILE'])
+
+    def reload_config(self):
+        """Read the config file and queue its changes for the block path; all or nothing
+
+        Returns the changed settings, or None if the file was rejected.
+        """
+        try:
+            changes = reload_changes(self.file_settings())
+        except ConfigError as e:
+            self.config_rejections += 1
+            self.logger.error(f"❌ Config reload rejected: {e}")
+            return None
+        if changes:
+            self.config_updates.append(changes)
+            self.config_reloads += 1
+        else:
+            self.logger.info(f"🔄 Config file {CONFIG['CONFIG_FILE']} reloaded, no settings changed")
+        return changes
+
+    def apply_settings(self, changes):
+        """Swap reloaded settings in; called from the block path between two blocks"""
+        CONFIG.update(changes)
+        rate = CONFIG['SAMPLE_RATE']
+        ring_duration = max(CONFIG['BUFFER_DURATION'], CONFIG['CAPTURE_RING_DURATION'])
+        capture = self.event_capture
+        capture.pre_frames = int(CONFIG['PRE_TRIGGER'] * rate)
+        capture.post_frames = int(CONFIG['POST_TRIGGER'] * rate)
+        capture.max_frames = max(int(min(CONFIG['MAX_EVENT_DURATION'], ring_duration) * rate), capture.post_frames + 1)
+        if self.noise_floor is not None:
+            self.noise_floor.margin_db = CONFIG['ADAPTIVE_MARGIN_DB']
+            self.noise_floor.min_db = CONFIG['ADAPTIVE_MIN_DB']
+            if np.isnan(self.noise_floor.floor_db):
+                self.noise_floor.threshold_db = CONFIG['DETECTION_THRESHOLD']
+            else:
+                self.noise_floor.threshold_db = max(self.noise_floor.floor_db + CONFIG['ADAPTIVE_MARGIN_DB'],
+                                                    CONFIG['ADAPTIVE_MIN_DB'])
+        self.rate_limiter.cooldown = CONFIG['ERROR_COOLDOWN']
+        if self.storage is not None:
+            max_age = CONFIG['RETENTION_MAX_AGE_DAYS']
+            self.storage.max_bytes = CONFIG['RETENTION_MAX_BYTES']
+            self.storage.max_age = max_age * 86400 if max_age is not None else None
+            self.storage.min_free_bytes = CONFIG['RETENTION_MIN_FREE_BYTES']
+        self.logger.info("🔄 Config reloaded: " + ", ".join(f"{key}={value}" for key, value in sorted(changes.items())))
+
+    def log_audio_devices(self):
+        """Log the input devices PortAudio knows about and the default one"""
+        # Show current audio devices more robustly
+        self.logger.info("🔊 Available audio devices:")
+        try:
+            devices = sd.query_devices()
+            if not isinstance(devices, list): # Handles case where only one device is returned as a dict
+                devices = [devices]
+            for i, device in enumerate(devices):
+                try:
+                    # Log details for devices that have inputs
+                    if device.get('max_input_channels', 0) > 0:
+                         self.logger.info(f"   - Device {i}: {device['name']} (inputs: {device['max_input_channels']})")
+                except Exception:
+                    self.logger.warning(f"   - Could not fully query Device {i}: {device.get('name', 'Unknown')}")
+        except Exception as e:
+            self.logger.warning(f"Could not query any audio devices: {e}")
+
+        # Show default device
+        try:
+            default_device = sd.query_devices(kind='input')
+            self.logger.info(f"🎤 Using default input device: {default_device['name']}")
+        except Exception as e:
+            self.logger.warning(f"Could not get default device: {e}")
+
+    def open_input_stream(self, reopen=False):
+        """The capture stream on the default device; started by entering it"""
+        if reopen:
+            # Reinitialise PortAudio so a device that dropped off and came back is found again
             try:
-                devices = sd.query_devices()
-                if not isinstance(devices, list): # Handles case where only one device is returned as a dict
-                    devices = [devices]
-                for i, device in enumerate(devices):
-                    try:
-                        # Log details for devices that have inputs
-                        if device.get('max_input_channels', 0) > 0:
-                             self.logger.info(f"   - Device {i}: {device['name']} (inputs: {device['max_input_channels']})")
-                    except Exception:
-                        self.logger.warning(f"   - Could not fully query Device {i}: {device.get('name', 'Unknown')}")
+                sd._terminate()
+                sd._initialize()
             except Exception as e:
-                self.logger.warning(f"Could not query any audio devices: {e}")
+                self.rate_limited_log('warning', f"Could not reinitialise PortAudio: {e}", 'portaudio_reinit')
+
+        # Configure sounddevice settings
+        sd.default.blocksize = CONFIG['BUFFER_SIZE']
+        sd.default.latency = CONFIG['LATENCY']
+        
+        # Start audio stream with improved parameters - use default device
+        stream = sd.InputStream(
+            channels=CONFIG['CHANNELS'],
+            samplerate=CONFIG['SAMPLE_RATE'],
+            blocksize=CONFIG['BUFFER_SIZE'],
+            latency=CONFIG['LATENCY'],
+            callback=self.audio_callback,
+            dtype=CONFIG['SAMPLE_FORMAT']
+        )
+        # Configure device-specific settings if needed
+        if hasattr(stream, '_streaminfo'):
+            stream._streaminfo.suggestedLatency = 0.2
+        return stream
+
+    def log_stream_started(self):
+        self.logger.info(f"🎯 Gunshot logger started! Monitoring for sounds above {CONFIG['DETECTION_THRESHOLD']}dB")
+        self.logger.info(f"   Buffer size: {CONFIG['BUFFER_SIZE']}")
+        self.logger.info(f"   Sample rate: {CONFIG['SAMPLE_RATE']}Hz")
+        self.logger.info(f"   Channels: {CONFIG['CHANNELS']}")
+        self.logger.info(f"   Sample format: {CONFIG['SAMPLE_FORMAT']}")
+        self.logger.info(f"   Analysis: {'separate thread' if CONFIG['ANALYSIS_THREAD'] else 'in audio callback'}")
+        if self.noise_floor is not None:
+            self.logger.info(f"   Detector: adaptive, {CONFIG['ADAPTIVE_MARGIN_DB']}dB above the noise floor "
+                             f"(threshold {CONFIG['DETECTION_THRESHOLD']}dB until the floor is known)")
+        self.logger.info("   Make some noise to test detection!")
+
+    def stream_stalled(self, stream, opened_ns):
+        """Why an open stream has to be reopened, or None while it delivers audio"""
+        if not stream.active:
+            return "stream stopped"
+        silent = (time.perf_counter_ns() - max(self.heartbeat_ns, opened_ns)) / 1e9
+        if silent > CONFIG['STREAM_STALL_SECONDS']:
+            return f"no usable audio for {silent:.1f}s"
+        return None
+
+    def run_stream(self):
+        """Keep the capture stream open while running, reopening it in-process if it fails or stalls
 
-            # Show default device
+        The capture ring, the detection queue and the writer carry on across
+        a reopen; the first block of the new stream records the audio missed
+        in between as a gap. Waits between failed attempts back off from
+        STREAM_RETRY_INTERVAL to STREAM_RETRY_MAX.
+        """
+        retry = CONFIG['STREAM_RETRY_INTERVAL']
+        started = False
+        while self.running:
+            opened_ns = time.perf_counter_ns()
             try:
-                default_device = sd.query_devices(kind='input')
-                self.logger.info(f"🎤 Using default input device: {default_device['name']}")
+                with self.open_input_stream(reopen=self.outage_started is not None) as stream:
+                    if not started:
+                        started = True
+                        self.log_stream_started()
+                    else:
+                        self.stream_reopens += 1
+                        self.logger.info(f"🔁 Audio stream reopened ({self.stream_reopens} reopens so far)")
+                    reason = None
+                    # USB plug/unplug is tracked by the mount watcher, no polling needed here
+                    while self.running and reason is None:
+                        self.check_startup()
+                        self.check_config_reload()
+                        time.sleep(min(1.0, CONFIG['STREAM_STALL_SECONDS'] / 4))
+                        reason = self.stream_stalled(stream, opened_ns)
             except Exception as e:
-                self.logger.warning(f"Could not get default device: {e}")
-            
-            # Run audio capture test
-            self.logger.info("Running REAL audio capture test...")
-            if self.test_audio_capture():
-                self.logger.info("✅ Audio capture test passed")
+                reason = f"stream error: {e}"
+            if not self.running:
+                break
+
+            if self.heartbeat_ns > opened_ns:
+                # The stream delivered audio before failing, so start backing off afresh
+                retry = CONFIG['STREAM_RETRY_INTERVAL']
+            if self.outage_started is None:
+                self.outage_started = time.monotonic()
+            self.stream_failures += 1
+            self.rate_limited_log('error', f"❌ Audio stream failed ({reason}), reopening in {retry:g}s", 'stream_failed')
+            self.wait_for_analysis()
+            # The next block processed is the first of the new stream
+            self.stream_resumed = True
+            time.sleep(retry)
+            retry = min(retry * 2, CONFIG['STREAM_RETRY_MAX'])
+
+    def wait_for_analysis(self, timeout=1.0):
+        """Let the analysis thread finish the blocks a closed stream left in the block ring"""
+        deadline = time.monotonic() + timeout
+        while CONFIG['ANALYSIS_THREAD'] and self.block_ring.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def start(self):
+        """Start the gunshot logger"""
+        try:
+            if sd is None:
+                raise RuntimeError("sounddevice/PortAudio is not available")
+
+            self.running = True
+
+            if CONFIG['FAST_START']:
+                # Every second before the stream opens is a second of shots missed after a restart;
+                # the microphone is checked on the first live audio instead
+                self.logger.info(f"⚡ Fast start: microphone check runs on the first "
+                                 f"{CONFIG['HEALTH_CHECK_SECONDS']:g}s of live audio")
             else:
-                self.logger.warning("⚠️  Audio capture test failed - check audio configuration")
+                self.log_audio_devices()
+
+                # Run audio capture test
+                self.logger.info("Running REAL audio capture test...")
+                if self.test_audio_capture():
+                    self.logger.info("✅ Audio capture test passed")
+                else:
+                    self.logger.warning("⚠️  Audio capture test failed - check audio configuration")
             
+            # Watch the mount table for USB plug/unplug
+            self.mount_watcher.start()
+
+            # Move spooled events to USB in the background
+            self.spool.start()
+
+            # Keep the USB drive within its retention limits in the background
+            self.storage.start()
+
+            # Copy the stream to the black box segments in the background
+            if self.blackbox is not None:
+                self.blackbox.start()
+
+            # Publish pipeline metrics from their own thread
+            if self.metrics_file is not None:
+                self.metrics_file.start()
+
             # Start detection worker thread
             self.worker_thread = threading.Thread(target=self.detection_worker)
             self.worker_thread.daemon = True  # Make thread daemon so it exits when main thread exits
             self.worker_thread.start()
 
-            # Configure sounddevice settings
-            sd.default.blocksize = CONFIG['BUFFER_SIZE']
-            sd.default.latency = CONFIG['LATENCY']
-            
-            # Start audio stream with improved parameters - use default device
-            with sd.InputStream(
-                channels=CONFIG['CHANNELS'],
-                samplerate=CONFIG['SAMPLE_RATE'],
-                blocksize=CONFIG['BUFFER_SIZE'],
-                latency=CONFIG['LATENCY'],
-                callback=self.audio_callback,
-                dtype=np.float32
-            ) as stream:
-                # Configure device-specific settings if needed
-                if hasattr(stream, '_streaminfo'):
-                    stream._streaminfo.suggestedLatency = 0.2
-                
-                self.logger.info(f"🎯 Gunshot logger started! Monitoring for sounds above {CONFIG['DETECTION_THRESHOLD']}dB")
-                self.logger.info(f"   Buffer size: {CONFIG['BUFFER_SIZE']}")
-                self.logger.info(f"   Sample rate: {CONFIG['SAMPLE_RATE']}Hz")
-                self.logger.info(f"   Channels: {CONFIG['CHANNELS']}")
-                self.logger.info("   Make some noise to test detection!")
-                
-                while self.running:
-                    time.sleep(1)
-                    # Periodically check USB drive
-                    self.usb_path = self.find_usb_drive()
+            # Start analysis thread so the audio callback only copies blocks
+            if CONFIG['ANALYSIS_THREAD']:
+                self.analysis_thread = threading.Thread(target=self.analysis_worker)
+                self.analysis_thread.daemon = True
+                self.analysis_thread.start()
+
+            # Keep the audio stream open, reopening it in place if it fails or stalls
+            self.run_stream()
 
         except Exception as e:
             self.logger.error(f"❌ Failed to start gunshot logger: {e}")
@@ -552,18 +3287,45 @@ class GunshotLogger:
     def stop(self):
         """Stop the gunshot logger"""
         self.running = False
+        if hasattr(self, 'analysis_thread'):
+            self.analysis_thread.join()
         if hasattr(self, 'worker_thread'):
             self.worker_thread.join()
-        self.save_state()
+        if self.encoder is not None:
+            self.encoder.shutdown()
+        if self.blackbox is not None:
+            self.blackbox.stop()
+        self.storage.stop()
+        self.spool.stop()
+        try:
+            self.spool.flush()
+        except OSError as e:
+            self.logger.warning(f"Could not move all spooled events to USB: {e}")
+        self.mount_watcher.stop()
+        self.catalog.close()
+        if self.metrics_file is not None:
+            self.metrics_file.stop()
+            try:
+                self.metrics_file.write()
+            except OSError as e:
+                self.logger.warning(f"Could not write final metrics: {e}")
         self.logger.info("Gunshot logger stopped")
+        # Write out whatever is still queued
+        self.log_handler.stop_writer()
 
 def main():
     """Main function"""
     try:
         # Check if USB mount path was provided as command line argument
         usb_mount_path = sys.argv[1] if len(sys.argv) > 1 else None
+
+        # Settings from the config file; any of them can be set here, only some can be reloaded
+        if CONFIG['CONFIG_FILE'] and Path(CONFIG['CONFIG_FILE']).exists():
+            CONFIG.update(read_config_file(CONFIG['CONFIG_FILE']))
+            check_event_settings(CONFIG)
         
         logger = GunshotLogger(usb_mount_path)
+        signal.signal(signal.SIGHUP, logger.request_config_reload)
         logger.start()
         
         try:
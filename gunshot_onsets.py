@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Gunshot Onsets - Count the reports in saved events, in bulk.
+
+Runs the same onset detection the logger applies to new events over every
+event already under the gunshots directory, spread across all cores.
+Results are cached in a <file>.onsets.json next to each file and reused
+while the file and the detection settings are unchanged, and the catalog's
+shot_count and onsets columns are updated to match.
+
+Usage:
+    python3 gunshot_onsets.py /media/pi/gunshot-logger
+    python3 gunshot_onsets.py /media/pi/gunshot-logger --workers 2 --force --list
+"""
+
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from gunshot_logger import CONFIG, detect_onsets
+from gunshot_catalog import CATALOG_FILE, GUNSHOT_DIR, EventCatalog, read_audio_file
+
+CACHE_SUFFIX = '.onsets.json'
+SETTINGS = ('ONSET_HOP', 'ONSET_RISE_DB', 'ONSET_LOOKBACK', 'ONSET_RANGE_DB', 'ONSET_MIN_GAP')
+
+
+def onset_settings():
+    """The detection settings a cached result is valid for"""
+    return {name: CONFIG[name] for name in SETTINGS}
+
+
+def cache_path(path):
+    return path.with_name(path.name + CACHE_SUFFIX)
+
+
+def load_cached(path, settings):
+    """The cached result for path, or None if the file or the settings changed since"""
+    try:
+        cached = json.loads(cache_path(path).read_text())
+        stat = path.stat()
+    except (OSError, ValueError):
+        return None
+    if (cached.get('size') != stat.st_size or cached.get('mtime_ns') != stat.st_mtime_ns
+            or cached.get('settings') != settings):
+        return None
+    return cached
+
+
+def analyze_file(path, settings):
+    """Pool worker: find the reports in one file and cache the result next to it"""
+    path = Path(path)
+    stat = path.stat()
+    audio, sample_rate = read_audio_file(path)
+    onsets = detect_onsets(audio, sample_rate, settings['ONSET_HOP'], settings['ONSET_RISE_DB'],
+                           settings['ONSET_LOOKBACK'], settings['ONSET_RANGE_DB'], settings['ONSET_MIN_GAP'])
+    result = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'settings': settings,
+        'sample_rate': sample_rate,
+        'shot_count': len(onsets),
+        'onsets': onsets.tolist(),
+    }
+    cache = cache_path(path)
+    part = cache.with_name(cache.name + '.part')
+    part.write_text(json.dumps(result))
+    os.replace(part, cache)
+    return result
+
+
+def audio_files(root):
+    return [path for path in sorted((Path(root) / GUNSHOT_DIR).rglob('gunshot_*'))
+            if path.suffix in ('.wav', '.flac')]
+
+
+def process_directory(root, workers=None, force=False, update_catalog=True):
+    """Count the reports in every saved event under root and return a summary dict"""
+    root = Path(root)
+    settings = onset_settings()
+    results = {}
+    pending = []
+    for path in audio_files(root):
+        cached = None if force else load_cached(path, settings)
+        if cached is None:
+            pending.append(path)
+        else:
+            results[path] = cached
+    cached_files = len(results)
+
+    failed = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 mp_context=multiprocessing.get_context('forkserver')) as pool:
+            futures = [(path, pool.submit(analyze_file, str(path), settings)) for path in pending]
+            for path, future in futures:
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    print(f"Skipping {path}: {e}", file=sys.stderr)
+                    failed += 1
+
+    if update_catalog and (root / CATALOG_FILE).exists():
+        catalog = EventCatalog()
+        catalog.open(root / CATALOG_FILE)
+        try:
+            catalog.update_many([
+                {'file_path': str(path.relative_to(root)), 'shot_count': result['shot_count'],
+                 'onsets': json.dumps(result['onsets'])}
+                for path, result in results.items()
+            ])
+        finally:
+            catalog.close()
+
+    return {
+        'files': len(results) + failed,
+        'analyzed': len(pending) - failed,
+        'cached': cached_files,
+        'failed': failed,
+        'shots': sum(result['shot_count'] for result in results.values()),
+        'results': {str(path.relative_to(root)): result for path, result in sorted(results.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the reports in saved gunshot events")
+    parser.add_argument('root', help="USB drive root (directory holding the gunshots directory)")
+    parser.add_argument('--workers', type=int, help="Processes to use (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="Ignore cached results")
+    parser.add_argument('--no-catalog', action='store_true', help="Leave the event catalog alone")
+    parser.add_argument('--list', action='store_true', help="Print the reports found in each file")
+    args = parser.parse_args()
+
+    summary = process_directory(args.root, args.workers, args.force, not args.no_catalog)
+    if args.list:
+        for name, result in summary['results'].items():
+            times = ', '.join(f"{onset / result['sample_rate']:.3f}s" for onset in result['onsets'])
+            print(f"{name}: {result['shot_count']} reports ({times})")
+    print(f"{summary['files']} files: {summary['analyzed']} analysed, {summary['cached']} cached, "
+          f"{summary['failed']} failed; {summary['shots']} reports in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Gunshot Replay - Run recorded audio through the gunshot logger offline.
+
+Feeds a WAV file, or a directory of recorded range sessions, through the same
+audio_callback and detection path used on the Pi, in callback-sized blocks and
+as fast as the CPU allows. No audio device or USB drive is needed: blocks come
+from a local stand-in for sd.InputStream and events are saved to a temporary
+directory.
+
+Usage:
+    python3 gunshot_replay.py recordings/ [--threshold -20] [--analysis-thread]
+    python3 gunshot_replay.py session.wav --detector adaptive --shots session_shots.txt
+"""
+
+import sys
+import time
+import json
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+from scipy.io import wavfile
+
+from gunshot_logger import CONFIG, GunshotLogger
+
+
+class ReplayTimeInfo:
+    """Stand-in for the time_info struct PortAudio passes to the callback"""
+    __slots__ = ('inputBufferAdcTime', 'currentTime')
+
+    def __init__(self, adc_time):
+        self.inputBufferAdcTime = adc_time
+        self.currentTime = adc_time
+
+
+class ReplayCallbackFlags:
+    """Stand-in for sd.CallbackFlags; replayed audio never over- or underflows"""
+    input_overflow = False
+    input_underflow = False
+
+    def __bool__(self):
+        return False
+
+    def __str__(self):
+        return ""
+
+
+def load_wav(path, channels, dtype=np.float32):
+    """Load a WAV file as frames of the logger's sample format and channel count"""
+    sample_rate, audio = wavfile.read(str(path), mmap=True)
+
+    if np.dtype(dtype) == np.int16:
+        if audio.dtype == np.int16:
+            audio = np.asarray(audio)
+        elif audio.dtype == np.int32:
+            audio = (audio >> 16).astype(np.int16)
+        elif audio.dtype == np.uint8:
+            audio = ((audio.astype(np.int16) - 128) << 8)
+        else:
+            audio = (np.clip(audio, -1.0, 32767 / 32768) * 32768).astype(np.int16)
+    elif audio.dtype == np.int16:
+        # Same scaling PortAudio uses when it delivers int16 hardware as float32
+        audio = audio.astype(np.float32) / 32768
+    elif audio.dtype == np.int32:
+        audio = audio.astype(np.float32) / 2147483648
+    elif audio.dtype == np.uint8:
+        audio = (audio.astype(np.float32) - 128) / 128
+    else:
+        audio = audio.astype(np.float32)
+
+    if audio.ndim == 1:
+        audio = audio.reshape(-1, 1)
+    if audio.shape[1] < channels:
+        audio = np.repeat(audio[:, :1], channels, axis=1)
+    return sample_rate, np.ascontiguousarray(audio[:, :channels])
+
+
+def find_recordings(path):
+    """Return the WAV files to replay, in session order"""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.rglob('*.wav'))
+    return [path]
+
+
+class ReplayInputStream:
+    """Local stand-in for sd.InputStream that pumps recorded audio into a callback
+
+    Blocks are delivered back to back with no real-time pacing. The stream
+    clock advances by the audio duration of each block, so ADC timestamps
+    match what a live stream would report.
+    """
+    def __init__(self, audio, samplerate, blocksize, callback, after_block=None):
+        self.audio = audio
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.after_block = after_block
+        self.latencies_ns = np.zeros((len(audio) + blocksize - 1) // blocksize, dtype=np.int64)
+
+    def run(self, start_time=0.0):
+        """Deliver every block; returns the number of blocks delivered"""
+        flags = ReplayCallbackFlags()
+        perf_counter_ns = time.perf_counter_ns
+
+        for i, start in enumerate(range(0, len(self.audio), self.blocksize)):
+            block = self.audio[start:start + self.blocksize]
+            time_info = ReplayTimeInfo(start_time + start / self.samplerate)
+
+            t0 = perf_counter_ns()
+            self.callback(block, len(block), time_info, flags)
+            self.latencies_ns[i] = perf_counter_ns() - t0
+
+            if self.after_block is not None:
+                self.after_block()
+        return len(self.latencies_ns)
+
+
+def score_events(events, shot_frames):
+    """Match detected events against known shot positions (in frames)
+
+    An event is a true detection if any shot falls inside its saved range.
+    Returns (true_detections, false_detections, missed_shots).
+    """
+    shot_frames = np.sort(np.asarray(shot_frames, dtype=np.int64))
+    hit = np.zeros(len(shot_frames), dtype=bool)
+    true_detections = 0
+    for event in events:
+        first = np.searchsorted(shot_frames, event['start_frame'])
+        last = np.searchsorted(shot_frames, event['end_frame'])
+        if last > first:
+            true_detections += 1
+            hit[first:last] = True
+    return true_detections, len(events) - true_detections, int((~hit).sum())
+
+
+def load_shot_times(path):
+    """Read known shot times (seconds from the start of the replay), one per line"""
+    times = []
+    for line in Path(path).read_text().splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            times.append(float(line))
+    return times
+
+
+def replay(paths, output_dir, analysis_thread=False, verbose=False, shot_times=None):
+    """Replay recordings through a fresh GunshotLogger and return a results dict
+
+    If shot_times (seconds from the start of the replay) are given, the
+    results also score the detector against them. CONFIG is left as it was
+    found; the settings replay needs only apply while it runs.
+    """
+    saved_config = dict(CONFIG)
+    try:
+        return _replay(paths, output_dir, analysis_thread, verbose, shot_times)
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+
+def _replay(paths, output_dir, analysis_thread, verbose, shot_times):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Keep log, spool and metrics files out of the working directory
+    CONFIG['ANALYSIS_THREAD'] = analysis_thread
+    # Events are saved synchronously between blocks, so only hand over finished ones
+    CONFIG['STREAM_EVENTS'] = False
+    CONFIG['LOG_FILE'] = str(output_dir / 'gunshot_detection.log')
+    CONFIG['SPOOL_DIR'] = str(output_dir / 'spool')
+    CONFIG['BLACKBOX_DIR'] = str(output_dir / 'blackbox')
+    CONFIG['METRICS_FILE'] = str(output_dir / 'gunshot_metrics.prom')
+
+    logger = GunshotLogger(output_dir, verify_mount=False)
+    if not verbose:
+        logger.logger.setLevel(logging.WARNING)
+
+    events = []
+
+    def after_block():
+        # Analysis and saving run synchronously here, outside the timed callback,
+        # so replay never outruns the capture ring
+        if analysis_thread:
+            logger.drain_block_ring(max_blocks=logger.block_ring.num_blocks)
+        # The black box copies about once a second of audio, as its thread would live
+        blackbox = logger.blackbox
+        if blackbox is not None and logger.buffer.frames_written - blackbox.copied_frames >= CONFIG['SAMPLE_RATE']:
+            blackbox.write_pending()
+        while not logger.detection_queue.empty():
+            batch = logger.next_batch(logger.detection_queue.get())
+            logger.analyze_arrivals(batch)
+            for event in batch:
+                events.append({
+                    'start_frame': event.start_frame,
+                    'end_frame': event.end_frame,
+                    'trigger_frame': event.trigger_frame,
+                    'trigger_count': event.trigger_count,
+                    'peak_db': float(event.peak_db),
+                    'arrival': event.arrival,
+                })
+                logger.persist_event(event)
+
+    latencies = []
+    audio_seconds = 0.0
+    stream_time = 0.0
+    start = time.perf_counter()
+
+    for path in paths:
+        sample_rate, audio = load_wav(path, CONFIG['CHANNELS'], CONFIG['SAMPLE_FORMAT'])
+        if sample_rate != CONFIG['SAMPLE_RATE']:
+            logger.logger.warning(f"Skipping {path}: sample rate {sample_rate} != {CONFIG['SAMPLE_RATE']}")
+            continue
+
+        stream = ReplayInputStream(audio, sample_rate, CONFIG['BUFFER_SIZE'],
+                                   logger.audio_callback, after_block)
+        stream.run(stream_time)
+        latencies.append(stream.latencies_ns)
+        duration = len(audio) / sample_rate
+        audio_seconds += duration
+        stream_time += duration
+
+    # Flush an event whose post-roll ran past the end of the recordings
+    frames_written = logger.buffer.frames_written
+    if logger.event_capture.current is not None:
+        logger.event_capture.current.end_frame = min(logger.event_capture.current.end_frame, frames_written)
+        logger.capture_event(logger.event_capture.poll(frames_written))
+        after_block()
+
+    # Wait for background encodes so the saved files are complete, then move them out of the spool
+    if logger.encoder is not None:
+        logger.encoder.shutdown()
+    if logger.blackbox is not None:
+        logger.blackbox.stop()
+    logger.spool.flush()
+    logger.metrics_file.write()
+
+    elapsed = time.perf_counter() - start
+    latencies_ns = np.concatenate(latencies) if latencies else np.zeros(1, dtype=np.int64)
+    p50, p90, p99 = np.percentile(latencies_ns, [50, 90, 99]) / 1000
+    gunshot_dir = output_dir / CONFIG['GUNSHOT_DIR']
+    saved_files = sorted(gunshot_dir.rglob('*.wav')) + sorted(gunshot_dir.rglob('*.flac'))
+    noise_floor = logger.noise_floor
+
+    results = {
+        'files': len(paths),
+        'blocks': int(len(latencies_ns)) if latencies else 0,
+        'audio_seconds': audio_seconds,
+        'elapsed_seconds': elapsed,
+        'blocks_per_second': len(latencies_ns) / elapsed if elapsed > 0 else 0.0,
+        'real_time_factor': audio_seconds / elapsed if elapsed > 0 else 0.0,
+        'callback_us': {
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': float(latencies_ns.max() / 1000),
+        },
+        'block_budget_us': CONFIG['BUFFER_SIZE'] / CONFIG['SAMPLE_RATE'] * 1e6,
+        'sample_format': CONFIG['SAMPLE_FORMAT'],
+        'detector': CONFIG['DETECTOR'],
+        'noise_floor_db': (float(noise_floor.floor_db)
+                           if noise_floor is not None and np.isfinite(noise_floor.floor_db) else None),
+        'detections': logger.queued_events,
+        'dropped_detections': logger.dropped_events,
+        'overwritten_detections': logger.overwritten_events,
+        'saved_files': len(saved_files),
+        'saved_bytes': sum(path.stat().st_size for path in saved_files),
+        'output_dir': str(output_dir),
+        'events': events,
+    }
+
+    if shot_times is not None:
+        shot_frames = [int(t * CONFIG['SAMPLE_RATE']) for t in shot_times]
+        true_detections, false_detections, missed_shots = score_events(events, shot_frames)
+        results['shots'] = len(shot_frames)
+        results['true_detections'] = true_detections
+        results['false_detections'] = false_detections
+        results['missed_shots'] = missed_shots
+        results['false_detections_per_hour'] = false_detections / audio_seconds * 3600 if audio_seconds else 0.0
+    return results
+
+
+def print_report(results):
+    latency = results['callback_us']
+    print("Replay Results")
+    print("=" * 50)
+    print(f"Files replayed:      {results['files']}")
+    print(f"Audio replayed:      {results['audio_seconds']:.1f}s in {results['elapsed_seconds']:.2f}s")
+    print(f"Blocks/sec:          {results['blocks_per_second']:.0f}")
+    print(f"Real-time factor:    {results['real_time_factor']:.1f}x")
+    print(f"Callback latency:    p50 {latency['p50']:.0f}us, p90 {latency['p90']:.0f}us, "
+          f"p99 {latency['p99']:.0f}us, max {latency['max']:.0f}us "
+          f"(block budget {results['block_budget_us']:.0f}us)")
+    print(f"Detections:          {results['detections']} "
+          f"(dropped {results['dropped_detections']}, overwritten {results['overwritten_detections']})")
+    if results['noise_floor_db'] is not None:
+        print(f"Detector:            adaptive, final noise floor {results['noise_floor_db']:.1f}dB")
+    if 'shots' in results:
+        print(f"Known shots:         {results['shots']} ({results['missed_shots']} missed)")
+        print(f"False detections:    {results['false_detections']} "
+              f"({results['false_detections_per_hour']:.1f}/hour)")
+    print(f"Saved files:         {results['saved_files']} ({results['saved_bytes']} bytes) in {results['output_dir']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded audio through the gunshot detector")
+    parser.add_argument('path', help="WAV file or directory of recorded sessions")
+    parser.add_argument('--output', help="Directory for saved events (default: a new temp directory)")
+    parser.add_argument('--threshold', type=float, help="Override DETECTION_THRESHOLD (dB)")
+    parser.add_argument('--block-size', type=int, help="Override BUFFER_SIZE (frames per callback)")
+    parser.add_argument('--analysis-thread', action='store_true', help="Replay in analysis-thread mode")
+    parser.add_argument('--format', choices=['float32', 'int16'], help="Override SAMPLE_FORMAT")
+    parser.add_argument('--output-format', choices=['wav', 'flac'], help="Override OUTPUT_FORMAT")
+    parser.add_argument('--detector', choices=['fixed', 'adaptive'], help="Override DETECTOR")
+    parser.add_argument('--margin', type=float, help="Override ADAPTIVE_MARGIN_DB")
+    parser.add_argument('--shots', help="File of known shot times (seconds, one per line) to score detections against")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show the logger's INFO output")
+    args = parser.parse_args()
+
+    if args.threshold is not None:
+        CONFIG['DETECTION_THRESHOLD'] = args.threshold
+    if args.block_size is not None:
+        CONFIG['BUFFER_SIZE'] = args.block_size
+    if args.format is not None:
+        CONFIG['SAMPLE_FORMAT'] = args.format
+    if args.output_format is not None:
+        CONFIG['OUTPUT_FORMAT'] = args.output_format
+    if args.detector is not None:
+        CONFIG['DETECTOR'] = args.detector
+    if args.margin is not None:
+        CONFIG['ADAPTIVE_MARGIN_DB'] = args.margin
+    shot_times = load_shot_times(args.shots) if args.shots else None
+
+    paths = find_recordings(args.path)
+    if not paths:
+        print(f"No WAV files found in {args.path}")
+        sys.exit(1)
+
+    output_dir = args.output or tempfile.mkdtemp(prefix='gunshot-replay-')
+    results = replay(paths, output_dir, analysis_thread=args.analysis_thread, verbose=args.verbose,
+                     shot_times=shot_times)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Gunshot Review - Compact waveform/spectrogram sidecars and a review tool that only reads them.
+
+Every saved event gets a small .peaks sidecar next to its audio file:
+min/max peaks at several resolutions and a low-resolution spectrogram.
+Reviewing events and timelines reads only the sidecars and the catalog, so
+it stays fast even on a slow USB stick. Sidecars for files saved without
+one can be backfilled on all cores.
+
+Usage:
+    python3 gunshot_review.py /media/pi/gunshot-logger event 12
+    python3 gunshot_review.py /media/pi/gunshot-logger timeline --since "2024-06-01 14:00" --until "2024-06-01 15:00"
+    python3 gunshot_review.py /media/pi/gunshot-logger backfill --workers 4
+"""
+
+import io
+import os
+import sys
+import struct
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+from gunshot_catalog import CATALOG_FILE, GUNSHOT_DIR, EventCatalog, parse_time, read_audio_file
+
+SIDECAR_SUFFIX = '.peaks'
+MAGIC = b'GSPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHIHIH')      # magic, version, sample_rate, channels, frames, peak levels
+LEVEL = struct.Struct('<II')            # frames per bucket, buckets
+SPECTROGRAM = struct.Struct('<HHHH')    # nfft, hop, bands, columns
+
+PEAK_BUCKET = 256       # Frames per bucket at the finest peak resolution
+PEAK_FACTOR = 4         # Each coarser resolution merges this many buckets
+SPECTROGRAM_NFFT = 512
+SPECTROGRAM_HOP = 1024
+SPECTROGRAM_BANDS = 64
+DB_FLOOR = -120.0       # Spectrogram levels are stored as uint8 half-dB steps above this
+
+def sidecar_path(audio_path):
+    """gunshot_NNN.peaks for gunshot_NNN.wav or .flac"""
+    return Path(audio_path).with_suffix(SIDECAR_SUFFIX)
+
+def build_sidecar(audio, sample_rate):
+    """Peaks and spectrogram for an event's (frames, channels) float32 or int16 audio"""
+    scale = 32768.0 if audio.dtype == np.int16 else 1.0
+    frames, channels = audio.shape
+
+    # Min/max per bucket in one reduceat pass, then coarser levels from the finer ones
+    levels = []
+    if frames:
+        starts = np.arange(0, frames, PEAK_BUCKET)
+        lows = np.minimum.reduceat(audio, starts, axis=0)
+        highs = np.maximum.reduceat(audio, starts, axis=0)
+        bucket = PEAK_BUCKET
+        while True:
+            peaks = np.stack((lows, highs), axis=-1).astype(np.float32) * (32768.0 / scale)
+            levels.append((bucket, np.clip(peaks, -32768, 32767).astype('<i2')))
+            if len(lows) <= 1:
+                break
+            starts = np.arange(0, len(lows), PEAK_FACTOR)
+            lows = np.minimum.reduceat(lows, starts, axis=0)
+            highs = np.maximum.reduceat(highs, starts, axis=0)
+            bucket *= PEAK_FACTOR
+
+    # Spectrogram of the channel mix, one batched FFT over all columns
+    columns = max(0, (frames - SPECTROGRAM_NFFT) // SPECTROGRAM_HOP + 1)
+    spectrogram = np.zeros((columns, SPECTROGRAM_BANDS), dtype=np.uint8)
+    if columns:
+        mix = audio.mean(axis=1, dtype=np.float32) / scale
+        windows = np.lib.stride_tricks.sliding_window_view(mix, SPECTROGRAM_NFFT)[::SPECTROGRAM_HOP][:columns]
+        import scipy.fft  # Deferred: the logger imports this module before its stream is open
+        spectrum = scipy.fft.rfft(windows * np.hanning(SPECTROGRAM_NFFT).astype(np.float32), axis=1)
+        # Drop the Nyquist bin so band k covers k to k + 1 times nyquist / bands
+        power = np.square(np.abs(spectrum[:, :-1]))
+        bands = power.reshape(columns, SPECTROGRAM_BANDS, -1).sum(axis=2) / (SPECTROGRAM_NFFT / 4) ** 2
+        db = 10 * np.log10(bands + 1e-20)
+        spectrogram[:] = np.clip((db - DB_FLOOR) * 2, 0, 255).astype(np.uint8)
+
+    return {
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'frames': frames,
+        'levels': levels,
+        'spectrogram': spectrogram,
+        'spectrogram_hop': SPECTROGRAM_HOP,
+        'spectrogram_nfft': SPECTROGRAM_NFFT,
+    }
+
+def write_sidecar(path, sidecar):
+    """Write a sidecar file; returns its size in bytes"""
+    out = io.BytesIO()
+    out.write(HEADER.pack(MAGIC, VERSION, sidecar['sample_rate'], sidecar['channels'],
+                          sidecar['frames'], len(sidecar['levels'])))
+    for bucket, peaks in sidecar['levels']:
+        out.write(LEVEL.pack(bucket, len(peaks)))
+        out.write(peaks.tobytes())
+    spectrogram = sidecar['spectrogram']
+    out.write(SPECTROGRAM.pack(sidecar['spectrogram_nfft'], sidecar['spectrogram_hop'],
+                               spectrogram.shape[1], spectrogram.shape[0]))
+    out.write(spectrogram.tobytes())
+    data = out.getvalue()
+    Path(path).write_bytes(data)
+    return len(data)
+
+def read_sidecar(path):
+    data = Path(path).read_bytes()
+    magic, version, sample_rate, channels, frames, level_count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} sidecar")
+    offset = HEADER.size
+    levels = []
+    for _ in range(level_count):
+        bucket, buckets = LEVEL.unpack_from(data, offset)
+        offset += LEVEL.size
+        peaks = np.frombuffer(data, dtype='<i2', count=buckets * channels * 2, offset=offset)
+        levels.append((bucket, peaks.reshape(buckets, channels, 2)))
+        offset += peaks.nbytes
+    nfft, hop, bands, columns = SPECTROGRAM.unpack_from(data, offset)
+    offset += SPECTROGRAM.size
+    spectrogram = np.frombuffer(data, dtype=np.uint8, count=columns * bands, offset=offset).reshape(columns, bands)
+    return {
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'frames': frames,
+        'levels': levels,
+        'spectrogram': spectrogram,
+        'spectrogram_hop': hop,
+        'spectrogram_nfft': nfft,
+    }
+
+def peaks_for_width(sidecar, width):
+    """(columns, channels, 2) min/max peaks at roughly width columns, from the nearest stored level"""
+    levels = sidecar['levels']
+    if not levels:
+        return np.zeros((0, sidecar['channels'], 2), dtype=np.int16)
+    # Coarsest level that still has at least width buckets, else the finest
+    _, peaks = next(((b, p) for b, p in reversed(levels) if len(p) >= width), levels[0])
+    if len(peaks) <= width:
+        return peaks
+    starts = (np.arange(width) * len(peaks)) // width
+    return np.stack((np.minimum.reduceat(peaks[..., 0], starts, axis=0),
+                     np.maximum.reduceat(peaks[..., 1], starts, axis=0)), axis=-1)
+
+
+BARS = ' ▁▂▃▄▅▆▇█'
+SHADES = ' .:-=+*#%@'
+
+def render_waveform(sidecar, width=80):
+    """One line per channel of peak amplitude bars"""
+    peaks = peaks_for_width(sidecar, width)
+    amplitude = np.maximum(-peaks[..., 0].astype(np.int32), peaks[..., 1]) / 32768
+    lines = []
+    for channel in range(sidecar['channels']):
+        # Bars on a dB scale so quiet tails stay visible next to the reports
+        db = 20 * np.log10(amplitude[:, channel] + 1e-10)
+        steps = np.clip(np.round((db + 60) / 60 * (len(BARS) - 1)), 0, len(BARS) - 1).astype(int)
+        lines.append(''.join(BARS[step] for step in steps))
+    return lines
+
+def render_spectrogram(sidecar, width=80, height=16):
+    """Rows of shaded characters, highest frequencies first"""
+    spectrogram = sidecar['spectrogram'].astype(np.float32) / 2 + DB_FLOOR
+    if not len(spectrogram):
+        return []
+    columns = np.minimum((np.arange(width) * len(spectrogram)) // width, len(spectrogram) - 1)
+    rows = spectrogram[columns].reshape(width, height, -1).max(axis=2).T[::-1]
+    top = rows.max()
+    steps = np.clip(np.round((rows - (top - 60)) / 60 * (len(SHADES) - 1)), 0, len(SHADES) - 1).astype(int)
+    return [''.join(SHADES[step] for step in row) for row in steps]
+
+def print_event(root, row, width):
+    sidecar = read_sidecar(sidecar_path(Path(root) / row['file_path']))
+    stamp = datetime.datetime.fromtimestamp(row['trigger_time'] or row['start_time'])
+    nyquist = sidecar['sample_rate'] / 2
+    reports = f"  {row['shot_count']} reports" if row.get('shot_count') is not None else ""
+    print(f"{row['file_path']}  {stamp.isoformat(sep=' ', timespec='milliseconds')}  "
+          f"{row['peak_db']:.1f} dB  {row['duration']:.2f}s{reports}")
+    for channel, line in enumerate(render_waveform(sidecar, width)):
+        print(f"ch{channel} |{line}|")
+    print(f"{nyquist / 1000:5.1f}k")
+    for line in render_spectrogram(sidecar, width):
+        print(f"      |{line}|")
+    print(f"  0.0k  0s{' ' * (width - 8)}{sidecar['frames'] / sidecar['sample_rate']:.2f}s")
+
+def print_timeline(root, rows, width):
+    for row in rows:
+        path = sidecar_path(Path(root) / row['file_path'])
+        try:
+            line = render_waveform(read_sidecar(path), width)[0]
+        except (OSError, ValueError):
+            line = '(no sidecar)'
+        stamp = datetime.datetime.fromtimestamp(row['trigger_time'] or row['start_time'])
+        reports = f"{row['shot_count']:2d}x" if row.get('shot_count') is not None else "  ?"
+        print(f"{stamp.isoformat(sep=' ', timespec='seconds')}  {row['peak_db']:6.1f} dB  {reports}  {line}")
+
+
+def backfill_file(path):
+    """Pool worker: write the sidecar for one audio file; returns its size"""
+    audio, sample_rate = read_audio_file(path)
+    return write_sidecar(sidecar_path(path), build_sidecar(audio, sample_rate))
+
+def backfill(root, workers=None, force=False):
+    """Write sidecars for saved events that lack one; returns (written, failed)"""
+    paths = [path for path in sorted((Path(root) / GUNSHOT_DIR).rglob('gunshot_*'))
+             if path.suffix in ('.wav', '.flac') and (force or not sidecar_path(path).exists())]
+    written = failed = 0
+    if not paths:
+        return written, failed
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             mp_context=multiprocessing.get_context('forkserver')) as pool:
+        futures = [(path, pool.submit(backfill_file, path)) for path in paths]
+        for path, future in futures:
+            try:
+                future.result()
+                written += 1
+            except Exception as e:
+                print(f"Skipping {path}: {e}", file=sys.stderr)
+                failed += 1
+    return written, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Review saved gunshot events from their sidecars")
+    parser.add_argument('root', help="USB drive root (directory holding the catalog)")
+    parser.add_argument('--width', type=int, default=80, help="Columns to render")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    event = subparsers.add_parser('event', help="Waveform and spectrogram of one event")
+    event.add_argument('number', type=int)
+    event.add_argument('--device', help="Device id, in multi-device mode")
+
+    timeline = subparsers.add_parser('timeline', help="One waveform line per event")
+    timeline.add_argument('--since', type=parse_time, help="Start time (ISO date/time or unix seconds)")
+    timeline.add_argument('--until', type=parse_time, help="End time (ISO date/time or unix seconds)")
+    timeline.add_argument('--min-db', type=float, help="Minimum peak level")
+    timeline.add_argument('--limit', type=int)
+
+    fill = subparsers.add_parser('backfill', help="Write sidecars for events saved without one")
+    fill.add_argument('--workers', type=int, help="Processes to use (default: one per core)")
+    fill.add_argument('--force', action='store_true', help="Rewrite existing sidecars")
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        written, failed = backfill(args.root, args.workers, args.force)
+        print(f"Wrote {written} sidecars, {failed} failed")
+        return
+
+    catalog = EventCatalog()
+    catalog.open(Path(args.root) / CATALOG_FILE)
+    if args.command == 'event':
+        rows = catalog.query(number=args.number, device=args.device)
+        if not rows:
+            sys.exit(f"No event {args.number} in the catalog")
+        for row in rows:
+            print_event(args.root, row, args.width)
+    else:
+        print_timeline(args.root, catalog.query(args.since, args.until, args.min_db, limit=args.limit),
+                       args.width)
+
+if __name__ == "__main__":
+    main()
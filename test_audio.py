@@ -9,6 +9,16 @@ import tempfile
 import os
 from pathlib import Path
 
+import queue
+import time
+import sqlite3
+
+from gunshot_logger import (
+    ArrivalEstimator, BlockRing, CircularBuffer, DetectionEvent, DetectionQueue, EnvelopeFrontEnd, EventCapture, LatencyHistogram,
+    MountWatcher, RangeOverwrittenError, SpoolStore, StorageManager, WavStreamWriter, bearing_degrees, parse_mountinfo,
+)
+from gunshot_catalog import EventCatalog
+
 def test_audio_saving():
     """Test audio saving functionality"""
     print("Testing audio saving functionality...")
@@ -95,19 +105,632 @@ def test_circular_buffer():
         print("Circular buffer test failed!")
         return False
 
+class ReferenceCircularBuffer:
+    """The original sample-by-sample buffer, kept as a behavioural reference"""
+    def __init__(self, duration, sample_rate, channels):
+        self.size = int(duration * sample_rate * channels)
+        self.data = np.zeros(self.size, dtype=np.float32)
+        self.index = 0
+        self.is_full = False
+        self.total_samples_written = 0
+
+    def write(self, data):
+        for i in range(len(data)):
+            self.data[self.index] = data[i]
+            self.index = (self.index + 1) % self.size
+            if self.index == 0:
+                self.is_full = True
+        self.total_samples_written += len(data)
+
+    def get_buffer(self):
+        if not self.is_full:
+            return self.data[:self.index].copy()
+        return np.roll(self.data, -self.index).copy()
+
+def test_circular_buffer_matches_reference():
+    """Vectorized buffer must match the original across wraparound"""
+    print("\nTesting vectorized circular buffer against reference...")
+
+    rng = np.random.default_rng(1234)
+    # 0.01s at 1kHz stereo keeps the reference loop fast: 20 samples
+    buffer = CircularBuffer(0.01, 1000, 2)
+    reference = ReferenceCircularBuffer(0.01, 1000, 2)
+
+    # Mix of block sizes: smaller than, equal to and larger than the buffer,
+    # plus writes that end exactly on the wrap point
+    for block_len in [6, 6, 8, 14, 20, 2, 46, 0, 18, 4, 40, 10, 10]:
+        block = rng.standard_normal(block_len).astype(np.float32)
+        buffer.write(block)
+        reference.write(block)
+
+        assert buffer.index == reference.index
+        assert buffer.is_full == reference.is_full
+        assert buffer.total_samples_written == reference.total_samples_written
+        assert np.array_equal(buffer.get_buffer(), reference.get_buffer())
+
+    print("Vectorized circular buffer matches reference!")
+    return True
+
+def test_circular_buffer_snapshot():
+    """Snapshot and views return the last N frames in order"""
+    print("\nTesting circular buffer snapshot API...")
+
+    buffer = CircularBuffer(0.01, 1000, 2)  # 10 frames, 20 samples
+    samples = np.arange(1, 27, dtype=np.float32)  # 13 frames, wraps once
+    buffer.write(samples)
+
+    assert np.array_equal(buffer.snapshot(4), samples[-8:])
+    assert np.array_equal(buffer.snapshot(), samples[-20:])
+    # Asking for more frames than are held returns what we have
+    assert np.array_equal(buffer.snapshot(50), samples[-20:])
+    assert len(buffer.snapshot(0)) == 0
+
+    older, newer = buffer.views(5)
+    assert np.array_equal(np.concatenate((older, newer)), samples[-10:])
+    # Views alias the buffer rather than copying it
+    assert older.base is buffer.data and newer.base is buffer.data
+
+    empty = CircularBuffer(0.01, 1000, 2)
+    empty.write(samples[:6])
+    assert np.array_equal(empty.snapshot(10), samples[:6])
+
+    print("Circular buffer snapshot test passed!")
+    return True
+
+def test_block_ring():
+    """Block ring hands blocks over in order and counts drops when full"""
+    print("\nTesting callback block ring...")
+
+    ring = BlockRing(4, 8, 2)
+    blocks = [np.full((8, 2), i, dtype=np.float32) for i in range(6)]
+
+    for i in range(4):
+        assert ring.push(blocks[i], float(i))
+    # Ring is full: further blocks are dropped, not overwritten
+    assert not ring.push(blocks[4], 4.0)
+    assert ring.dropped == 1
+    assert ring.pending() == 4
+
+    block, arrival_time, _ = ring.peek()
+    assert np.array_equal(block, blocks[0]) and arrival_time == 0.0
+    ring.release()
+    assert ring.push(blocks[5], 5.0)
+
+    seen = []
+    missed = []
+    while ring.pending():
+        block, _, _ = ring.peek()
+        seen.append(int(block[0, 0]))
+        missed.append(ring.missed())
+        ring.release()
+    assert seen == [1, 2, 3, 5]
+    # The block after the one dropped while full carries its frames
+    assert missed == [0, 0, 0, 8]
+
+    # Short blocks keep their own length, oversized ones are dropped
+    assert ring.push(blocks[0][:3], 6.0)
+    assert ring.peek()[0].shape == (3, 2)
+    assert not ring.push(np.zeros((9, 2), dtype=np.float32), 7.0)
+
+    # Dropped and skipped frames are handed to the next published block
+    ring.release()
+    ring.skip(8)
+    assert ring.push(blocks[1], 8.0)
+    assert ring.missed() == 17
+
+    print("Block ring test passed!")
+    return True
+
+def test_buffer_read_frames():
+    """Absolute frame ranges are read across wraparound and clipped to what is held"""
+    print("\nTesting absolute frame reads...")
+
+    buffer = CircularBuffer(0.01, 1000, 2)  # 10 frames
+    samples = np.arange(26, dtype=np.float32)  # frames 0..12
+    buffer.write(samples[:14])
+    buffer.write(samples[14:])
+    assert buffer.frames_written == 13
+
+    assert np.array_equal(buffer.read_frames(5, 9), samples[10:18])
+    assert np.array_equal(buffer.read_frames(8, 13), samples[16:26])
+    # Frames 0-2 were overwritten and frame 13+ is not written yet
+    assert np.array_equal(buffer.read_frames(0, 20), samples[6:26])
+    assert len(buffer.read_frames(0, 2)) == 0
+
+    print("Absolute frame read test passed!")
+    return True
+
+def test_event_capture_coalescing():
+    """Rapid-fire triggers extend one event; pre/post-roll is sample aligned"""
+    print("\nTesting event capture and coalescing...")
+
+    capture = EventCapture(pre_frames=100, post_frames=200, max_frames=1000)
+
+    assert capture.trigger(1000, -10.0, 1.0)
+    assert capture.current.start_frame == 900
+    assert capture.current.end_frame == 1200
+
+    # Second and third shots land inside the open event and extend it
+    assert not capture.trigger(1150, -5.0, 1.1)
+    assert not capture.trigger(1300, -12.0, 1.2)
+    assert capture.poll(1400) is None
+    event = capture.poll(1500)
+    assert (event.start_frame, event.end_frame) == (900, 1500)
+    assert event.trigger_count == 3 and event.peak_db == -5.0
+    assert event.trigger_frame == 1000
+
+    # The next event may not reach back into audio already captured
+    assert capture.trigger(1550, -8.0, 2.0)
+    assert capture.current.start_frame == 1500
+
+    # A continuous trigger cannot grow an event past max_frames
+    for frame in range(1600, 2500, 100):
+        assert capture.poll(frame) is None
+        assert not capture.trigger(frame, -8.0, 2.0)
+    assert capture.current.end_frame == 1500 + 1000
+
+    # The block that closes an event can hold a louder frame from before its end
+    capture = EventCapture(pre_frames=100, post_frames=1000, max_frames=2000)
+    assert capture.trigger(500, -10.0, 1.0)
+    closed = capture.poll(1536)
+    assert closed.end_frame == 1500
+    assert not capture.trigger(1400, -4.0, 1.9)
+    assert capture.current is None
+    assert closed.trigger_count == 2 and closed.peak_db == -4.0
+    # A trigger past the end still opens the next event, with its trigger inside it
+    assert capture.trigger(1520, -6.0, 2.0)
+    assert capture.current.start_frame == 1500 <= capture.current.trigger_frame
+
+    print("Event capture test passed!")
+    return True
+
+def test_detection_queue_byte_limit():
+    """Queue is bounded by referenced audio and ranges report overwrites"""
+    print("\nTesting byte-bounded detection queue...")
+
+    # 8 bytes per stereo float32 frame, room for 1000 frames
+    detections = DetectionQueue(8000, 8)
+    detections.put_nowait(DetectionEvent(0, 600, 100, 0.0, -10.0))
+    try:
+        detections.put_nowait(DetectionEvent(600, 1200, 700, 0.0, -10.0))
+        assert False, "queue should be full"
+    except queue.Full:
+        pass
+    assert detections.pending_bytes == 4800
+
+    event = detections.get(timeout=1)
+    # Taking an event off the queue keeps its audio charged until it is released
+    assert detections.pending_bytes == 4800
+    detections.release(event)
+    detections.release(event)
+    assert detections.pending_bytes == 0
+    detections.put_nowait(DetectionEvent(600, 1200, 700, 0.0, -10.0))
+    # An open event is charged for the length it may still grow to
+    try:
+        detections.put_nowait(DetectionEvent(1200, 1300, 1250, 0.0, -10.0), max_frames=500)
+        assert False, "queue should be full"
+    except queue.Full:
+        pass
+    assert detections.pending_bytes == 4800
+
+    buffer = CircularBuffer(0.01, 1000, 2)  # 10 frames
+    samples = np.arange(30, dtype=np.float32)  # frames 0..14
+    buffer.write(samples)
+    assert np.array_equal(buffer.read_range(5, 15), samples[10:30])
+    try:
+        buffer.read_range(event.start_frame, 10)
+        assert False, "range should be reported as overwritten"
+    except RangeOverwrittenError:
+        pass
+
+    # A write still copying over the oldest frame already counts as overwriting it
+    lapped = []
+
+    class ProbedSamples(np.ndarray):
+        def __setitem__(self, key, value):
+            try:
+                buffer.check_range(5)
+            except RangeOverwrittenError:
+                lapped.append(key)
+            super().__setitem__(key, value)
+
+    buffer.data = buffer.data.view(ProbedSamples)
+    buffer.write(np.ones(2, dtype=np.float32))
+    assert lapped and buffer.frames_written == 16
+
+    print("Detection queue test passed!")
+    return True
+
+def test_wav_stream_writer():
+    """Chunked int16 writer produces the same file content as a one-shot conversion"""
+    print("\nTesting streaming WAV writer...")
+
+    rng = np.random.default_rng(7)
+    # Includes values outside [-1, 1] to exercise clipping
+    audio = (rng.standard_normal(2 * 10007) * 0.5).astype(np.float32)
+    expected = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).reshape(-1, 2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "stream.wav"
+        with WavStreamWriter(path, 48000, 2, chunk_frames=1000) as writer:
+            # Feed it in uneven pieces like ring segments
+            writer.write(audio[:3001 * 2])
+            writer.write(audio[3001 * 2:])
+
+        read_rate, read_audio = wavfile.read(str(path))
+        assert read_rate == 48000
+        assert np.array_equal(read_audio, expected)
+        assert os.path.getsize(path) == 44 + expected.nbytes
+
+        clipped = np.clip(audio, -1.0, 1.0)
+        assert writer.frames_written == 10007
+        assert np.isclose(writer.rms(), np.sqrt(np.mean(np.square(clipped.astype(np.float64)))), rtol=1e-5)
+        assert writer.max_amplitude == np.max(np.abs(clipped))
+
+        # int16 input is written as-is
+        native = expected.reshape(-1)
+        int_path = Path(tmp) / "native.wav"
+        with WavStreamWriter(int_path, 48000, 2) as writer:
+            writer.write(native)
+        assert np.array_equal(wavfile.read(str(int_path))[1], expected)
+        assert writer.max_amplitude == np.max(np.abs(native.astype(np.int32))) / 32768
+
+    print("Streaming WAV writer test passed!")
+    return True
+
+MOUNTINFO = """\
+22 1 179:2 / / rw,relatime shared:1 - ext4 /dev/root rw
+25 22 0:5 / /dev rw,relatime shared:2 - devtmpfs udev rw,size=437040k
+31 22 0:27 / /media/pi/Old\\040Stick rw,nosuid shared:20 - vfat /dev/sdb1 rw
+32 22 0:28 / /media/pi/gunshot-logger rw,nosuid,nodev shared:21 - vfat /dev/sda1 rw,uid=1000
+"""
+
+def test_mount_watcher():
+    """Mount table parsing and USB path resolution without forking"""
+    print("\nTesting mount watcher...")
+
+    mounts = parse_mountinfo(MOUNTINFO)
+    assert ('/media/pi/Old Stick', '/dev/sdb1') in mounts
+    assert ('/media/pi/gunshot-logger', '/dev/sda1') in mounts
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mountinfo = Path(tmp) / "mountinfo"
+        mountinfo.write_text(MOUNTINFO)
+        changes = []
+        watcher = MountWatcher('/media/pi/gunshot-logger', on_change=changes.append,
+                               mountinfo_file=str(mountinfo))
+        assert watcher.current_path == Path('/media/pi/gunshot-logger')
+        assert watcher.is_mounted('/media/pi/gunshot-logger')
+
+        # Configured stick unplugged: fall back to another USB drive under /media
+        mountinfo.write_text(MOUNTINFO.replace('/media/pi/gunshot-logger', '/mnt/other'))
+        watcher.refresh()
+        assert watcher.current_path == Path('/media/pi/Old Stick')
+
+        # Everything unplugged: no path, reported once
+        mountinfo.write_text("\n".join(MOUNTINFO.splitlines()[:2]))
+        watcher.refresh()
+        watcher.refresh()
+        assert watcher.current_path is None
+        assert changes == [Path('/media/pi/gunshot-logger'), Path('/media/pi/Old Stick'), None]
+
+    print("Mount watcher test passed!")
+    return True
+
+def test_spool_store():
+    """Spooled events survive a missing USB drive and respect the byte cap"""
+    print("\nTesting write-behind spool...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        usb = {'dir': None}
+        spool = SpoolStore(Path(tmp) / "spool", 250, lambda: usb['dir'], fsync_batch=2)
+
+        def spool_file(name, size=100):
+            assert spool.make_room(size)
+            path = spool.path_for(name)
+            path.write_bytes(b"x" * size)
+            spool.add(path)
+
+        spool_file("gunshot_001.wav")
+        spool_file("gunshot_002.wav")
+        # No USB drive: nothing moves
+        spool.flush()
+        assert spool.pending_files() == 2
+
+        # Third event overflows the cap, so the oldest is evicted
+        spool_file("gunshot_003.wav")
+        assert spool.dropped_files == 1
+        assert spool.pending_bytes == 200
+
+        # A restart picks up what is still spooled
+        spool = SpoolStore(Path(tmp) / "spool", 250, lambda: usb['dir'], fsync_batch=2)
+        assert spool.pending_files() == 2
+
+        usb['dir'] = Path(tmp) / "usb" / "gunshots"
+        (Path(tmp) / "usb").mkdir()
+        spool.flush()
+        moved = sorted(p.name for p in usb['dir'].iterdir())
+        assert moved == ["gunshot_002.wav", "gunshot_003.wav"]
+        assert spool.pending_files() == 0 and spool.pending_bytes == 0
+        assert not any((Path(tmp) / "spool").iterdir())
+
+        # 'newest' policy refuses new events instead of evicting
+        strict = SpoolStore(Path(tmp) / "strict", 150, lambda: None, drop_policy='newest')
+        assert strict.make_room(100)
+        strict.path_for("a.wav").write_bytes(b"x" * 100)
+        strict.add(strict.path_for("a.wav"))
+        assert not strict.make_room(100)
+
+        # Room made while a batch is being handed over evicts behind the batch, never the batch itself
+        usb_dir = Path(tmp) / "usb" / "racing"
+        racing = SpoolStore(Path(tmp) / "racing", 300, lambda: usb_dir, fsync_batch=1,
+                            on_migrated=lambda records: racing.make_room(100))
+        for name in ("a.wav", "b.wav", "c.wav"):
+            racing.path_for(name).write_bytes(b"x" * 100)
+            racing.add(racing.path_for(name))
+        assert racing.migrate_batch() == 1
+        assert racing.file_names() == ["c.wav"] and racing.pending_bytes == 100
+        assert racing.dropped_files == 1 and racing.migrated_files == 1
+        assert (usb_dir / "a.wav").exists() and racing.path_for("c.wav").exists()
+        assert not racing.path_for("a.wav").exists() and not racing.path_for("b.wav").exists()
+
+    print("Spool test passed!")
+    return True
+
+def test_latency_histogram():
+    """Latencies land in the right buckets and export as cumulative Prometheus buckets"""
+    print("\nTesting latency histogram...")
+
+    histogram = LatencyHistogram([0.001, 0.01, 0.1])
+    counts_buffer = histogram.counts
+    for elapsed_ns in (500_000, 1_000_000, 5_000_000, 50_000_000, 2_000_000_000):
+        histogram.record(elapsed_ns)
+
+    # Bounds are inclusive, like Prometheus 'le'
+    assert histogram.counts.tolist() == [2, 1, 1, 1]
+    assert histogram.counts is counts_buffer
+    assert histogram.count() == 5
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(1.0) == float('inf')
+
+    lines = histogram.prometheus('test_seconds', "Test latency")
+    assert 'test_seconds_bucket{le="0.001"} 2' in lines
+    assert 'test_seconds_bucket{le="0.1"} 4' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 5' in lines
+    assert 'test_seconds_count 5' in lines
+    assert 'test_seconds_sum 2.056500000' in lines
+
+    print("Latency histogram test passed!")
+    return True
+
+def test_envelope_front_end():
+    """The decimated envelope gives exact block levels and catches clicks shorter than a block"""
+    print("\nTesting envelope front end...")
+
+    rng = np.random.default_rng(3)
+    audio = (rng.standard_normal((4096, 2)) * 0.01).astype(np.float32)
+    # A 200-frame click straddling the boundary between the second and third blocks
+    audio[1948:2148] += 0.5
+
+    def reference_db(block):
+        return 20 * np.log10(np.sqrt(np.mean(np.square(block.astype(np.float64)))) + 1e-10)
+
+    for dtype in (np.float32, np.int16):
+        samples = audio if dtype == np.float32 else (audio * 32768).astype(np.int16)
+        scale = 1.0 if dtype == np.float32 else 32768.0
+        block_env = EnvelopeFrontEnd(1024, 2, dtype)
+        window_env = EnvelopeFrontEnd(1024, 2, dtype, hop=128, window=256)
+        trigger_dbs = []
+        for start in range(0, 4096, 1024):
+            block = samples[start:start + 1024]
+            level = block_env.process(block)
+            assert abs(level - reference_db(block / scale)) < 1e-3
+            assert block_env.trigger_db == level
+            assert window_env.process(block) == level
+            trigger_dbs.append(window_env.trigger_db)
+
+        # 256-frame windows see the click at close to its own level, blocks dilute it
+        print(f"{np.dtype(dtype).name}: 256-frame trigger levels {np.round(trigger_dbs, 1)}")
+        assert trigger_dbs[1] > reference_db(samples[1024:2048] / scale) + 3
+        assert trigger_dbs[2] > -10 and trigger_dbs[0] < -35
+
+        # Short final blocks are zero-padded but averaged over their own length
+        assert abs(block_env.process(samples[:300]) - reference_db(samples[:300] / scale)) < 1e-3
+
+    # The trigger anchors to the loudest sample of the loudest hop
+    env = EnvelopeFrontEnd(1024, 2, np.float32)
+    block = (rng.standard_normal((1024, 2)) * 0.01).astype(np.float32)
+    block[700, 1] = -0.9
+    env.process(block)
+    offset, peak = env.loudest_frame(block)
+    assert offset == 700 and abs(peak - 0.9) < 1e-6
+
+    print("Envelope front end test passed!")
+    return True
+
+def test_arrival_estimator():
+    """GCC-PHAT recovers inter-channel delays for a whole batch within a small per-event budget"""
+    print("\nTesting arrival estimator...")
+
+    rng = np.random.default_rng(5)
+    estimator = ArrivalEstimator(2048, 3, max_lag=96, batch_size=16)
+    delays = rng.integers(-40, 41, size=(16, 2))
+    windows = np.zeros((16, 2048, 3), dtype=np.float32)
+    for i, (second, third) in enumerate(delays):
+        source = rng.standard_normal(2400)
+        onset = np.zeros(2400)
+        onset[1000:1600] = source[1000:1600]
+        for channel, delay in enumerate((0, second, third)):
+            windows[i, :, channel] = np.roll(onset, delay)[100:2148] + rng.standard_normal(2048) * 0.01
+
+    estimator.estimate(windows)
+    start = time.perf_counter_ns()
+    estimated = estimator.estimate(windows)
+    per_event_us = (time.perf_counter_ns() - start) / 16 / 1000
+
+    # Pairs are (0, 1), (0, 2), (1, 2)
+    expected = np.stack((delays[:, 0], delays[:, 1], delays[:, 1] - delays[:, 0]), axis=1)
+    print(f"Max delay error {np.abs(estimated - expected).max():.2f} frames, {per_event_us:.0f}us per event")
+    assert estimator.pairs == [(0, 1), (0, 2), (1, 2)]
+    assert np.abs(estimated - expected).max() < 0.5
+    # Well inside one 21ms block of CPU per event, so rapid fire cannot back it up
+    assert per_event_us < 5000
+
+    # A broadside source has zero bearing, one end-on has +/-90 degrees
+    assert bearing_degrees(0.0, 0.1, 343.0) == 0.0
+    assert abs(bearing_degrees(0.1 / 343.0, 0.1, 343.0) - 90.0) < 1e-3
+    assert bearing_degrees(-1.0, 0.1, 343.0) == -90.0
+
+    print("Arrival estimator test passed!")
+    return True
+
+class UnreadableCatalog(EventCatalog):
+    """Catalog whose database is locked by another process"""
+    def open(self, path):
+        raise sqlite3.OperationalError("database is locked")
+
+def test_storage_manager():
+    """Events are filed by hour and evicted by priority, budget, age and free space without rescanning"""
+    print("\nTesting storage manager...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "usb"
+        root.mkdir()
+        catalog = EventCatalog()
+        storage = StorageManager(lambda: root, catalog, layout='%Y-%m-%d/%H', max_bytes=3500)
+
+        def migrated(records):
+            storage.add(records)
+            catalog.insert_many([dict(metadata, file_path=str(path.relative_to(root)), file_size=size)
+                                 for path, size, metadata in records])
+
+        spool = SpoolStore(Path(tmp) / "spool", 10 ** 6, lambda: root / "gunshots", fsync_batch=1,
+                           on_migrated=migrated, companion_suffixes=('.peaks',),
+                           shard=storage.shard, reserve=storage.reserve)
+        base = time.time() - 10 * 86400
+        # (hours after base, reports found); the second is most likely a false trigger
+        events = [(0, 1), (1, 0), (20, 2), (21, 1)]
+        free = []
+        for number, (hours, shots) in enumerate(events, start=1):
+            path = spool.path_for(f"gunshot_{number:03d}.wav")
+            path.write_bytes(b"x" * 1000)
+            path.with_suffix('.peaks').write_bytes(b"p" * 100)
+            spool.add(path, {'number': number, 'trigger_time': base + hours * 3600, 'shot_count': shots})
+            spool.flush()
+            free.append(storage.free_bytes)
+
+        rows = catalog.query()
+        print(f"On the drive: {[row['file_path'] for row in rows]}, {storage.used_bytes} bytes")
+        # The fourth event went over budget, which evicted the likely false trigger rather than the oldest
+        assert [row['number'] for row in rows] == [1, 3, 4]
+        assert storage.evicted_files == 1 and storage.used_bytes == 3300
+        assert not (root / "gunshots" / storage.shard({'trigger_time': base + 3600}, None)).exists()
+        first = root / "gunshots" / storage.shard({'trigger_time': base}, None) / "gunshot_001.wav"
+        assert rows[0]['file_path'] == str(first.relative_to(root)) and first.exists()
+        assert first.with_suffix('.peaks').exists()
+        # Free space follows the writes and evictions without going back to the drive
+        assert free[1] == free[0] - 1100 and free[2] == free[1] - 1100 and free[3] == free[2]
+
+        # Past the age limit, whatever the priority
+        storage.max_age = time.time() - (base + 10 * 3600)
+        storage.enforce()
+        assert [row['number'] for row in catalog.query()] == [3, 4]
+        assert not first.exists() and not first.with_suffix('.peaks').exists()
+
+        # A drive that cannot make room refuses the batch and the event stays in the spool
+        storage.min_free_bytes = storage.free_bytes + 10 ** 12
+        path = spool.path_for("gunshot_005.wav")
+        path.write_bytes(b"x" * 1000)
+        spool.add(path, {'number': 5, 'trigger_time': time.time(), 'shot_count': 1})
+        spool.flush()
+        assert storage.full and spool.pending_files() == 1
+        assert catalog.query() == [] and storage.used_bytes == 0
+        assert not list((root / "gunshots").rglob("gunshot_*"))
+
+        # A fresh manager indexes the drive from the catalog
+        storage.min_free_bytes = 0
+        spool.flush()
+        reloaded = StorageManager(lambda: root, catalog, layout='%Y-%m-%d/%H')
+        reloaded.enforce()
+        assert reloaded.used_bytes == storage.used_bytes == 1000
+
+        # Evicting with the catalog closed under it still frees the drive
+        catalog.close()
+        storage.max_bytes = 0
+        assert storage.reserve(0) and storage.used_bytes == 0
+        assert not list((root / "gunshots").rglob("gunshot_*"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A catalog that cannot be read leaves only free space to enforce, and the migrator survives any error
+        root = Path(tmp) / "usb"
+        root.mkdir()
+        storage = StorageManager(lambda: root, UnreadableCatalog(), max_bytes=1)
+        failures = []
+
+        def reserve(nbytes):
+            if not failures:
+                failures.append(nbytes)
+                raise RuntimeError("unexpected")
+            return storage.reserve(nbytes)
+
+        spool = SpoolStore(Path(tmp) / "spool", 10 ** 6, lambda: root / "gunshots", fsync_batch=1,
+                           fsync_interval=0.05, on_migrated=storage.add, reserve=reserve)
+        path = spool.path_for("gunshot_001.wav")
+        path.write_bytes(b"x" * 1000)
+        spool.add(path)
+        spool.start()
+        deadline = time.monotonic() + 5
+        while spool.pending_files() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert spool.thread.is_alive()
+        spool.stop()
+        assert failures and spool.pending_files() == 0
+        assert (root / "gunshots" / "gunshot_001.wav").exists() and not storage.full
+
+    print("Storage manager test passed!")
+    return True
+
 if __name__ == "__main__":
     print("Audio System Test Suite")
     print("=" * 50)
     
     test1_passed = test_audio_saving()
     test2_passed = test_circular_buffer()
+    test3_passed = test_circular_buffer_matches_reference()
+    test4_passed = test_circular_buffer_snapshot()
+    test5_passed = test_block_ring()
+    test6_passed = test_buffer_read_frames()
+    test7_passed = test_event_capture_coalescing()
+    test8_passed = test_detection_queue_byte_limit()
+    test9_passed = test_wav_stream_writer()
+    test10_passed = test_mount_watcher()
+    test11_passed = test_spool_store()
+    test12_passed = test_latency_histogram()
+    test13_passed = test_envelope_front_end()
+    test14_passed = test_arrival_estimator()
+    test15_passed = test_storage_manager()
     
     print("\n" + "=" * 50)
     print("Test Results:")
     print(f"Audio Saving Test: {'PASSED' if test1_passed else 'FAILED'}")
     print(f"Circular Buffer Test: {'PASSED' if test2_passed else 'FAILED'}")
+    print(f"Buffer Reference Test: {'PASSED' if test3_passed else 'FAILED'}")
+    print(f"Buffer Snapshot Test: {'PASSED' if test4_passed else 'FAILED'}")
+    print(f"Block Ring Test: {'PASSED' if test5_passed else 'FAILED'}")
+    print(f"Frame Read Test: {'PASSED' if test6_passed else 'FAILED'}")
+    print(f"Event Capture Test: {'PASSED' if test7_passed else 'FAILED'}")
+    print(f"Detection Queue Test: {'PASSED' if test8_passed else 'FAILED'}")
+    print(f"Streaming Writer Test: {'PASSED' if test9_passed else 'FAILED'}")
+    print(f"Mount Watcher Test: {'PASSED' if test10_passed else 'FAILED'}")
+    print(f"Spool Test: {'PASSED' if test11_passed else 'FAILED'}")
+    print(f"Latency Histogram Test: {'PASSED' if test12_passed else 'FAILED'}")
+    print(f"Envelope Front End Test: {'PASSED' if test13_passed else 'FAILED'}")
+    print(f"Arrival Estimator Test: {'PASSED' if test14_passed else 'FAILED'}")
+    print(f"Storage Manager Test: {'PASSED' if test15_passed else 'FAILED'}")
     
-    if test1_passed and test2_passed:
+    if all([test1_passed, test2_passed, test3_passed, test4_passed, test5_passed,
+            test6_passed, test7_passed, test8_passed, test9_passed, test10_passed,
+            test11_passed, test12_passed, test13_passed, test14_passed, test15_passed]):
         print("\nAll tests passed! The audio system should work correctly.")
     else:
         print("\nSome tests failed. Check the implementation.") 
\ No newline at end of file
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the hot path stays within its per-block budgets
+"""
+
+import sys
+import subprocess
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import CONFIG
+from gunshot_benchmark import BUDGETS, measure_allocations, print_report, run_benchmarks
+
+def test_hot_path_budgets():
+    """Every real-time path fits its share of the block period and its allocation budget"""
+    print("Testing hot path budgets...")
+
+    before = dict(CONFIG)
+    results = run_benchmarks(blocks=300)
+    # The temporary paths the benchmarks used are not left behind in CONFIG
+    assert CONFIG == before
+    print_report(results)
+    assert [result['name'] for result in results] == list(BUDGETS)
+    # 1024 frames at 48 kHz
+    assert abs(results[0]['budget_ns'] / BUDGETS['ring_write'][0] - 21.33e6) < 0.01e6
+    for result in results:
+        assert result['ok'], f"{result['name']} is over budget: {result}"
+        assert result['ns_per_block'] > 0
+    # The callback paths keep no memory from block to block
+    callbacks = [result for result in results if result['name'].startswith('callback')]
+    assert all(result['retained_bytes_per_block'] < 64 for result in callbacks)
+
+    print("Hot path budget test passed!")
+    return True
+
+def test_budget_regressions_fail():
+    """Slow or allocating paths are reported over budget and fail the command"""
+    print("\nTesting budget failures...")
+
+    # Times scaled far beyond any real device
+    slow = run_benchmarks(blocks=50, slowdown=1e6, names=['ring_write'])
+    assert not slow[0]['ok'] and slow[0]['p99_ns_per_block'] > slow[0]['budget_ns']
+
+    # A block-sized copy per block breaks an allocation budget that the real path meets
+    leaky = []
+    allocated, retained = measure_allocations(lambda i: leaky.append(np.zeros(1024 * 2, np.float32)), 50)
+    print(f"Copying callback: {allocated:.0f} bytes allocated, {retained:.0f} kept per call")
+    assert allocated >= 8192 and retained >= 8192
+    allocated, retained = measure_allocations(lambda i: np.zeros(1024 * 2, np.float32), 50)
+    assert allocated >= 8192 and retained < 64
+    tight = run_benchmarks(blocks=50, names=['callback'], budgets={'callback': (0.10, 0)})
+    assert not tight[0]['ok'] and tight[0]['alloc_bytes_per_block'] > 0
+
+    # The command line exits non-zero so a regression fails loudly in scripts and CI
+    result = subprocess.run([sys.executable, 'gunshot_benchmark.py', '--only', 'ring_write', '--blocks', '50',
+                             '--slowdown', '1e6'], capture_output=True, text=True, cwd=Path(__file__).parent)
+    print(result.stdout)
+    assert result.returncode == 1 and 'OVER BUDGET' in result.stdout
+
+    print("Budget failure test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Hot Path Benchmark Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_hot_path_budgets()
+    test2_passed = test_budget_regressions_fail()
+    print(f"Hot Path Budget Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Budget Failure Test: {'PASSED' if test2_passed else 'FAILED'}")
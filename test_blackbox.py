@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script to verify continuous black box recording
+"""
+
+import mmap
+import tempfile
+from pathlib import Path
+import numpy as np
+from scipy.io import wavfile
+
+from gunshot_logger import CONFIG, BlackBoxRecorder, CircularBuffer, blackbox_segments
+from gunshot_blackbox import position_at, read_blackbox
+from gunshot_catalog import CATALOG_FILE, EventCatalog
+from gunshot_replay import replay
+from test_replay import write_session
+
+class LappingRing(CircularBuffer):
+    """Capture ring whose writer laps the reader once, just as it starts copying"""
+    lap = None
+
+    def range_views(self, start_frame, end_frame):
+        views = super().range_views(start_frame, end_frame)
+        if self.lap is not None:
+            lap, self.lap = self.lap, None
+            self.write(lap)
+        return views
+
+def test_blackbox_ring():
+    """Segments hold the newest audio at stable positions, flush whole pages and continue after a restart"""
+    print("Testing black box segment ring...")
+
+    rng = np.random.default_rng(5)
+    audio = (rng.standard_normal((96000, 2)) * 3000).astype(np.int16)
+    with tempfile.TemporaryDirectory() as tmp:
+        ring = CircularBuffer(1, 48000, 2, np.int16)
+        # Four 0.25s segments: the black box holds the last second
+        recorder = BlackBoxRecorder(tmp, ring, 12000, 4, 48000)
+        assert recorder.first_sequence == 0 and recorder.position(100) == 100
+        for start in range(0, 72000, 1000):
+            ring.write(audio[start:start + 1000].reshape(-1))
+            if start and start % 15000 == 0:
+                recorder.write_pending()
+                # Only whole pages are flushed and counted until the segment is closed
+                header = blackbox_segments(tmp)[-1]
+                assert header['frames'] == 12000 or header['frames'] * 4 % mmap.PAGESIZE == 0
+        recorder.stop()
+
+        segments = blackbox_segments(tmp)
+        print(f"{len(segments)} segments: {[(s['sequence'], s['frames']) for s in segments]}")
+        assert [s['sequence'] for s in segments] == [2, 3, 4, 5]
+        assert all(s['path'].stat().st_size == s['data_offset'] + 12000 * 4 for s in segments)
+        assert segments[-1]['frames'] == 72000 - 5 * 12000
+
+        recorded, sample_rate, missing = read_blackbox(tmp, 20000, 72000)
+        assert sample_rate == 48000 and recorded.shape == (52000, 2)
+        # Slot 0 was reused for segment 4, so the start of segment 1 is gone
+        assert missing == 24000 - 20000
+        assert not recorded[:4000].any()
+        assert np.array_equal(recorded[4000:], audio[24000:72000])
+        assert position_at(tmp, segments[0]['start_time'] + 0.1) == 24000 + 4800
+
+        # A new run starts a new segment; a capture ring lapped between copies is recorded as silence
+        # (with a two second black box this time)
+        ring = CircularBuffer(1, 48000, 2, np.int16)
+        recorder = BlackBoxRecorder(tmp, ring, 12000, 8, 48000)
+        assert recorder.first_sequence == 6 and recorder.position(0) == 72000
+        ring.write(audio.reshape(-1))
+        recorder.stop()
+        assert recorder.lost_frames == 48000
+        recorded, _, missing = read_blackbox(tmp, 72000, 72000 + 96000)
+        assert missing == 0
+        assert not recorded[:48000].any()
+        assert np.array_equal(recorded[48000:], audio[48000:])
+
+        # Frames the capture ring overwrites while they are being copied are recorded as silence too
+        ring = LappingRing(1, 48000, 2, np.int16)
+        recorder = BlackBoxRecorder(Path(tmp) / 'lapped', ring, 12000, 8, 48000)
+        ring.write(audio[:48000].reshape(-1))
+        ring.lap = audio[48000:49000].reshape(-1)
+        recorder.write_pending()
+        recorder.stop()
+        assert recorder.lost_frames == 1000
+        recorded, _, missing = read_blackbox(Path(tmp) / 'lapped', 0, 49000)
+        assert missing == 0
+        assert not recorded[:1000].any()
+        assert np.array_equal(recorded[1000:], audio[1000:49000])
+
+    print("Black box ring test passed!")
+    return True
+
+def test_blackbox_events():
+    """Catalogued events point into the black box, and slicing it reproduces them and the whole session"""
+    print("\nTesting black box event positions...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            write_session(session, [1.0, 1.3, 6.0])
+            _, session_audio = wavfile.read(str(session))
+            CONFIG['BLACKBOX'] = True
+            CONFIG['BLACKBOX_SEGMENT_SECONDS'] = 4
+
+            for sample_format in ('float32', 'int16'):
+                CONFIG['SAMPLE_FORMAT'] = sample_format
+                output_dir = Path(tmp) / sample_format
+                replay([session], output_dir)
+                blackbox_dir = output_dir / 'blackbox'
+
+                catalog = EventCatalog()
+                catalog.open(output_dir / CATALOG_FILE)
+                rows = catalog.query()
+                catalog.close()
+                assert len(rows) == 2
+                for row in rows:
+                    _, saved = wavfile.read(str(output_dir / row['file_path']))
+                    recorded, _, missing = read_blackbox(blackbox_dir, row['blackbox_frame'],
+                                                         row['blackbox_frame'] + len(saved))
+                    print(f"{sample_format} {row['file_path']}: black box frame {row['blackbox_frame']}")
+                    assert missing == 0
+                    assert np.array_equal(recorded, saved)
+
+                # The whole session is there, not just the events
+                recorded, _, missing = read_blackbox(blackbox_dir, 0, len(session_audio))
+                assert missing == 0
+                if sample_format == 'int16':
+                    assert np.array_equal(recorded, session_audio)
+                assert [s['sequence'] for s in blackbox_segments(blackbox_dir)] == [0, 1, 2]
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Black box event test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Black Box Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_blackbox_ring()
+    test2_passed = test_blackbox_events()
+    print(f"Black Box Ring Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Black Box Event Test: {'PASSED' if test2_passed else 'FAILED'}")
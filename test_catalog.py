@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the SQLite event catalog
+"""
+
+import json
+import time
+import tempfile
+from pathlib import Path
+import numpy as np
+from scipy.io import wavfile
+
+from gunshot_logger import CONFIG, GunshotLogger
+from gunshot_catalog import CATALOG_FILE, EVENT_TIME, EventCatalog
+from gunshot_replay import replay
+from test_replay import write_session
+
+def test_catalog_query():
+    """Rows can be filtered by time and level and duplicate files are ignored"""
+    print("Testing catalog queries...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = EventCatalog()
+        catalog.open(Path(tmp) / CATALOG_FILE)
+        rows = [
+            {'number': i, 'trigger_time': 1000.0 + i * 60, 'peak_db': -30.0 + i * 5,
+             'duration': 1.5, 'file_path': f"gunshots/gunshot_{i:03d}.wav", 'file_size': 1000}
+            for i in range(1, 7)
+        ]
+        catalog.insert_many(rows)
+        catalog.insert_many(rows[:2])
+
+        assert catalog.count() == 6
+        assert catalog.max_number() == 6
+        assert catalog.count(min_db=-10) == 3
+        matches = catalog.query(since=1000.0 + 120, until=1000.0 + 300, min_db=-20)
+        print(f"Matched numbers: {[row['number'] for row in matches]}")
+        assert [row['number'] for row in matches] == [2, 3, 4]
+        assert catalog.query(limit=1)[0]['number'] == 1
+
+        # Time filters and ordering are served by the event time index, not a scan and sort
+        where, params = catalog._where(since=1000.0, until=2000.0)
+        plan = ' '.join(row[3] for row in catalog._conn.execute(
+            f'EXPLAIN QUERY PLAN SELECT * FROM events{where} ORDER BY {EVENT_TIME}', params))
+        print(f"Query plan: {plan}")
+        assert 'idx_events_event_time' in plan and 'TEMP B-TREE' not in plan
+        catalog.close()
+
+        # Reopening keeps the rows
+        catalog.open(Path(tmp) / CATALOG_FILE)
+        assert catalog.count() == 6
+        catalog.close()
+
+    print("Catalog query test passed!")
+    return True
+
+def test_catalog_rebuild():
+    """A lost catalog can be rebuilt from the saved WAV files"""
+    print("\nTesting catalog rebuild...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gunshot_dir = Path(tmp) / 'gunshots'
+        gunshot_dir.mkdir()
+        rng = np.random.default_rng(1)
+        for i, gain in enumerate((0.05, 0.5), start=1):
+            audio = rng.standard_normal((48000, 2)) * gain
+            audio[:, 1] *= 0.5
+            wavfile.write(str(gunshot_dir / f"gunshot_{i:03d}.wav"), 48000,
+                          (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16))
+
+        catalog = EventCatalog()
+        catalog.open(Path(tmp) / CATALOG_FILE)
+        assert catalog.rebuild(tmp) == 2
+        assert catalog.rebuild(tmp) == 0
+
+        rows = catalog.query()
+        print(f"Rebuilt peaks: {[round(row['peak_db'], 1) for row in rows]}")
+        assert [row['number'] for row in sorted(rows, key=lambda row: row['number'])] == [1, 2]
+        loud = catalog.query(number=2)[0]
+        assert loud['file_path'] == 'gunshots/gunshot_002.wav'
+        assert abs(loud['duration'] - 1.0) < 1e-9
+        # Both channels fold into the block level, like the detector's
+        assert abs(loud['peak_db'] - 20 * np.log10(np.sqrt((0.5 ** 2 + 0.25 ** 2) / 2))) < 0.5
+        left_db, right_db = json.loads(loud['channel_db'])
+        assert abs((left_db - right_db) - 20 * np.log10(2)) < 0.5
+        catalog.close()
+
+    print("Catalog rebuild test passed!")
+    return True
+
+def test_replay_catalog():
+    """Saved events are catalogued with sample-accurate times and numbering survives a restart"""
+    print("\nTesting catalog rows from replay...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            write_session(session, [1.0, 6.0])
+            output_dir = Path(tmp) / 'out'
+            started = time.time()
+            results = replay([session], output_dir)
+            assert results['saved_files'] == 2
+
+            catalog = EventCatalog()
+            catalog.open(output_dir / CATALOG_FILE)
+            # Replay stamps blocks with the wall clock as it races through them, so go by number
+            rows = sorted(catalog.query(), key=lambda row: row['number'])
+            catalog.close()
+            for row, event in zip(rows, results['events']):
+                print(f"{row['file_path']}: trigger {row['trigger_time']:.4f}s, "
+                      f"{row['peak_db']:.1f} dB, {row['duration']:.2f}s")
+                # Offsets within a block can put the trigger slightly ahead of the wall clock
+                assert started <= row['trigger_time'] <= time.time() + 1
+                pre_roll = (event['trigger_frame'] - event['start_frame']) / 48000
+                assert abs(row['start_time'] - (row['trigger_time'] - pre_roll)) < 1e-6
+                assert row['trigger_frame'] == event['trigger_frame']
+                assert abs(row['peak_db'] - event['peak_db']) < 1e-6
+                assert row['duration'] == (event['end_frame'] - event['start_frame']) / 48000
+                assert row['file_size'] == (output_dir / row['file_path']).stat().st_size
+                assert len(json.loads(row['channel_db'])) == 2
+            assert [row['number'] for row in rows] == [1, 2]
+
+            # A new logger picks up numbering from the catalog
+            CONFIG['LOG_FILE'] = str(output_dir / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(output_dir / 'spool')
+            CONFIG['METRICS_FILE'] = None
+            logger = GunshotLogger(output_dir, verify_mount=False)
+            assert logger.file_counter == 3
+            logger.catalog.close()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Replay catalog test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Event Catalog Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_catalog_query()
+    test2_passed = test_catalog_rebuild()
+    test3_passed = test_replay_catalog()
+    print(f"Catalog Query Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Catalog Rebuild Test: {'PASSED' if test2_passed else 'FAILED'}")
+    print(f"Replay Catalog Test: {'PASSED' if test3_passed else 'FAILED'}")
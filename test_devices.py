@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test script to verify multi-device capture with one worker process per device
+"""
+
+import json
+import queue
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import CONFIG, DetectionEvent, read_config_file
+from gunshot_catalog import CATALOG_FILE, EventCatalog
+from gunshot_devices import WORKER_KEYS, DeviceWorker, MultiDeviceLogger, SharedCircularBuffer
+
+def test_shared_ring():
+    """A ring attached by name sees the creator's samples and write head"""
+    print("Testing shared capture ring...")
+
+    ring = SharedCircularBuffer(1.0, 48000, 2, np.int16)
+    attached = SharedCircularBuffer(1.0, 48000, 2, np.int16, name=ring.name)
+    try:
+        block = np.arange(2048, dtype=np.int16)
+        for _ in range(50):
+            attached.write(block)
+        print(f"Writer at frame {attached.frames_written}, reader sees {ring.frames_written}")
+        assert ring.frames_written == attached.frames_written == 50 * 1024
+        assert ring.samples_claimed == attached.total_samples_written
+        np.testing.assert_array_equal(ring.read_range(49 * 1024, 50 * 1024), block)
+
+        # A ring attached later picks up where the writer is
+        late = SharedCircularBuffer(1.0, 48000, 2, np.int16, name=ring.name)
+        assert late.index == attached.index and late.is_full
+        late.close()
+    finally:
+        attached.close()
+        ring.close()
+
+    print("Shared ring test passed!")
+    return True
+
+def test_synthetic_devices():
+    """Each device's shots are saved from its own ring and catalogued with its id"""
+    print("\nTesting multi-device capture with synthetic devices...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['METRICS_FILE'] = None
+            usb = Path(tmp) / 'usb'
+            usb.mkdir()
+            devices = [
+                ('lane1', {'duration': 4.0, 'shot_times': [1.0], 'speed': 4.0, 'seed': 1}),
+                ('lane2', {'duration': 4.0, 'shot_times': [0.8, 2.5], 'speed': 4.0, 'seed': 2}),
+            ]
+            logger = MultiDeviceLogger(devices, usb, verify_mount=False)
+            try:
+                logger.start()
+            finally:
+                logger.stop()
+            assert all(process.exitcode == 0 for process in logger.workers.values())
+
+            catalog = EventCatalog()
+            catalog.open(usb / CATALOG_FILE)
+            rows = sorted(catalog.query(), key=lambda row: row['number'])
+            catalog.close()
+            for row in rows:
+                print(f"{row['file_path']}: {row['device']}, {row['peak_db']:.1f} dB, {row['duration']:.2f}s")
+                assert Path(row['file_path']).stem == f"gunshot_{row['number']:03d}_{row['device']}"
+                assert row['file_size'] == (usb / row['file_path']).stat().st_size
+                assert row['peak_db'] > CONFIG['DETECTION_THRESHOLD']
+            assert [row['number'] for row in rows] == [1, 2, 3]
+            assert sorted(row['device'] for row in rows) == ['lane1', 'lane2', 'lane2']
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Synthetic devices test passed!")
+    return True
+
+def test_device_attribution():
+    """The device that hears a shot first is its lane, with the others' delays after it"""
+    print("\nTesting attribution between devices...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['METRICS_FILE'] = None
+            devices = [('lane1', 0), ('lane2', 1), ('lane3', 2)]
+            logger = MultiDeviceLogger(devices, tmp, verify_mount=False)
+            logger.running = True
+            try:
+                # The same shot reaches lane2 first, then lane3 40 frames and lane1 90 frames later
+                rng = np.random.default_rng(7)
+                shot = rng.standard_normal((2000, 2)).astype(np.float32) * 0.5
+                for device_id, delay in (('lane1', 90), ('lane2', 0), ('lane3', 40)):
+                    audio = (rng.standard_normal((96000, 2)) * 0.002).astype(np.float32)
+                    audio[48000 + delay:50000 + delay] += shot
+                    logger.rings[device_id].write(audio.reshape(-1))
+
+                # Triggers only line up to the block they landed in
+                events = []
+                for device_id in ('lane1', 'lane2', 'lane3'):
+                    event = DetectionEvent(24000, 96000, 48128, 1000.0 + 128 / 48000, -5.0)
+                    event.closed = True
+                    event.device = device_id
+                    events.append(event)
+                # A shot heard by one device only, well after the first
+                lone = DetectionEvent(60000, 96000, 80000, 1000.5, -5.0)
+                lone.closed = True
+                lone.device = 'lane3'
+
+                logger.analyze_arrivals(events + [lone])
+                for event in events + [lone]:
+                    print(f"{event.device} at {event.trigger_time:.3f}: lane {event.arrival['lane']}, "
+                          f"delay {event.arrival['device_delay'] * 48000:.1f} frames")
+                delays = {event.device: event.arrival['device_delay'] * 48000 for event in events}
+                assert all(event.arrival['lane'] == 'lane2' for event in events)
+                assert abs(delays['lane2']) < 1e-9
+                assert abs(delays['lane3'] - 40) < 0.5 and abs(delays['lane1'] - 90) < 0.5
+                assert lone.arrival['lane'] == 'lane3' and lone.arrival['device_delay'] == 0.0
+            finally:
+                logger.running = False
+                logger.catalog.close()
+                logger.log_handler.stop_writer()
+                for ring in logger.rings.values():
+                    ring.close()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Device attribution test passed!")
+    return True
+
+def test_device_config_reload():
+    """The supervisor applies reloads at once, and workers ignore the settings it sets for them"""
+    print("\nTesting config reload with device workers...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            config_file = Path(tmp) / 'gunshot_config.json'
+            settings = {'SPOOL_DIR': str(Path(tmp) / 'spool'), 'BLACKBOX_DIR': str(Path(tmp) / 'blackbox'),
+                        'STREAM_EVENTS': True, 'ANALYSIS_THREAD': True, 'METRICS_FILE': None,
+                        'DETECTION_THRESHOLD': -20}
+            config_file.write_text(json.dumps(settings))
+            CONFIG['CONFIG_FILE'] = str(config_file)
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            # As main() does before the workers start
+            CONFIG.update(read_config_file(config_file))
+            logger = MultiDeviceLogger([('lane1', 0)], tmp, verify_mount=False)
+            try:
+                config = logger.worker_config('lane1')
+                assert {key for key in config if config[key] != CONFIG[key]} <= WORKER_KEYS
+
+                config_file.write_text(json.dumps(dict(settings, DETECTION_THRESHOLD=-35, RETENTION_MAX_BYTES=10 ** 9)))
+                logger.check_config_reload()
+                assert not logger.config_updates and logger.config_rejections == 0
+                assert CONFIG['DETECTION_THRESHOLD'] == -35 and logger.storage.max_bytes == 10 ** 9
+
+                # A worker has its own copy of CONFIG; the file's SPOOL_DIR and the like are not changes to it
+                supervisor_config = dict(CONFIG)
+                CONFIG.update(config)
+                worker = DeviceWorker('lane1', logger.rings['lane1'].name, queue.Queue(), CONFIG['SPOOL_DIR'])
+                try:
+                    changes = worker.reload_config()
+                    print(f"Worker reload: {changes}, {worker.config_rejections} rejected")
+                    assert changes == {'DETECTION_THRESHOLD': -35, 'RETENTION_MAX_BYTES': 10 ** 9}
+                    worker.apply_settings(changes)
+                    # Nothing of the storage side is built in a worker, not even a spool directory
+                    assert worker.spool is None and worker.storage is None and worker.encoder is None
+                    assert not Path(config['SPOOL_DIR']).exists()
+                finally:
+                    worker.log_handler.stop_writer()
+                    worker.buffer.close()
+                CONFIG.update(supervisor_config)
+            finally:
+                logger.catalog.close()
+                logger.log_handler.stop_writer()
+                for ring in logger.rings.values():
+                    ring.close()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Device config reload test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Multi-Device Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_shared_ring()
+    test2_passed = test_synthetic_devices()
+    test3_passed = test_device_attribution()
+    test4_passed = test_device_config_reload()
+    print(f"Shared Ring Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Synthetic Devices Test: {'PASSED' if test2_passed else 'FAILED'}")
+    print(f"Device Attribution Test: {'PASSED' if test3_passed else 'FAILED'}")
+    print(f"Device Config Reload Test: {'PASSED' if test4_passed else 'FAILED'}")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Test script to verify logging stays off the real-time path
+"""
+
+import json
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+import gunshot_logger
+from gunshot_logger import CONFIG, JsonLinesFormatter, LogQueueHandler, RateLimiter
+from gunshot_replay import ReplayCallbackFlags, ReplayTimeInfo
+
+class SlowHandler(logging.Handler):
+    """Handler standing in for a stalled disk or journald"""
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.messages = []
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.unblock.wait(self.delay)
+        self.messages.append(self.format(record))
+
+def test_log_enqueue_benchmark():
+    """Logging from the audio thread costs one enqueue even when the writer is stalled"""
+    print("Testing log enqueue cost...")
+
+    slow = SlowHandler(delay=0.05)
+    handler = LogQueueHandler(256, slow)
+    logger = logging.getLogger('test_logging.enqueue')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    handler.start_writer()
+    try:
+        calls = 200
+        start = time.perf_counter_ns()
+        for i in range(calls):
+            logger.info(f"🎯 GUNSHOT DETECTED at {-10.0 + i * 0.01:.1f} dB")
+        per_call_us = (time.perf_counter_ns() - start) / calls / 1000
+
+        # A 21ms block leaves no room for a 50ms write; the caller never waits for it
+        print(f"Log call with stalled writer: {per_call_us:.1f}us per call, {len(slow.messages)} written so far")
+        assert per_call_us < 1000
+        assert len(slow.messages) < calls
+
+        # Records beyond the queue size are dropped and counted, not waited for
+        for _ in range(1000):
+            logger.info("flood")
+        assert handler.dropped > 0
+        print(f"Dropped {handler.dropped} records while the writer was stalled")
+    finally:
+        slow.unblock.set()
+        handler.stop_writer()
+        logger.removeHandler(handler)
+
+    assert slow.messages[0] == "🎯 GUNSHOT DETECTED at -10.0 dB"
+    print("Log enqueue test passed!")
+    return True
+
+def test_json_lines_format():
+    """JSON log format writes one parseable object per line"""
+    print("\nTesting JSON-lines log format...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'log.jsonl'
+        file_handler = logging.FileHandler(path)
+        file_handler.setFormatter(JsonLinesFormatter())
+        handler = LogQueueHandler(16, file_handler)
+        logger = logging.getLogger('test_logging.json')
+        logger.propagate = False
+        logger.addHandler(handler)
+        handler.start_writer()
+        logger.warning("Detection queue full, skipping %s", "detection")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Save failed")
+        handler.close()
+        logger.removeHandler(handler)
+
+        entries = [json.loads(line) for line in path.read_text().splitlines()]
+        print(f"Entries: {[entry['message'] for entry in entries]}")
+        assert [entry['level'] for entry in entries] == ['WARNING', 'ERROR']
+        assert entries[0]['message'] == "Detection queue full, skipping detection"
+        assert 'ValueError: boom' in entries[1]['exception']
+        assert 'time' in entries[0] and 'thread' in entries[0]
+
+    print("JSON log format test passed!")
+    return True
+
+def test_rate_limiter():
+    """Repeated messages are suppressed during the cooldown and counted in fixed slots"""
+    print("\nTesting rate limiter...")
+
+    limiter = RateLimiter(slots=2, cooldown=CONFIG['ERROR_COOLDOWN'])
+    assert limiter.check('queue_full', 0.0) == (True, 0)
+    for t in range(1, 5):
+        assert limiter.check('queue_full', float(t)) == (False, 0)
+    assert limiter.check('queue_full', CONFIG['ERROR_COOLDOWN'] + 1.0) == (True, 4)
+
+    # Keys past the slot count share the last slot instead of growing the table
+    assert limiter.check('audio_status', 0.0) == (True, 0)
+    assert limiter.check('spool_full', 1.0) == (False, 0)
+    assert len(limiter.slot_for) == 2
+
+    print("Rate limiter test passed!")
+    return True
+
+class RecordingHandler(logging.Handler):
+    """Keeps the records it is handed, unformatted"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def test_callback_logs_lazily():
+    """The callback path logs unformatted records and leaves the level summary to the writer thread"""
+    print("\nTesting callback-path logging...")
+
+    saved_config = dict(CONFIG)
+    recorder = RecordingHandler()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['METRICS_FILE'] = None
+            CONFIG['ANALYSIS_THREAD'] = False
+            CONFIG['DEBUG_INTERVAL'] = 0
+            logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+            logger.logger.addHandler(recorder)
+            block = CONFIG['BUFFER_SIZE']
+            quiet = np.full((block, 2), 0.001, dtype=np.float32)
+            loud = np.full((block, 2), 0.5, dtype=np.float32)
+            for audio in (quiet, quiet, loud):
+                logger.audio_callback(audio, block, ReplayTimeInfo(0.0), ReplayCallbackFlags())
+
+            messages = [record.msg for record in recorder.records]
+            print(f"Logged from the callback: {messages}")
+            assert not any(message.startswith("Audio levels") for message in messages)
+            detected = [record for record in recorder.records if 'GUNSHOT DETECTED' in record.msg]
+            assert len(detected) == 1 and detected[0].args and '%' in detected[0].msg
+
+            # The summary is built when the writer thread asks for it
+            logger.log_level_summary()
+            summary = recorder.records[-1].getMessage()
+            assert summary.startswith("Audio levels") and "callback p99" in summary
+            logger.logger.removeHandler(recorder)
+            logger.log_handler.stop_writer()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Callback logging test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Logging Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_log_enqueue_benchmark()
+    test2_passed = test_json_lines_format()
+    test3_passed = test_rate_limiter()
+    test4_passed = test_callback_logs_lazily()
+    print(f"Log Enqueue Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"JSON Log Format Test: {'PASSED' if test2_passed else 'FAILED'}")
+    print(f"Rate Limiter Test: {'PASSED' if test3_passed else 'FAILED'}")
+    print(f"Callback Logging Test: {'PASSED' if test4_passed else 'FAILED'}")
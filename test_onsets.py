@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-event shot counting
+"""
+
+import os
+import json
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from gunshot_logger import CONFIG, detect_onsets
+from gunshot_catalog import CATALOG_FILE, EventCatalog
+from gunshot_onsets import CACHE_SUFFIX, process_directory
+from gunshot_replay import replay
+from test_replay import write_session
+
+def test_detect_onsets():
+    """Each report in a string is found once, at its first loud frame"""
+    print("Testing onset detection...")
+
+    rng = np.random.default_rng(11)
+    audio = rng.standard_normal((96000, 2)) * 0.002
+    shots = [4800, 12000, 16800, 30000, 60000]
+    for start in shots:
+        # A sharp report with a decaying tail
+        audio[start:start + 6000] += (rng.standard_normal((6000, 2)) * 0.3
+                                      * np.exp(-np.arange(6000) / 1500)[:, None])
+    # A soft rustle barely above the background is not counted
+    audio[80000:82000] += rng.standard_normal((2000, 2)) * 0.004
+
+    for samples in (audio.astype(np.float32), (np.clip(audio, -1, 1) * 32767).astype(np.int16)):
+        onsets = detect_onsets(samples, 48000)
+        print(f"{samples.dtype}: onsets at {onsets.tolist()}")
+        # Including the one 100ms into the previous report's tail
+        assert len(onsets) == 5
+        assert np.all(np.abs(onsets - shots) <= 8)
+
+    # Reports closer than min_gap are merged into the one before
+    assert len(detect_onsets(audio, 48000, min_gap=0.15)) == 4
+    assert len(detect_onsets(audio[:256], 48000)) == 0
+
+    print("Onset detection test passed!")
+    return True
+
+def test_onset_batch():
+    """Batch mode counts reports in saved files, caches them and skips unchanged files"""
+    print("\nTesting batch onset counting...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            # A double tap, a triple and a single shot
+            write_session(session, [1.0, 1.3, 4.0, 4.2, 4.4, 8.0])
+            output_dir = Path(tmp) / 'out'
+            replay([session], output_dir)
+
+            catalog = EventCatalog()
+            catalog.open(output_dir / CATALOG_FILE)
+            live = {row['file_path']: row['shot_count'] for row in catalog.query()}
+            print(f"Counted while saving: {live}")
+            assert sorted(live.values()) == [1, 2, 3]
+            # Forget the counts, as for files saved before onset detection existed
+            catalog.update_many([{'file_path': path, 'shot_count': None, 'onsets': None} for path in live])
+            catalog.close()
+
+            summary = process_directory(output_dir, workers=2)
+            print(f"First run: {summary['analyzed']} analysed, {summary['cached']} cached, {summary['shots']} reports")
+            assert summary['analyzed'] == 3 and summary['cached'] == 0 and summary['shots'] == 6
+            for name, result in summary['results'].items():
+                assert (output_dir / (name + CACHE_SUFFIX)).exists()
+
+            catalog.open(output_dir / CATALOG_FILE)
+            rows = catalog.query()
+            catalog.close()
+            assert {row['file_path']: row['shot_count'] for row in rows} == live
+            assert all(len(json.loads(row['onsets'])) == row['shot_count'] for row in rows)
+
+            # Unchanged files come from the cache; a touched file is analysed again
+            summary = process_directory(output_dir, workers=2)
+            assert summary['analyzed'] == 0 and summary['cached'] == 3 and summary['shots'] == 6
+            touched = output_dir / sorted(live)[0]
+            os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 1000))
+            summary = process_directory(output_dir, workers=2)
+            assert summary['analyzed'] == 1 and summary['cached'] == 2
+
+            # Changing the detection settings invalidates every cached result
+            CONFIG['ONSET_MIN_GAP'] = 0.5
+            summary = process_directory(output_dir, workers=2)
+            print(f"With a 0.5s gap: {summary['shots']} reports")
+            assert summary['analyzed'] == 3 and summary['shots'] == 3
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Batch onset test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Onset Detection Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_detect_onsets()
+    test2_passed = test_onset_batch()
+    print(f"Onset Detection Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Batch Onset Test: {'PASSED' if test2_passed else 'FAILED'}")
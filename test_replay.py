@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+"""
+Test script to verify offline replay through the detection path
+"""
+
+import os
+import sys
+import json
+import signal
+import time
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+import numpy as np
+from scipy.io import wavfile
+
+import gunshot_logger
+from gunshot_logger import CONFIG
+from gunshot_blackbox import position_at, read_blackbox
+from gunshot_catalog import CATALOG_FILE, EventCatalog
+from gunshot_replay import ReplayCallbackFlags, ReplayInputStream, ReplayTimeInfo, replay
+
+def write_session(path, shot_times, duration=10.0, sample_rate=48000):
+    """Write a quiet stereo session with loud bursts at the given times"""
+    rng = np.random.default_rng(42)
+    audio = rng.standard_normal((int(duration * sample_rate), 2)) * 0.002
+    for shot_time in shot_times:
+        start = int(shot_time * sample_rate)
+        audio[start:start + 2000] += rng.standard_normal((2000, 2)) * 0.6
+    wavfile.write(str(path), sample_rate, (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16))
+
+class FlakyStream:
+    """Stand-in for sd.InputStream that plays audio in real time, then goes quiet but stays active"""
+    def __init__(self, audio, blocksize, callback):
+        self.audio = audio
+        self.blocksize = blocksize
+        self.callback = callback
+        self.block_times = []
+        self.done = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def active(self):
+        return not self._stop.is_set()
+
+    def run(self):
+        started = time.monotonic()
+        for start in range(0, len(self.audio), self.blocksize):
+            if self._stop.wait(max(started + start / 48000 - time.monotonic(), 0)):
+                return
+            block = self.audio[start:start + self.blocksize]
+            self.block_times.append(time.time())
+            # No ADC timestamps, so blocks are stamped with the time the callback ran
+            self.callback(block, len(block), ReplayTimeInfo(0.0), ReplayCallbackFlags())
+        self.done.set()
+
+    def __enter__(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+def test_replay_session():
+    """Replay detects shots, coalesces rapid fire and saves one file per event"""
+    print("Testing offline replay...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = Path(tmp) / 'session.wav'
+        # A double tap at 1.0/1.3s and a single shot at 6.0s
+        write_session(session, [1.0, 1.3, 6.0])
+
+        for analysis_thread in (False, True):
+            output_dir = Path(tmp) / f"out_{analysis_thread}"
+            before = dict(CONFIG)
+            results = replay([session], output_dir, analysis_thread=analysis_thread)
+            # Nothing replay set for itself leaks into the caller's settings
+            assert CONFIG == before
+
+            print(f"Analysis thread={analysis_thread}: {results['detections']} detections, "
+                  f"{results['real_time_factor']:.0f}x real time")
+            assert results['blocks'] == int(np.ceil(10.0 * 48000 / CONFIG['BUFFER_SIZE']))
+            assert results['detections'] == 2
+            assert results['saved_files'] == 2
+            assert results['overwritten_detections'] == 0
+
+    print("Replay test passed!")
+    return True
+
+def test_int16_matches_float32():
+    """Native int16 capture makes the same detection decisions as float32"""
+    print("\nTesting int16 and float32 detection parity...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            # Include a shot just above and one just below the threshold
+            write_session(session, [1.0, 1.3, 4.0, 6.0, 8.5])
+            rate, audio = wavfile.read(str(session))
+            audio[int(4.0 * rate):int(4.0 * rate) + 2000] //= 8
+            wavfile.write(str(session), rate, audio)
+
+            results = {}
+            for sample_format in ('float32', 'int16'):
+                CONFIG['SAMPLE_FORMAT'] = sample_format
+                results[sample_format] = replay([session], Path(tmp) / sample_format)
+
+            float_events = results['float32']['events']
+            int_events = results['int16']['events']
+            print(f"float32: {len(float_events)} events, int16: {len(int_events)} events")
+            assert len(float_events) == len(int_events) > 0
+            for float_event, int_event in zip(float_events, int_events):
+                for key in ('start_frame', 'end_frame', 'trigger_frame', 'trigger_count'):
+                    assert float_event[key] == int_event[key]
+                assert abs(float_event['peak_db'] - int_event['peak_db']) < 1e-3
+            assert results['float32']['saved_files'] == results['int16']['saved_files']
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Sample format parity test passed!")
+    return True
+
+def test_flac_output_is_lossless():
+    """FLAC events decode to exactly the samples the WAV path writes"""
+    print("\nTesting FLAC event output...")
+
+    if gunshot_logger.soundfile is None:
+        print("soundfile not installed, skipping FLAC test")
+        return True
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            write_session(session, [1.0, 6.0])
+
+            results = {}
+            for output_format in ('wav', 'flac'):
+                CONFIG['OUTPUT_FORMAT'] = output_format
+                results[output_format] = replay([session], Path(tmp) / output_format)
+
+            assert results['flac']['saved_files'] == results['wav']['saved_files'] == 2
+            assert results['flac']['saved_bytes'] < results['wav']['saved_bytes']
+            for wav_path in sorted((Path(tmp) / 'wav' / CONFIG['GUNSHOT_DIR']).rglob('*.wav')):
+                # Each run files its events by hour, so look the FLAC up by name
+                flac_path = next((Path(tmp) / 'flac' / CONFIG['GUNSHOT_DIR']).rglob(f"{wav_path.stem}.flac"))
+                decoded, rate = gunshot_logger.soundfile.read(str(flac_path), dtype='int16')
+                assert rate == 48000
+                assert np.array_equal(decoded, wavfile.read(str(wav_path))[1])
+            print(f"WAV {results['wav']['saved_bytes']} bytes, FLAC {results['flac']['saved_bytes']} bytes")
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("FLAC output test passed!")
+    return True
+
+def test_flac_streamed_event_grows():
+    """A streamed FLAC event keeps every frame when another shot extends it after it was queued"""
+    print("\nTesting streamed FLAC event growth...")
+
+    if gunshot_logger.soundfile is None:
+        print("soundfile not installed, skipping FLAC test")
+        return True
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['OUTPUT_FORMAT'] = 'flac'
+            CONFIG['STREAM_EVENTS'] = True
+            CONFIG['ANALYSIS_THREAD'] = False
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['BLACKBOX_DIR'] = str(Path(tmp) / 'blackbox')
+            CONFIG['METRICS_FILE'] = str(Path(tmp) / 'gunshot_metrics.prom')
+            session = Path(tmp) / 'session.wav'
+            # The second shot lands in the first one's post-roll
+            write_session(session, [1.0, 1.6], duration=3.5)
+            audio = wavfile.read(str(session))[1].astype(np.float32) / 32768
+            block = CONFIG['BUFFER_SIZE']
+
+            logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+            ReplayInputStream(audio[:int(1.2 * 48000)], 48000, block, logger.audio_callback).run()
+            event = logger.detection_queue.get_nowait()
+            queued_frames = event.num_frames
+            assert not event.closed
+            # Charged against the queue for the longest it can grow to
+            assert event.queued_bytes == logger.event_capture.max_frames * logger.detection_queue.bytes_per_frame
+
+            # Save while the event is open, as the writer thread does live
+            logger.running = True
+            saver = threading.Thread(target=logger.persist_event, args=(event,))
+            saver.start()
+            time.sleep(0.1)
+            ReplayInputStream(audio[int(1.2 * 48000):], 48000, block, logger.audio_callback,
+                              lambda: time.sleep(0.002)).run()
+            saver.join(timeout=10)
+            logger.running = False
+            logger.encoder.shutdown()
+            logger.spool.flush()
+            logger.log_handler.stop_writer()
+
+            assert event.closed
+            assert event.num_frames > queued_frames
+            flac_path = next((Path(tmp) / CONFIG['GUNSHOT_DIR']).rglob('*.flac'))
+            decoded, rate = gunshot_logger.soundfile.read(str(flac_path), dtype='int16')
+            print(f"Queued at {queued_frames} frames, saved {len(decoded)}")
+            assert len(decoded) == event.num_frames
+            second_shot = int(1.6 * 48000) - event.start_frame
+            assert np.abs(decoded[second_shot:second_shot + 2000]).max() > 10000
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Streamed FLAC event growth test passed!")
+    return True
+
+def stub_encode(path, audio, sample_rate):
+    """Stand-in for encode_flac that needs no soundfile: raw int16 samples, half of them"""
+    data = np.ascontiguousarray(audio[::2]).tobytes()
+    Path(path).write_bytes(data)
+    return len(data), 0.001
+
+def failing_encode(path, audio, sample_rate):
+    Path(path).write_bytes(b"partial")
+    raise RuntimeError("encoder crashed")
+
+def test_encoder_pool_handoff():
+    """Events handed to the encoder pool land in the spool once encoded, or as WAV if encoding fails"""
+    print("\nTesting encoder pool handoff...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['STREAM_EVENTS'] = False
+            CONFIG['ANALYSIS_THREAD'] = False
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['METRICS_FILE'] = None
+            session = Path(tmp) / 'session.wav'
+            write_session(session, [1.0, 4.0], duration=6.0)
+            audio = wavfile.read(str(session))[1].astype(np.float32) / 32768
+
+            for encode, suffix in ((stub_encode, '.flac'), (failing_encode, '.wav')):
+                CONFIG['SPOOL_DIR'] = str(Path(tmp) / f"spool-{encode.__name__}")
+                logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+                # A pool of one with room for one pending encode, so the second submit waits for the first
+                logger.encoder = gunshot_logger.EventEncoder(1, 1, encode=encode)
+                ReplayInputStream(audio, 48000, CONFIG['BUFFER_SIZE'], logger.audio_callback).run()
+                events = []
+                while not logger.detection_queue.empty():
+                    events.append(logger.detection_queue.get_nowait())
+                assert len(events) == 2
+                logger.running = True
+                for event in events:
+                    logger.persist_event(event)
+                logger.encoder.shutdown()
+                logger.running = False
+                logger.log_handler.stop_writer()
+
+                spooled = logger.spool.file_names()
+                print(f"{encode.__name__}: spooled {spooled}, {logger.encoded_events} encoded")
+                assert [Path(name).suffix for name in spooled] == [suffix, suffix]
+                assert logger.encoded_events == (2 if encode is stub_encode else 0)
+                assert logger.detection_queue.pending_bytes == 0
+                # Only the finished files are spooled, and the spool is charged for exactly what is on disk
+                spool_dir = Path(CONFIG['SPOOL_DIR'])
+                on_disk = [path for path in spool_dir.iterdir() if path.suffix != '.json']
+                # (a failed encode leaves no partial .flac behind)
+                assert {path.suffix for path in on_disk} == {suffix, gunshot_logger.SIDECAR_SUFFIX}
+                assert logger.spool.pending_bytes == sum(path.stat().st_size for path in on_disk)
+                if encode is stub_encode:
+                    for event, name in zip(events, spooled):
+                        assert (spool_dir / name).stat().st_size == (event.num_frames + 1) // 2 * 2 * 2
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Encoder pool handoff test passed!")
+    return True
+
+def test_replay_metrics():
+    """Replay leaves a Prometheus metrics file describing the run"""
+    print("\nTesting pipeline metrics...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = Path(tmp) / 'session.wav'
+        write_session(session, [1.0, 6.0])
+        results = replay([session], Path(tmp) / 'out')
+
+        metrics = {}
+        for line in (Path(tmp) / 'out' / 'gunshot_metrics.prom').read_text().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                metrics[name] = float(value)
+
+        print(f"{metrics['gunshot_callback_seconds_count']:.0f} callbacks, "
+              f"{metrics['gunshot_callback_seconds_sum'] * 1000:.1f}ms total, "
+              f"{metrics['gunshot_usb_written_bytes_total']:.0f} bytes to USB")
+        assert metrics['gunshot_callback_seconds_count'] == results['blocks']
+        assert metrics['gunshot_callback_seconds_sum'] > 0
+        assert metrics['gunshot_input_overflows_total'] == 0
+        assert metrics['gunshot_detections_total'] == 2
+        assert metrics['gunshot_detection_queue_depth'] == 0
+        assert metrics['gunshot_save_seconds_count'] == 2
+        assert metrics['gunshot_usb_written_files_total'] == 2
+        # Review sidecars travel to USB with their events
+        sidecar_bytes = sum(path.stat().st_size for path in (Path(tmp) / 'out' / 'gunshots').rglob('*.peaks'))
+        assert sidecar_bytes > 0
+        assert metrics['gunshot_usb_written_bytes_total'] == results['saved_bytes'] + sidecar_bytes
+        assert metrics['gunshot_spool_bytes'] == 0
+
+    print("Metrics test passed!")
+    return True
+
+def test_adaptive_detector_rising_noise():
+    """The adaptive detector follows rising background noise that false-triggers a fixed threshold"""
+    print("\nTesting adaptive noise-floor detector...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Background noise ramps from -54dB to -17dB over 30s (HVAC spinning up,
+            # range chatter), then holds; shots land in both quiet and loud stretches
+            sample_rate = 48000
+            duration = 45.0
+            shot_times = [3.0, 20.0, 36.0, 41.0]
+            rng = np.random.default_rng(7)
+            t = np.arange(int(duration * sample_rate)) / sample_rate
+            noise_db = np.minimum(-54 + 37 * t / 30, -17)
+            audio = rng.standard_normal((len(t), 2)) * (10 ** (noise_db / 20))[:, None]
+            for shot_time in shot_times:
+                start = int(shot_time * sample_rate)
+                audio[start:start + 4000] += rng.standard_normal((4000, 2)) * 0.6
+            session = Path(tmp) / 'session.wav'
+            wavfile.write(str(session), sample_rate, (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16))
+
+            results = {}
+            for detector in ('fixed', 'adaptive'):
+                CONFIG['DETECTOR'] = detector
+                CONFIG['ADAPTIVE_MARGIN_DB'] = 10
+                results[detector] = replay([session], Path(tmp) / detector, shot_times=shot_times)
+                print(f"{detector}: {results[detector]['true_detections']} true, "
+                      f"{results[detector]['false_detections']} false, "
+                      f"{results[detector]['missed_shots']} missed")
+
+            assert results['fixed']['false_detections'] > 0
+            assert results['adaptive']['false_detections'] == 0
+            assert results['adaptive']['missed_shots'] == 0
+            assert abs(results['adaptive']['noise_floor_db'] - (-17)) < 1.5
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Adaptive detector test passed!")
+    return True
+
+def test_replay_arrival():
+    """A shot that reaches channel 1 later is given a channel delay, bearing and lane"""
+    print("\nTesting arrival analysis...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session = Path(tmp) / 'session.wav'
+            write_session(session, [1.0, 1.3, 6.0])
+            rate, audio = wavfile.read(str(session))
+            # Channel 1 hears everything 6 frames (125us) after channel 0
+            audio[6:, 1] = audio[:-6, 0]
+            wavfile.write(str(session), rate, audio)
+
+            CONFIG['MIC_SPACING'] = 0.1
+            CONFIG['LANE_BEARINGS'] = {'left': 30, 'right': -30}
+            output_dir = Path(tmp) / 'out'
+            results = replay([session], output_dir)
+
+            expected_bearing = np.degrees(np.arcsin(6 / 48000 * 343.0 / 0.1))
+            for event in results['events']:
+                arrival = event['arrival']
+                print(f"Frame {event['trigger_frame']}: delay {arrival['tdoa'][0] * 1e6:.1f}us, "
+                      f"bearing {arrival['bearing']:.1f}, lane {arrival['lane']}")
+                assert abs(arrival['tdoa'][0] * 48000 - 6) < 0.25
+                assert abs(arrival['bearing'] - expected_bearing) < 2
+                assert arrival['lane'] == 'left'
+            assert len(results['events']) == 2
+
+            catalog = EventCatalog()
+            catalog.open(output_dir / CATALOG_FILE)
+            rows = catalog.query(lane='left')
+            catalog.close()
+            assert len(rows) == 2
+            assert all(abs(json.loads(row['tdoa'])[0] * 48000 - 6) < 0.25 for row in rows)
+            assert 'gunshot_arrival_seconds_count 2' in (output_dir / 'gunshot_metrics.prom').read_text()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Arrival analysis test passed!")
+    return True
+
+def test_fast_start_checks():
+    """Fast start arms on the first block and checks the microphone on live audio, without importing scipy"""
+    print("\nTesting fast start...")
+
+    # Importing the logger leaves the FFT code for the writer thread to load
+    imported = subprocess.run([sys.executable, '-c', "import sys, gunshot_logger; print('scipy' in sys.modules)"],
+                              capture_output=True, text=True, check=True, cwd=Path(__file__).parent)
+    assert imported.stdout.strip() == 'False'
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['HEALTH_CHECK_SECONDS'] = 1.0
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['METRICS_FILE'] = str(Path(tmp) / 'gunshot_metrics.prom')
+            rng = np.random.default_rng(3)
+
+            checks = {}
+            for name, audio in (('live', rng.standard_normal((96000, 2)).astype(np.float32) * 0.01),
+                                ('dead', np.zeros((96000, 2), dtype=np.float32))):
+                logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+                logger.check_startup()
+                assert logger.startup_seconds is None and logger.microphone_ok is None
+
+                ReplayInputStream(audio[:24000], 48000, CONFIG['BUFFER_SIZE'], logger.audio_callback).run()
+                logger.check_startup()
+                # Armed, but not enough audio for the microphone check yet
+                assert 0 < logger.startup_seconds < 60
+                assert logger.microphone_ok is None
+
+                ReplayInputStream(audio[24000:], 48000, CONFIG['BUFFER_SIZE'], logger.audio_callback).run()
+                logger.check_startup()
+                checks[name] = logger.microphone_ok
+                metrics = '\n'.join(logger.collect_metrics())
+                assert f"gunshot_microphone_ok {int(logger.microphone_ok)}" in metrics
+                assert 'gunshot_startup_seconds ' in metrics
+                print(f"{name}: armed after {logger.startup_seconds:.2f}s, microphone ok: {logger.microphone_ok}")
+                logger.log_handler.stop_writer()
+
+            assert checks == {'live': True, 'dead': False}
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Fast start test passed!")
+    return True
+
+def test_config_hot_reload():
+    """Reloaded detector settings apply between blocks; settings that need the stream reopened are rejected"""
+    print("\nTesting config hot reload...")
+
+    saved_config = dict(CONFIG)
+    saved_handler = signal.getsignal(signal.SIGHUP)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            config_file = Path(tmp) / 'gunshot_config.json'
+            CONFIG['CONFIG_FILE'] = str(config_file)
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['METRICS_FILE'] = str(Path(tmp) / 'gunshot_metrics.prom')
+            block = CONFIG['BUFFER_SIZE']
+            # A -26 dB burst in every second of quiet noise: below the default -20 dB threshold
+            rng = np.random.default_rng(6)
+            audio = (rng.standard_normal((48000 * 4, 2)) * 0.001).astype(np.float32)
+            for second in range(4):
+                audio[second * 48000 + 24000:second * 48000 + 26400] = 0.05
+
+            logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+            ring = logger.buffer
+            ReplayInputStream(audio[:48000], 48000, block, logger.audio_callback).run()
+            assert logger.queued_events == 0
+
+            # A changed file is picked up and swapped in on the next block
+            config_file.write_text(json.dumps({'DETECTION_THRESHOLD': -35, 'POST_TRIGGER': 0.5, 'DEBUG_INTERVAL': 1}))
+            logger.check_config_reload()
+            assert CONFIG['DETECTION_THRESHOLD'] == -20 and len(logger.config_updates) == 1
+            ReplayInputStream(audio[48000:96000], 48000, block, logger.audio_callback).run()
+            assert CONFIG['DETECTION_THRESHOLD'] == -35 and CONFIG['DEBUG_INTERVAL'] == 1
+            assert logger.event_capture.post_frames == 24000
+            assert logger.queued_events == 1
+            # Same ring, still counting frames from the start of the stream
+            assert logger.buffer is ring and ring.frames_written == 96000
+
+            # Any setting that needs the stream reopened rejects the whole file
+            config_file.write_text(json.dumps({'DETECTION_THRESHOLD': -50, 'BUFFER_SIZE': block * 2}))
+            logger.check_config_reload()
+            assert not logger.config_updates and logger.config_rejections == 1
+            for overrides, message in (({'DETECTION_THRESHOLD': -50, 'BUFFER_SIZE': block * 2}, 'reopened'),
+                                       ({'DETECTION_THRESHOLD': -50, 'CAPTURE_DELAY': 0.1}, 'Unknown'),
+                                       ({'DETECTION_THRESHOLD': 'loud'}, 'should be a number'),
+                                       ({'POST_TRIGGER': 60.0}, 'capture ring'),
+                                       ({'PRE_TRIGGER': 20.0, 'POST_TRIGGER': 15.0}, 'capture ring'),
+                                       ({'PRE_TRIGGER': 3.0}, 'MAX_EVENT_DURATION'),
+                                       ({'PRE_TRIGGER': -0.1}, 'non-negative')):
+                config_file.write_text(json.dumps(overrides))
+                try:
+                    gunshot_logger.reload_changes(gunshot_logger.read_config_file(config_file))
+                    assert False, f"{overrides} was accepted"
+                except gunshot_logger.ConfigError as e:
+                    print(f"Rejected {overrides}: {e}")
+                    assert message in str(e)
+
+            # The last rejected file is rejected once, and again on SIGHUP even though it has not changed
+            logger.check_config_reload()
+            logger.check_config_reload()
+            assert logger.config_rejections == 2
+            signal.signal(signal.SIGHUP, logger.request_config_reload)
+            os.kill(os.getpid(), signal.SIGHUP)
+            logger.check_config_reload()
+            assert logger.config_rejections == 3 and not logger.config_updates
+
+            # Unchanged stream settings may stay in the file
+            config_file.write_text(json.dumps({'DETECTION_THRESHOLD': -40, 'SAMPLE_RATE': 48000}))
+            logger.check_config_reload()
+            assert list(logger.config_updates) == [{'DETECTION_THRESHOLD': -40}]
+            ReplayInputStream(audio[96000:], 48000, block, logger.audio_callback).run()
+            assert CONFIG['DETECTION_THRESHOLD'] == -40 and not logger.config_updates
+            assert logger.queued_events == 3
+
+            metrics = '\n'.join(logger.collect_metrics())
+            assert 'gunshot_config_reloads_total 2' in metrics
+            assert 'gunshot_config_rejected_total 3' in metrics
+            logger.log_handler.stop_writer()
+    finally:
+        signal.signal(signal.SIGHUP, saved_handler)
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Config hot reload test passed!")
+    return True
+
+def test_stream_recovery():
+    """A stalled stream is reopened in place; the gap is measured and events and the black box stay on time"""
+    print("\nTesting stream recovery...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['METRICS_FILE'] = str(Path(tmp) / 'gunshot_metrics.prom')
+            CONFIG['BLACKBOX'] = True
+            CONFIG['BLACKBOX_DIR'] = str(Path(tmp) / 'blackbox')
+            CONFIG['BLACKBOX_FLUSH_INTERVAL'] = 0.2
+            CONFIG['STREAM_STALL_SECONDS'] = 0.3
+            CONFIG['STREAM_RETRY_INTERVAL'] = 0.1
+            block = CONFIG['BUFFER_SIZE']
+            rng = np.random.default_rng(8)
+            audio = (rng.standard_normal((48000 * 3, 2)) * 0.002).astype(np.float32)
+            # A shot 0.2s into the reopened stream, so its pre-trigger reaches back across the gap
+            audio[48000 + 9600:48000 + 11600] += 0.3
+
+            logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+            ring = logger.buffer
+            # The stream plays a second and stalls, the device is gone for one attempt, then it is back
+            first = FlakyStream(audio[:48000], block, logger.audio_callback)
+            second = FlakyStream(audio[48000:], block, logger.audio_callback)
+            opens = [first, RuntimeError("Error opening InputStream: Device unavailable"), second]
+            reopened = []
+
+            def open_input_stream(reopen=False):
+                reopened.append(reopen)
+                stream = opens.pop(0)
+                if isinstance(stream, Exception):
+                    raise stream
+                return stream
+
+            logger.open_input_stream = open_input_stream
+            logger.running = True
+            logger.blackbox.start()
+            supervisor = threading.Thread(target=logger.run_stream)
+            supervisor.start()
+            assert second.done.wait(10)
+            logger.running = False
+            supervisor.join()
+            logger.blackbox.stop()
+            assert reopened == [False, True, True]
+            assert logger.buffer is ring and ring.frames_written == len(audio)
+
+            # The gap is the time between the stalled stream's last block and the new stream's first
+            expected_gap = second.block_times[0] - (first.block_times[-1] + (48000 % block) / 48000)
+            gap = logger.stream_gaps.total
+            print(f"Gap: {gap} frames ({gap / 48000:.3f}s, expected {expected_gap:.3f}s) at frame "
+                  f"{logger.stream_gaps.frames}")
+            assert len(logger.stream_gaps) == 1 and logger.stream_gaps.frames == [48000]
+            assert gap / 48000 > CONFIG['STREAM_STALL_SECONDS']
+            assert abs(gap / 48000 - expected_gap) < 0.005
+
+            # The event survived the reopen in the detection queue and is saved with its true start time
+            event = logger.detection_queue.get_nowait()
+            assert event.closed and event.start_frame < 48000 < event.trigger_frame
+            logger.persist_event(event)
+            logger.spool.flush()
+            catalog = EventCatalog()
+            catalog.open(Path(tmp) / CATALOG_FILE)
+            rows = catalog.query()
+            catalog.close()
+            assert len(rows) == 1
+            row = rows[0]
+            first_block = event.start_frame // block
+            expected_start = first.block_times[first_block] + (event.start_frame - first_block * block) / 48000
+            print(f"Event start {row['start_time'] - expected_start:+.4f}s off, {row['gap_frames']} gap frames inside")
+            # (within the real-time pacing jitter of the fake stream)
+            assert abs(row['start_time'] - expected_start) < 0.02
+            assert row['gap_frames'] == gap
+
+            # The black box recorded the gap as silence, so the event's position matches its time
+            _, saved = wavfile.read(str(Path(tmp) / row['file_path']))
+            recorded, _, missing = read_blackbox(CONFIG['BLACKBOX_DIR'], row['blackbox_frame'],
+                                                 row['blackbox_frame'] + len(saved) + gap)
+            assert missing == 0
+            split = 48000 - event.start_frame
+            assert np.array_equal(recorded[:split], saved[:split])
+            assert not recorded[split:split + gap].any()
+            assert np.array_equal(recorded[split + gap:], saved[split:])
+            # (the black box clock is read by its own thread, so allow a couple of blocks)
+            assert abs(position_at(CONFIG['BLACKBOX_DIR'], row['start_time']) - row['blackbox_frame']) < 2 * block
+
+            metrics = '\n'.join(logger.collect_metrics())
+            assert 'gunshot_stream_failures_total 2' in metrics
+            assert 'gunshot_stream_reopens_total 1' in metrics
+            assert f"gunshot_stream_gap_frames_total {gap}" in metrics
+            assert 'gunshot_stream_recovery_seconds_count 1' in metrics
+            logger.log_handler.stop_writer()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Stream recovery test passed!")
+    return True
+
+class UnderflowFlags(ReplayCallbackFlags):
+    """Callback status of a block the stream could not deliver in full"""
+    input_underflow = True
+
+    def __bool__(self):
+        return True
+
+    def __str__(self):
+        return "input underflow"
+
+def test_dropped_blocks_are_gaps():
+    """Blocks thrown away for their callback status are recorded as gaps, with or without the analysis thread"""
+    print("\nTesting dropped block gaps...")
+
+    saved_config = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG['LOG_FILE'] = str(Path(tmp) / 'gunshot_detection.log')
+            CONFIG['SPOOL_DIR'] = str(Path(tmp) / 'spool')
+            CONFIG['METRICS_FILE'] = None
+            block = CONFIG['BUFFER_SIZE']
+            audio = np.zeros((block, 2), dtype=np.float32)
+            for analysis_thread in (False, True):
+                CONFIG['ANALYSIS_THREAD'] = analysis_thread
+                logger = gunshot_logger.GunshotLogger(tmp, verify_mount=False)
+                for i in range(10):
+                    flags = UnderflowFlags() if i in (4, 5) else ReplayCallbackFlags()
+                    logger.audio_callback(audio, block, ReplayTimeInfo(0.0), flags)
+                logger.drain_block_ring(max_blocks=logger.block_ring.num_blocks)
+
+                assert logger.buffer.frames_written == 8 * block
+                assert len(logger.stream_gaps) == 1 and logger.stream_gaps[0] == (4 * block, 2 * block)
+                metrics = '\n'.join(logger.collect_metrics())
+                assert 'gunshot_stream_dropped_blocks_total 2' in metrics
+                assert f"gunshot_stream_gap_frames_total {2 * block}" in metrics
+                logger.log_handler.stop_writer()
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved_config)
+
+    print("Dropped block gap test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Replay Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_replay_session()
+    test2_passed = test_int16_matches_float32()
+    test3_passed = test_flac_output_is_lossless()
+    test4_passed = test_flac_streamed_event_grows()
+    test12_passed = test_encoder_pool_handoff()
+    test5_passed = test_replay_metrics()
+    test6_passed = test_adaptive_detector_rising_noise()
+    test7_passed = test_replay_arrival()
+    test8_passed = test_fast_start_checks()
+    test9_passed = test_config_hot_reload()
+    test10_passed = test_stream_recovery()
+    test11_passed = test_dropped_blocks_are_gaps()
+    print(f"Replay Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Sample Format Parity Test: {'PASSED' if test2_passed else 'FAILED'}")
+    print(f"FLAC Output Test: {'PASSED' if test3_passed else 'FAILED'}")
+    print(f"Streamed FLAC Test: {'PASSED' if test4_passed else 'FAILED'}")
+    print(f"Encoder Pool Test: {'PASSED' if test12_passed else 'FAILED'}")
+    print(f"Metrics Test: {'PASSED' if test5_passed else 'FAILED'}")
+    print(f"Adaptive Detector Test: {'PASSED' if test6_passed else 'FAILED'}")
+    print(f"Arrival Analysis Test: {'PASSED' if test7_passed else 'FAILED'}")
+    print(f"Fast Start Test: {'PASSED' if test8_passed else 'FAILED'}")
+    print(f"Config Hot Reload Test: {'PASSED' if test9_passed else 'FAILED'}")
+    print(f"Stream Recovery Test: {'PASSED' if test10_passed else 'FAILED'}")
+    print(f"Dropped Block Gap Test: {'PASSED' if test11_passed else 'FAILED'}")
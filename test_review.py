@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script to verify review sidecars and the sidecar-only review tool
+"""
+
+import io
+import tempfile
+import contextlib
+from pathlib import Path
+import numpy as np
+
+from gunshot_catalog import CATALOG_FILE, EventCatalog
+from gunshot_replay import replay
+from gunshot_review import (
+    PEAK_BUCKET, backfill, build_sidecar, print_event, print_timeline, read_sidecar, render_waveform,
+    sidecar_path, write_sidecar,
+)
+from test_replay import write_session
+
+def test_sidecar_roundtrip():
+    """Sidecars hold exact bucket peaks at every resolution and a usable spectrogram"""
+    print("Testing sidecar format...")
+
+    rng = np.random.default_rng(4)
+    frames = 48000 + 100
+    t = np.arange(frames) / 48000
+    audio = np.stack((0.5 * np.sin(2 * np.pi * 6000 * t), rng.standard_normal(frames) * 0.01), axis=1)
+    audio = audio.astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for samples in (audio, (audio * 32768).astype(np.int16)):
+            path = Path(tmp) / f"gunshot_001_{samples.dtype}.peaks"
+            size = write_sidecar(path, build_sidecar(samples, 48000))
+            sidecar = read_sidecar(path)
+            print(f"{samples.dtype}: {size} bytes for {samples.nbytes} bytes of audio, "
+                  f"levels {[bucket for bucket, _ in sidecar['levels']]}")
+            assert size < samples.nbytes / 20
+            assert sidecar['frames'] == frames and sidecar['channels'] == 2
+
+            # Finest level: exact min/max of every bucket, including the short last one
+            scale = 32768 if samples.dtype == np.int16 else 1
+            bucket, peaks = sidecar['levels'][0]
+            assert bucket == PEAK_BUCKET and len(peaks) == -(-frames // PEAK_BUCKET)
+            expected = np.clip(samples[-(frames % PEAK_BUCKET):].max(axis=0) / scale * 32768, -32768, 32767)
+            assert np.all(np.abs(peaks[-1, :, 1] - expected) <= 1)
+            # Coarser levels agree with the finer ones and end in a single bucket
+            for (_, fine), (_, coarse) in zip(sidecar['levels'], sidecar['levels'][1:]):
+                assert coarse[..., 1].max() == fine[..., 1].max()
+                assert coarse[..., 0].min() == fine[..., 0].min()
+            assert len(sidecar['levels'][-1][1]) == 1
+
+            # The 6kHz tone sits in band 6000 / (24000 / 64) = 16, at about -12 dBFS
+            # (a quarter of the 0.5 amplitude sine after mixing with the quiet channel)
+            levels = sidecar['spectrogram'].astype(np.float32) / 2 - 120
+            band = int(np.argmax(levels.mean(axis=0)))
+            assert band == 16
+            assert abs(levels[:, band].mean() - 20 * np.log10(0.25)) < 2
+
+    print("Sidecar format test passed!")
+    return True
+
+def test_review_from_sidecars():
+    """Saved events carry sidecars to USB, the review tool reads only them, and backfill recreates them"""
+    print("\nTesting review sidecars for saved events...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = Path(tmp) / 'session.wav'
+        write_session(session, [1.0, 1.3, 4.0, 8.0])
+        output_dir = Path(tmp) / 'out'
+        replay([session], output_dir)
+
+        catalog = EventCatalog()
+        catalog.open(output_dir / CATALOG_FILE)
+        rows = catalog.query()
+        catalog.close()
+        assert len(rows) == 3
+        live = {}
+        for row in rows:
+            path = sidecar_path(output_dir / row['file_path'])
+            live[path] = read_sidecar(path)
+            # The sidecar moved with the event, but the catalogued size is the audio file's
+            assert row['file_size'] == (output_dir / row['file_path']).stat().st_size
+        assert not list((output_dir / 'spool').iterdir())
+
+        # Rendering works without the audio files
+        moved = {}
+        for row in rows:
+            audio_path = output_dir / row['file_path']
+            moved[audio_path] = audio_path.rename(audio_path.with_suffix('.bak'))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            # Replay runs faster than real time, so trigger times are only ms apart; name order is save order
+            print_event(output_dir, min(rows, key=lambda row: row['file_path']), 60)
+            print_timeline(output_dir, rows, 60)
+        print(out.getvalue())
+        assert '█' in out.getvalue() and '(no sidecar)' not in out.getvalue()
+        assert '2 reports' in out.getvalue()
+        for audio_path, backup in moved.items():
+            backup.rename(audio_path)
+
+        # Backfill recreates missing sidecars from the files, matching the live ones
+        for path in live:
+            path.unlink()
+        written, failed = backfill(output_dir, workers=2)
+        assert (written, failed) == (3, 0)
+        assert backfill(output_dir, workers=2) == (0, 0)
+        for path, sidecar in live.items():
+            rebuilt = read_sidecar(path)
+            assert rebuilt['frames'] == sidecar['frames']
+            for (_, live_peaks), (_, rebuilt_peaks) in zip(sidecar['levels'], rebuilt['levels']):
+                assert np.abs(live_peaks.astype(np.int32) - rebuilt_peaks).max() <= 2
+            difference = np.abs(sidecar['spectrogram'].astype(np.int32) - rebuilt['spectrogram'])
+            assert np.percentile(difference, 99) <= 2
+            assert render_waveform(rebuilt, 40) == render_waveform(sidecar, 40)
+
+    print("Review sidecar test passed!")
+    return True
+
+if __name__ == "__main__":
+    print("Review Sidecar Test Suite")
+    print("=" * 50)
+
+    test1_passed = test_sidecar_roundtrip()
+    test2_passed = test_review_from_sidecars()
+    print(f"Sidecar Format Test: {'PASSED' if test1_passed else 'FAILED'}")
+    print(f"Review Sidecar Test: {'PASSED' if test2_passed else 'FAILED'}")